@@ -61,6 +61,31 @@ async function fetchWithAuth(url: string, options: RequestInit = {}) {
   return res.json();
 }
 
+// Live updates (server-sent events) read with fetch, since EventSource can't send the Authorization header
+async function listenForUpdates(onEvent: (type: string, data: any) => void, signal: AbortSignal) {
+  const token = localStorage.getItem("accessToken");
+  const res = await fetch("http://localhost:8000/api/auth/live/", {
+    headers: { Authorization: `Bearer ${token}` },
+    signal,
+  });
+  if (!res.ok || !res.body) return;
+
+  const reader = res.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) return;
+    buffer += value;
+    const events = buffer.split("\n\n");
+    buffer = events.pop() || "";
+    for (const event of events) {
+      const type = event.match(/^event: (.*)$/m)?.[1];
+      const data = event.match(/^data: (.*)$/m)?.[1];
+      if (type && data) onEvent(type, JSON.parse(data));
+    }
+  }
+}
+
 export default function Dashboard() {
   const [userData, setUserData] = useState(null);
   const [transactions, setTransactions] = useState<Transaction[]>([]);
@@ -69,6 +94,7 @@ export default function Dashboard() {
 
   // Define Transaction type
   type Transaction = {
+    id?: number;
     type: "sale" | "expense" | "revenue";
     amount: number;
     date?: string;
@@ -76,24 +102,44 @@ export default function Dashboard() {
 
   useEffect(() => {
     const token = localStorage.getItem("accessToken");
+    const controller = new AbortController();
+
+    const loadDashboard = () =>
+      // One request for the whole page: user, active subscription and latest transactions
+      fetchWithAuth("http://localhost:8000/api/auth/dashboard/?fields=user,subscription,transactions")
+        .then((data) => {
+          setUserData(data.user);
+          setTransactions(data.transactions);
+          setSubscription(data.subscription);
+        })
+        .catch((err) => console.error("Error fetching dashboard:", err));
 
     if (!token) {
       router.push("/login"); // Redirect if not logged in
     } else {
-      fetchWithAuth("http://localhost:8000/api/auth/api/protected/")
-        .then((data) => setUserData(data))
-        .catch((err) => console.error("Error fetching user data:", err));
-
-      fetchWithAuth("http://localhost:8000/api/auth/transactions/")
-        .then((data) => setTransactions(data))
-        .catch((err) => console.error("Error fetching transactions:", err));
-
-      fetchWithAuth("http://localhost:8000/api/auth/subscriptions/")
-        .then((data) => setSubscription(
-          data.subscriptions && data.subscriptions.length > 0 ? data.subscriptions[0] : null
-        ))
-        .catch((err) => console.error("Error fetching subscription:", err));
+      loadDashboard();
+      // Then keep it current from pushed changes instead of polling
+      listenForUpdates((type, data) => {
+        if (type === "transactions") {
+          if (data.truncated) {
+            loadDashboard(); // too many rows to send, reload instead
+            return;
+          }
+          const updated = new Map(data.updated.map((txn: any) => [txn.id, txn]));
+          setTransactions((current) => [
+            ...data.created,
+            ...current
+              .filter((txn: any) => !data.deleted.includes(txn.id))
+              .map((txn: any) => updated.get(txn.id) ?? txn), // edited rows replace the ones shown
+          ]);
+        } else if (type === "subscription") {
+          setSubscription(data.subscription);
+        } else if (type === "resync") {
+          loadDashboard();
+        }
+      }, controller.signal).catch((err) => console.error("Live updates stopped:", err));
     }
+    return () => controller.abort();
   }, []);
 
   const handleUpgrade = async (newPriceId: string) => {
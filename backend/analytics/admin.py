@@ -1,4 +1,33 @@
 from django.contrib import admin
-from .models import Transaction
+from django.db import transaction
 
-admin.site.register(Transaction)
\ No newline at end of file
+from . import rollups
+from .models import Transaction, MonthlyRollup
+
+
+@admin.register(Transaction)
+class TransactionAdmin(admin.ModelAdmin):
+    """ Edits made here update the rollups the same way the API views do """
+
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            if change:
+                old = Transaction.objects.get(pk=obj.pk)
+                super().save_model(request, obj, form, change)
+                rollups.record_updated(rollups.rollup_key(old), old.amount, obj)
+            else:
+                super().save_model(request, obj, form, change)
+                rollups.record_created(obj)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            rollups.record_deleted(obj)
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic(): # the "delete selected" action
+            rollups.apply_deltas(rollups.deltas_for(queryset, sign=-1))
+            super().delete_queryset(request, queryset)
+
+
+admin.site.register(MonthlyRollup)
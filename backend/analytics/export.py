@@ -0,0 +1,52 @@
+import csv
+import json
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+COLUMNS = ("id", "date", "amount", "type", "category", "description")
+
+
+class Echo:
+    """ File-like object whose write() just hands the line back, so csv.writer can feed a generator """
+    def write(self, value):
+        return value
+
+
+def _format_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for pk, date, amount, txn_type, category, description in rows:
+        yield writer.writerow((pk, date.isoformat(), amount, txn_type, category, description or ""))
+
+
+def _format_ndjson(rows):
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    for pk, date, amount, txn_type, category, description in rows:
+        yield dumps({
+            "id": pk,
+            "date": date.isoformat(),
+            "amount": str(amount),
+            "type": txn_type,
+            "category": category,
+            "description": description,
+        }) + "\n"
+
+
+def stream(queryset, fmt, chunk_size=2000):
+    """
+    Yields the export in pieces of roughly `chunk_size` rows. Rows come from a server-side cursor as plain
+    tuples, so memory use doesn't depend on how many transactions the user has.
+    """
+    rows = queryset.order_by("date", "id").values_list(*COLUMNS).iterator(chunk_size=chunk_size)
+    formatter = _format_csv if fmt == "csv" else _format_ndjson
+
+    buffer = []
+    for line in formatter(rows):
+        buffer.append(line)
+        if len(buffer) >= chunk_size:
+            yield "".join(buffer)
+            buffer = []
+    if buffer:
+        yield "".join(buffer)
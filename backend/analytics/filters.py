@@ -0,0 +1,47 @@
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .models import Transaction
+
+TRANSACTION_TYPES = {value for value, _ in Transaction.TRANSACTION_TYPES}
+
+
+def _parse_moment(name, value, end=False):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({name: "Use YYYY-MM-DD or an ISO 8601 datetime."})
+        # a bare date as the upper bound includes that whole day
+        moment = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def filter_transactions(queryset, params):
+    """ Applies the ?type=&category=&date_from=&date_to= filters shared by the list and export endpoints """
+    txn_type = params.get("type")
+    if txn_type:
+        if txn_type not in TRANSACTION_TYPES:
+            raise ValidationError({"type": f"Must be one of: {', '.join(sorted(TRANSACTION_TYPES))}."})
+        queryset = queryset.filter(type=txn_type)
+
+    category = params.get("category")
+    if category:
+        queryset = queryset.filter(category=category)
+
+    date_from = params.get("date_from")
+    if date_from:
+        queryset = queryset.filter(date__gte=_parse_moment("date_from", date_from))
+
+    date_to = params.get("date_to")
+    if date_to:
+        end = _parse_moment("date_to", date_to, end=True)
+        # bare dates are exclusive of the following midnight, full datetimes are inclusive
+        queryset = queryset.filter(date__lt=end) if parse_datetime(date_to) is None else queryset.filter(date__lte=end)
+
+    return queryset
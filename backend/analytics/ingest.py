@@ -0,0 +1,182 @@
+import csv
+import json
+from datetime import datetime, time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from dashboard import live
+
+from . import rollups
+from .models import Transaction
+
+FORMATS = ("csv", "ndjson")
+TRANSACTION_TYPES = {value for value, _ in Transaction.TRANSACTION_TYPES}
+CATEGORY_MAX_LENGTH = Transaction._meta.get_field("category").max_length
+MAX_AMOUNT = Decimal("99999999.99") # max_digits=10, decimal_places=2
+MAX_REPORTED_ERRORS = 1000
+
+
+def decode_lines(lines, bad_lines):
+    """ Decodes raw byte lines one by one; lines that aren't UTF-8 are decoded lossily and their numbers added to `bad_lines` """
+    for number, line in enumerate(lines, start=1):
+        try:
+            yield line.decode("utf-8-sig" if number == 1 else "utf-8")
+        except UnicodeDecodeError:
+            bad_lines.add(number)
+            yield line.decode("utf-8", errors="replace")
+
+
+def iter_records(lines, fmt):
+    """
+    Yields (row number, dict) pairs from an iterable of raw byte lines; row number 1 is the first data row.
+    Rows that can't be read (not UTF-8, broken CSV, not a JSON object) come back as {"__invalid__": reason}.
+    """
+    bad_lines = set()
+    text = decode_lines(lines, bad_lines)
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        number = 0
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as error: # the reader carries on with the next line
+                row = {"__invalid__": f"Row can't be read as CSV: {error}."}
+            number += 1
+            undecodable = {line for line in bad_lines if 1 < line <= reader.line_num} # line 1 is the header; a row can span lines
+            if undecodable:
+                bad_lines -= undecodable
+                row = {"__invalid__": "Row is not valid UTF-8."}
+            yield number, row
+        return
+
+    for number, line in enumerate(text, start=1):
+        if number in bad_lines:
+            bad_lines.discard(number)
+            yield number, {"__invalid__": "Row is not valid UTF-8."}
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield number, record if isinstance(record, dict) else {"__invalid__": "Row is not a JSON object."}
+
+
+def text_value(record, name, errors):
+    """ The stripped string in record[name] ("" if missing); records an error if it isn't a string """
+    value = record.get(name)
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        errors[name] = "Must be a string."
+        return ""
+    return value.strip()
+
+
+def parse_record(record, user):
+    """ Returns (Transaction, None) for a valid record or (None, errors) """
+    if record.get("__invalid__"):
+        return None, {"non_field_errors": record["__invalid__"]}
+
+    errors = {}
+    try:
+        amount = Decimal(str(record.get("amount", "")).strip())
+        if not amount.is_finite() or abs(amount) > MAX_AMOUNT or amount.as_tuple().exponent < -2:
+            raise InvalidOperation
+    except (InvalidOperation, ValueError):
+        errors["amount"] = "A valid number with at most 2 decimal places is required."
+
+    txn_type = text_value(record, "type", errors)
+    if "type" not in errors and txn_type not in TRANSACTION_TYPES:
+        errors["type"] = f"Must be one of: {', '.join(sorted(TRANSACTION_TYPES))}."
+
+    category = text_value(record, "category", errors)
+    if "category" in errors:
+        pass
+    elif not category:
+        errors["category"] = "This field is required."
+    elif len(category) > CATEGORY_MAX_LENGTH:
+        errors["category"] = f"Ensure this field has no more than {CATEGORY_MAX_LENGTH} characters."
+
+    description = text_value(record, "description", errors)
+
+    date = timezone.now()
+    raw_date = text_value(record, "date", errors)
+    if raw_date:
+        try:
+            date = parse_datetime(raw_date) or parse_date(raw_date)
+        except ValueError:
+            date = None
+        if date is None:
+            errors["date"] = "Use YYYY-MM-DD or an ISO 8601 datetime."
+        elif not hasattr(date, "hour"):
+            date = timezone.make_aware(datetime.combine(date, time.min))
+        elif timezone.is_naive(date):
+            date = timezone.make_aware(date)
+
+    if errors:
+        return None, errors
+
+    return Transaction(
+        user=user,
+        amount=amount,
+        type=txn_type,
+        category=category,
+        description=description or None,
+        date=date,
+    ), None
+
+
+def ingest(user, lines, fmt, chunk_size=5000, batch_size=1000):
+    """
+    Validates and inserts records chunk by chunk. Each chunk is written with bulk_create and its rollup
+    deltas are applied once, in a single transaction, so memory stays bounded by the chunk size.
+    """
+    created = 0
+    failed = 0
+    errors = []
+    pushed = [] # for the live dashboard, at most live.MAX_ROWS + 1 of them
+    records = iter_records(lines, fmt)
+    months = set()
+
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+
+        valid = []
+        for number, record in chunk:
+            txn, row_errors = parse_record(record, user)
+            if row_errors:
+                failed += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"row": number, "errors": row_errors})
+                continue
+            valid.append(txn)
+
+        if valid:
+            with transaction.atomic():
+                Transaction.objects.bulk_create(valid, batch_size=batch_size)
+                deltas = rollups.deltas_for(valid)
+                rollups.apply_deltas(deltas)
+            created += len(valid)
+            months.update(month for _, month, _, _ in deltas)
+            pushed.extend(valid[:live.MAX_ROWS + 1 - len(pushed)])
+
+    if created:
+        live.transactions_changed(user.pk, created=pushed, created_count=created, months=months)
+
+    return {
+        "created": created,
+        "failed": failed,
+        "errors": errors,
+        "errors_truncated": failed > len(errors),
+    }
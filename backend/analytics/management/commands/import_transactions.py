@@ -0,0 +1,45 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics import ingest
+
+MAX_ERRORS_SHOWN = 50
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports a CSV or NDJSON file of transactions for one user, like POST transactions/import/ but without "
+        "the request size limit. Rows are committed chunk by chunk; invalid rows are skipped and reported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or NDJSON file.")
+        parser.add_argument("--user", required=True, help="Id or email of the user the transactions belong to.")
+        parser.add_argument("--format", choices=ingest.FORMATS, help="Defaults to the file extension (csv unless .ndjson / .jsonl).")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        lookup = {"pk": options["user"]} if options["user"].isdigit() else {"email": options["user"]}
+        try:
+            user = User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['user']}.")
+
+        path = options["path"]
+        file_format = options["format"] or ("ndjson" if path.lower().endswith((".ndjson", ".jsonl")) else "csv")
+        started = time.perf_counter()
+        try:
+            with open(path, "rb") as f:
+                result = ingest.ingest(user, f, file_format)
+        except OSError as e:
+            raise CommandError(f"Can't read {path}: {e}")
+
+        for error in result["errors"][:MAX_ERRORS_SHOWN]:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        if result["failed"] > MAX_ERRORS_SHOWN:
+            self.stderr.write(f"... and {result['failed'] - MAX_ERRORS_SHOWN} more")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['created']} transactions ({result['failed']} rows skipped) in {time.perf_counter() - started:.1f}s."
+        ))
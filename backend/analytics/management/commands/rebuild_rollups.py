@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from analytics.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = "Backfills / rebuilds the monthly transaction rollups used by the insights endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="users",
+                            help="Only rebuild rollups for this user id (can be repeated).")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        created = rebuild(user_ids=options["users"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} rollup rows."))
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from config import replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the primary SQLite database into the SQLite replicas (DATABASE_REPLICA_URLS), so the replica "
+        "routing can be tried locally. With --every it keeps copying, which behaves like a lagging replica."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--every", type=float, help="Copy again every this many seconds until interrupted.")
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES["default"]
+        targets = [settings.DATABASES[alias]["NAME"] for alias in replicas.REPLICAS]
+        if primary["ENGINE"] != "django.db.backends.sqlite3" or not targets:
+            raise CommandError("Needs a SQLite primary and at least one replica in DATABASE_REPLICA_URLS.")
+        if any(settings.DATABASES[alias]["ENGINE"] != primary["ENGINE"] for alias in replicas.REPLICAS):
+            raise CommandError("All replicas must be SQLite files too.")
+
+        while True:
+            for target in targets:
+                replicas.copy_sqlite(primary["NAME"], target)
+            self.stdout.write(self.style.SUCCESS(f"Copied {primary['NAME']} to {', '.join(map(str, targets))}."))
+            if not options["every"]:
+                return
+            time.sleep(options["every"])
@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+
+def backfill_rollups(apps, schema_editor):
+    """ Same as rollups.rebuild(), with the historical models: the totals of the transactions made before 0002 """
+    Transaction = apps.get_model("analytics", "Transaction")
+    MonthlyRollup = apps.get_model("analytics", "MonthlyRollup")
+    grouped = (
+        Transaction.objects
+        .annotate(month=TruncMonth("date"))
+        .values("user_id", "month", "type", "category")
+        .annotate(total=Sum("amount"), count=Count("id"))
+        .order_by()
+    )
+    MonthlyRollup.objects.all().delete()
+    batch = []
+    for row in grouped.iterator(chunk_size=1000):
+        month = timezone.localtime(row["month"]) if timezone.is_aware(row["month"]) else row["month"]
+        batch.append(MonthlyRollup(
+            user_id=row["user_id"], month=month.date().replace(day=1), type=row["type"], category=row["category"],
+            total=row["total"], count=row["count"],
+        ))
+        if len(batch) >= 1000:
+            MonthlyRollup.objects.bulk_create(batch)
+            batch = []
+    MonthlyRollup.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_alter_transaction_date'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
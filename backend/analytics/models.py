@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 class Transaction(models.Model):
     TRANSACTION_TYPES = (
@@ -12,7 +13,29 @@ class Transaction(models.Model):
     type = models.CharField(max_length=10, choices=TRANSACTION_TYPES)
     category = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
-    date = models.DateTimeField(auto_now_add=True)
+    date = models.DateTimeField(default=timezone.now) # set explicitly by bulk imports, read-only through the API
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "date", "id"], name="transaction_user_date_id"), # keyset pagination
+        ]
 
     def __str__(self):
         return f"{self.type.capitalize()} - {self.amount} by {self.user.email}"
+
+class MonthlyRollup(models.Model):
+    """ Running totals per (user, month, type, category), kept in sync by analytics.rollups """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    month = models.DateField() # always the first day of the month
+    type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    category = models.CharField(max_length=100)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "month", "type", "category"], name="unique_monthly_rollup"),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.type}/{self.category}: {self.total} ({self.count})"
@@ -0,0 +1,134 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import MonthlyRollup, Transaction
+
+
+def month_start(value):
+    """ Returns the first day of the month `value` falls in (in the current time zone) """
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date().replace(day=1)
+
+
+def rollup_key(txn):
+    return (txn.user_id, month_start(txn.date), txn.type, txn.category)
+
+
+def month_insights(user, month):
+    """ Expense and revenue totals and the expense breakdown by category (largest first) for `month` """
+    rows = MonthlyRollup.objects.filter(user=user, month=month).values_list("type", "category", "total")
+
+    total_expenses = 0
+    total_revenue = 0
+    category_breakdown = {}
+    for txn_type, category, total in rows:
+        if txn_type == "expense":
+            total_expenses += total
+            category_breakdown[category] = total
+        elif txn_type == "revenue":
+            total_revenue += total
+
+    category_breakdown = dict(sorted(category_breakdown.items(), key=lambda item: item[1], reverse=True))
+    return {
+        "total_expenses": total_expenses,
+        "total_revenue": total_revenue,
+        "top_expense_category": next(iter(category_breakdown), "None"),
+        "category_breakdown": category_breakdown,
+    }
+
+
+def apply_deltas(deltas):
+    """
+    Applies {(user_id, month, type, category): (amount, count)} to the rollup table.
+    Must run inside the same transaction.atomic() block as the write that produced the deltas.
+    """
+    emptied = []
+    for key in sorted(deltas): # fixed order so concurrent writers lock rows the same way
+        amount, count = deltas[key]
+        if not amount and not count:
+            continue
+        user_id, month, txn_type, category = key
+        rows = MonthlyRollup.objects.filter(user_id=user_id, month=month, type=txn_type, category=category)
+        if rows.update(total=F("total") + amount, count=F("count") + count):
+            if count < 0:
+                emptied.append(key)
+            continue
+        try:
+            with transaction.atomic(): # savepoint, so a lost insert race doesn't break the outer transaction
+                MonthlyRollup.objects.create(
+                    user_id=user_id, month=month, type=txn_type, category=category, total=amount, count=count
+                )
+        except IntegrityError:
+            rows.update(total=F("total") + amount, count=F("count") + count)
+
+    for user_id, month, txn_type, category in emptied:
+        MonthlyRollup.objects.filter(
+            user_id=user_id, month=month, type=txn_type, category=category, count__lte=0
+        ).delete()
+
+
+def deltas_for(transactions, sign=1):
+    deltas = defaultdict(lambda: (Decimal("0"), 0))
+    for txn in transactions:
+        amount, count = deltas[rollup_key(txn)]
+        deltas[rollup_key(txn)] = (amount + sign * txn.amount, count + sign)
+    return deltas
+
+
+def record_created(txn):
+    apply_deltas(deltas_for([txn]))
+
+
+def record_deleted(txn):
+    apply_deltas(deltas_for([txn], sign=-1))
+
+
+def record_updated(old_key, old_amount, txn):
+    deltas = deltas_for([txn])
+    amount, count = deltas[old_key]
+    deltas[old_key] = (amount - old_amount, count - 1)
+    apply_deltas(deltas)
+
+
+def rebuild(user_ids=None, batch_size=1000):
+    """ Recomputes the rollup table from raw transactions with a single grouped query """
+    transactions = Transaction.objects.all()
+    rollups = MonthlyRollup.objects.all()
+    if user_ids:
+        transactions = transactions.filter(user_id__in=user_ids)
+        rollups = rollups.filter(user_id__in=user_ids)
+
+    grouped = (
+        transactions
+        .annotate(month=TruncMonth("date"))
+        .values("user_id", "month", "type", "category")
+        .annotate(total=Sum("amount"), count=Count("id"))
+        .order_by()
+    )
+
+    created = 0
+    with transaction.atomic():
+        rollups.delete()
+        batch = []
+        for row in grouped.iterator(chunk_size=batch_size):
+            batch.append(MonthlyRollup(
+                user_id=row["user_id"],
+                month=month_start(row["month"]),
+                type=row["type"],
+                category=row["category"],
+                total=row["total"],
+                count=row["count"],
+            ))
+            if len(batch) >= batch_size:
+                MonthlyRollup.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        MonthlyRollup.objects.bulk_create(batch)
+        created += len(batch)
+    return created
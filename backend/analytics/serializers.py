@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from config.renderers import RowEncoder
 from .models import Transaction
 
 class TransactionSerializer(serializers.ModelSerializer):
@@ -6,3 +7,6 @@ class TransactionSerializer(serializers.ModelSerializer):
         model = Transaction
         fields = ['id', 'user', 'amount', 'type', 'category', 'description', 'date']
         read_only_fields = ['id', 'user', 'date']
+
+# TransactionSerializer's output straight from values_list() rows, for the long lists (see config/renderers.py)
+transaction_rows = RowEncoder(TransactionSerializer)
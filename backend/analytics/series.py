@@ -0,0 +1,110 @@
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncWeek
+from django.utils import timezone
+
+from .models import MonthlyRollup, Transaction
+from .rollups import month_start
+
+GRANULARITIES = ("month", "week", "day")
+MIN_YEAR, MAX_YEAR = 2, 9998
+MAX_BUCKETS = {"day": 366, "week": 260, "month": 120} # per request, so a huge range can't build a huge response
+
+TRUNC_FUNCTIONS = {
+    "week": TruncWeek,
+    "day": TruncDay,
+}
+
+
+def parse_bound(value, end=False):
+    """ Accepts YYYY-MM or YYYY-MM-DD. A bare month used as `to` covers the whole month. """
+    try:
+        day = datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        day = datetime.strptime(value, "%Y-%m").date()
+        if end:
+            day = next_month(day) - timedelta(days=1)
+    if not MIN_YEAR <= day.year <= MAX_YEAR:
+        raise ValueError(value) # the bucket arithmetic steps past the range, so date.min / date.max would overflow
+    return day
+
+
+def next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def bucket_start(day, granularity):
+    if granularity == "month":
+        return day.replace(day=1)
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def bucket_count(start, end, granularity):
+    """ How many buckets buckets(start, end, granularity) yields, without walking them """
+    first = bucket_start(start, granularity)
+    if granularity == "month":
+        return (end.year - first.year) * 12 + end.month - first.month + 1
+    if granularity == "week":
+        return (end - first).days // 7 + 1
+    return (end - first).days + 1
+
+
+def buckets(start, end, granularity):
+    current = bucket_start(start, granularity)
+    while current <= end:
+        yield current
+        if granularity == "month":
+            current = next_month(current)
+        elif granularity == "week":
+            current += timedelta(weeks=1)
+        else:
+            current += timedelta(days=1)
+
+
+def grouped_totals(user, start, end, granularity):
+    """ One grouped query returning (bucket, type, category, total) rows """
+    if granularity == "month":
+        # Month buckets are exactly what the rollup table stores
+        return (
+            MonthlyRollup.objects
+            .filter(user=user, month__gte=start.replace(day=1), month__lte=end)
+            .values_list("month", "type", "category", "total")
+        )
+
+    tz = timezone.get_current_timezone()
+    start_dt = timezone.make_aware(datetime.combine(start, time.min), tz)
+    end_dt = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz)
+    return (
+        Transaction.objects
+        .filter(user=user, date__gte=start_dt, date__lt=end_dt)
+        .annotate(bucket=TRUNC_FUNCTIONS[granularity]("date"))
+        .values("bucket", "type", "category")
+        .annotate(total=Sum("amount"))
+        .order_by()
+        .values_list("bucket", "type", "category", "total")
+    )
+
+
+def build_series(user, start, end, granularity):
+    per_bucket = defaultdict(lambda: defaultdict(dict))
+    for bucket, txn_type, category, total in grouped_totals(user, start, end, granularity):
+        if isinstance(bucket, datetime):
+            bucket = month_start(bucket) if granularity == "month" else timezone.localtime(bucket).date()
+        per_bucket[bucket][txn_type][category] = total
+
+    series = []
+    for bucket in buckets(start, end, granularity):
+        breakdown = per_bucket.get(bucket, {})
+        totals = {txn_type: sum(categories.values()) for txn_type, categories in breakdown.items()}
+        series.append({
+            "period": bucket.isoformat(),
+            "total_expenses": totals.get("expense", 0),
+            "total_revenue": totals.get("revenue", 0),
+            "totals": totals,
+            "category_breakdown": {txn_type: dict(categories) for txn_type, categories in breakdown.items()},
+        })
+    return series
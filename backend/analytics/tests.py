@@ -1,3 +1,260 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from config.renderers import RowEncoder, dumps
+
+from . import export, rollups
+from .pagination import TransactionCursorPagination
+from .models import MonthlyRollup, Transaction
+from .serializers import TransactionSerializer, transaction_rows
+
+
+class InsightsSeriesTests(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="series", email="series@example.com", password="pw-12345678")
+        self.client.force_authenticate(self.user)
+
+    def test_range_within_the_cap(self):
+        response = self.client.get("/api/auth/insights/?from=2024-01&to=2024-12&granularity=day")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["series"]), 366)
+
+    def test_range_above_the_cap_is_rejected(self):
+        for query in ("from=1000-01&to=9000-12&granularity=day", "from=2000-01&to=2010-02&granularity=month",
+                      "from=2020-01&to=2025-12&granularity=week"):
+            response = self.client.get(f"/api/auth/insights/?{query}")
+            self.assertEqual(response.status_code, 400, query)
+
+    def test_dates_at_the_ends_of_the_calendar_are_rejected(self):
+        for query in ("from=9999-12-01&to=9999-12-31&granularity=day", "from=9999-12&to=9999-12",
+                      "from=0001-01-01&to=0001-01-07&granularity=week"):
+            response = self.client.get(f"/api/auth/insights/?{query}")
+            self.assertEqual(response.status_code, 400, query)
+        response = self.client.get("/api/auth/insights/?from=9998-12-20&to=9998-12-31&granularity=week")
+        self.assertEqual(response.status_code, 200)
+
+
+class ImportRowErrorTests(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="importer", email="importer@example.com", password="pw-12345678")
+        self.client.force_authenticate(self.user)
+
+    def test_non_string_fields_are_row_errors(self):
+        body = b'{"amount": "5", "type": 1, "category": ["food"], "date": 20240101}\n'
+        response = self.client.post("/api/auth/transactions/import/", body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 400)
+        row = response.data["errors"][0]
+        self.assertEqual(row["row"], 1)
+        self.assertEqual(set(row["errors"]), {"type", "category", "date"})
+
+    def test_unreadable_lines_are_row_errors(self):
+        body = b"amount,type,category\n5,expense,caf\xe9\n7,revenue,salary\n"
+        response = self.client.post("/api/auth/transactions/import/", body, content_type="text/csv")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual(response.data["errors"], [{"row": 1, "errors": {"non_field_errors": "Row is not valid UTF-8."}}])
+
+
+    @override_settings(TRANSACTION_IMPORT_MAX_BYTES=64)
+    def test_large_bodies_are_refused(self):
+        body = b"amount,type,category\n" + b"5,expense,Rent\n" * 10
+        response = self.client.post("/api/auth/transactions/import/", body, content_type="text/csv")
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_command_imports_any_size(self):
+        with tempfile.NamedTemporaryFile("wb", suffix=".csv", delete=False) as f:
+            f.write(b"amount,type,category\n" + b"5,expense,Rent\n" * 10 + b"x,expense,Rent\n")
+        self.addCleanup(os.remove, f.name)
+        out, err = StringIO(), StringIO()
+        call_command("import_transactions", f.name, user=self.user.email, stdout=out, stderr=err)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 10)
+        self.assertIn("row 11", err.getvalue())
+
+class RollupMaintenanceTests(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="rollups", email="rollups@example.com", password="pw-12345678")
+        self.client.force_authenticate(self.user)
+
+    def rollups(self):
+        return {(row.type, row.category): (row.total, row.count) for row in MonthlyRollup.objects.filter(user=self.user)}
+
+    def test_create_update_delete(self):
+        first = self.client.post("/api/auth/transactions/", {"amount": "10.00", "type": "expense", "category": "Rent"}).data
+        self.client.post("/api/auth/transactions/", {"amount": "2.50", "type": "expense", "category": "Rent"})
+        self.assertEqual(self.rollups(), {("expense", "Rent"): (Decimal("12.50"), 2)})
+
+        self.client.patch(f"/api/auth/transactions/{first['id']}/", {"amount": "4.00", "category": "Food"})
+        self.assertEqual(self.rollups(), {("expense", "Rent"): (Decimal("2.50"), 1), ("expense", "Food"): (Decimal("4.00"), 1)})
+
+        self.client.delete(f"/api/auth/transactions/{first['id']}/")
+        self.assertEqual(self.rollups(), {("expense", "Rent"): (Decimal("2.50"), 1)})
+
+
+class RollupAdminAndBackfillTests(TestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(username="root", email="root@example.com", password="pw-12345678")
+        self.client.force_login(self.admin)
+        self.txn = Transaction.objects.create(user=self.admin, amount=Decimal("10.00"), type="expense", category="Rent",
+                                              date=datetime(2024, 5, 3, tzinfo=dt_timezone.utc))
+        rollups.record_created(self.txn)
+
+    def rollups(self):
+        return {(row.month, row.category): (row.total, row.count) for row in MonthlyRollup.objects.all()}
+
+    def test_admin_edits_update_the_rollups(self):
+        response = self.client.post(f"/admin/analytics/transaction/{self.txn.pk}/change/", {
+            "user": self.admin.pk, "amount": "7.00", "type": "expense", "category": "Food", "description": "",
+            "date_0": "2024-06-01", "date_1": "12:00:00",
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.rollups(), {(date(2024, 6, 1), "Food"): (Decimal("7.00"), 1)})
+
+        self.client.post("/admin/analytics/transaction/", {"action": "delete_selected", "_selected_action": [self.txn.pk], "post": "yes"})
+        self.assertEqual(self.rollups(), {})
+
+    def test_migration_backfills_existing_transactions(self):
+        MonthlyRollup.objects.all().delete()
+        Transaction.objects.create(user=self.admin, amount=Decimal("2.50"), type="expense", category="Rent",
+                                   date=datetime(2024, 5, 30, tzinfo=dt_timezone.utc))
+        backfill = import_module("analytics.migrations.0005_backfill_monthly_rollups").backfill_rollups
+        backfill(django_apps, None)
+        self.assertEqual(self.rollups(), {(date(2024, 5, 1), "Rent"): (Decimal("12.50"), 2)})
+
+
+class CursorPaginationTests(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="pages", email="pages@example.com", password="pw-12345678")
+        self.client.force_authenticate(self.user)
+        start = timezone.now().replace(microsecond=0)
+        # pairs of rows share a date, so the id has to break the ties
+        Transaction.objects.bulk_create([
+            Transaction(user=self.user, amount=i, type="expense", category="Rent", date=start - timedelta(days=i // 2))
+            for i in range(7)
+        ])
+        self.expected = list(Transaction.objects.filter(user=self.user).order_by("-date", "-id").values_list("id", flat=True))
+
+    def test_forward_and_back(self):
+        pages, url = [], "/api/auth/transactions/?page_size=3"
+        while url:
+            data = self.client.get(url).json()
+            pages.append(data)
+            url = data["next"]
+        self.assertEqual([row["id"] for page in pages for row in page["results"]], self.expected)
+        self.assertEqual([len(page["results"]) for page in pages], [3, 3, 1])
+
+        backwards, url = [], pages[-1]["previous"]
+        while url:
+            data = self.client.get(url).json()
+            backwards.insert(0, [row["id"] for row in data["results"]])
+            url = data["previous"]
+        self.assertEqual(backwards, [self.expected[:3], self.expected[3:6]])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/api/auth/transactions/?cursor=not-a-cursor").status_code, 404)
+
+    def test_rows_added_while_paging_are_not_repeated(self):
+        first = self.client.get("/api/auth/transactions/?page_size=3").json()
+        # newer rows land in front of the cursor, which an offset would have shifted into the next page
+        Transaction.objects.bulk_create([Transaction(user=self.user, amount=1, type="expense", category="Rent") for _ in range(2)])
+        second = self.client.get(first["next"]).json()
+        self.assertEqual([row["id"] for row in second["results"]], self.expected[3:6])
+
+    def test_page_size_is_capped(self):
+        pagination = TransactionCursorPagination()
+        self.assertEqual(pagination.get_page_size(Request(APIRequestFactory().get("/", {"page_size": 10_000}))), pagination.max_page_size)
+        self.assertEqual(pagination.get_page_size(Request(APIRequestFactory().get("/", {"page_size": "x"}))), pagination.page_size)
+
+
+class RowEncoderTests(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="rows", email="rows@example.com", password="pw-12345678")
+        Transaction.objects.bulk_create([
+            Transaction(user=self.user, amount=Decimal("1234.5"), type="expense", category="Rent", description="March",
+                        date=datetime(2024, 3, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc)),
+            Transaction(user=self.user, amount=Decimal("-0.01"), type="sale", category="Café", description=None,
+                        date=datetime(2024, 12, 31, 23, 59, tzinfo=dt_timezone.utc)),
+        ])
+
+    def assert_same_as_serializer(self):
+        queryset = Transaction.objects.filter(user=self.user).order_by("id")
+        expected = TransactionSerializer(queryset, many=True).data
+        rows = transaction_rows.many(queryset.values_list(*transaction_rows.columns))
+        self.assertEqual(rows, [dict(item) for item in expected])
+        self.assertEqual(dumps(rows), JSONRenderer().render(expected))
+
+    def test_matches_serializer(self):
+        self.assert_same_as_serializer()
+
+    def test_matches_serializer_in_another_time_zone(self):
+        with timezone.override("America/New_York"):
+            self.assert_same_as_serializer()
+
+    def test_field_subset(self):
+        encoder = RowEncoder(TransactionSerializer, fields={"description", "amount"})
+        self.assertEqual(encoder.fields, ("amount", "description")) # serializer order, not the caller's
+        rows = encoder.many(Transaction.objects.order_by("id").values_list(*encoder.columns))
+        self.assertEqual(rows, [{"amount": "1234.50", "description": "March"}, {"amount": "-0.01", "description": None}])
+
+    def test_fields_without_a_column_are_refused(self):
+        class Computed(serializers.ModelSerializer):
+            label = serializers.SerializerMethodField()
+
+            class Meta:
+                model = Transaction
+                fields = ["id", "label"]
+
+        with self.assertRaises(ValueError):
+            RowEncoder(Computed)
+        self.assertEqual(RowEncoder(Computed, fields={"id"}).columns, ("id",))
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="export", email="export@example.com", password="pw-12345678")
+        other = get_user_model().objects.create_user(username="other", email="other@example.com", password="pw-12345678")
+        self.client.force_authenticate(self.user)
+        Transaction.objects.bulk_create([
+            Transaction(user=self.user, amount=Decimal("5.00"), type="expense", category="Rent", description='Says "hi", twice',
+                        date=datetime(2024, 1, 2, tzinfo=dt_timezone.utc)),
+            Transaction(user=self.user, amount=Decimal("7.25"), type="revenue", category="Salary",
+                        date=datetime(2024, 1, 1, tzinfo=dt_timezone.utc)),
+            Transaction(user=other, amount=Decimal("1.00"), type="expense", category="Rent"),
+        ])
+
+    def body(self, response):
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_is_streamed_oldest_first(self):
+        response = self.client.get("/api/auth/transactions/export/?file_format=csv")
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(StringIO(self.body(response))))
+        self.assertEqual(rows[0], ["id", "date", "amount", "type", "category", "description"])
+        self.assertEqual([row[4] for row in rows[1:]], ["Salary", "Rent"])
+        self.assertEqual(rows[2][5], 'Says "hi", twice')
+
+    def test_ndjson_with_filters(self):
+        response = self.client.get("/api/auth/transactions/export/?file_format=ndjson&type=expense")
+        records = [json.loads(line) for line in self.body(response).splitlines()]
+        self.assertEqual(records, [{"id": records[0]["id"], "date": "2024-01-02T00:00:00+00:00", "amount": "5.00",
+                                    "type": "expense", "category": "Rent", "description": 'Says "hi", twice'}])
+
+    def test_pieces_are_chunked(self):
+        pieces = list(export.stream(Transaction.objects.filter(user=self.user), "csv", chunk_size=1))
+        self.assertEqual(len(pieces), 3) # the header and one per row
@@ -1,8 +1,10 @@
 from django.urls import path
-from .views import TransactionListCreateView, TransactionDetailView, InsightsView
+from .views import TransactionListCreateView, TransactionDetailView, TransactionImportView, TransactionExportView, InsightsView
 
 urlpatterns = [
     path('transactions/', TransactionListCreateView.as_view(), name='transaction-list-create'),
+    path('transactions/import/', TransactionImportView.as_view(), name='transaction-import'),
+    path('transactions/export/', TransactionExportView.as_view(), name='transaction-export'),
     path('transactions/<int:pk>/', TransactionDetailView.as_view(), name='transaction-detail'),
     path('insights/', InsightsView.as_view(), name='insights'),
 ]
\ No newline at end of file
@@ -1,19 +1,47 @@
 from rest_framework import generics, permissions
+from rest_framework.views import APIView
+from rest_framework.parsers import MultiPartParser
 from .models import Transaction
-from .serializers import TransactionSerializer
+from .serializers import TransactionSerializer, transaction_rows
+from .pagination import TransactionCursorPagination
+from .filters import filter_transactions
+from . import export, ingest, rollups, series
+from dashboard import live
+from config.replicas import ReplicaReadMixin
+from config.sqlite import writes
 from rest_framework.response import Response
-from django.db.models import Sum
+from django.conf import settings
+from django.db import router, transaction
+from django.http import StreamingHttpResponse
 from datetime import datetime
 
-class TransactionListCreateView(generics.ListCreateAPIView):
+class TransactionListCreateView(ReplicaReadMixin, generics.ListCreateAPIView):
     serializer_class = TransactionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TransactionCursorPagination
 
     def get_queryset(self):
         return Transaction.objects.filter(user=self.request.user)
 
+    def filter_queryset(self, queryset):
+        return filter_transactions(queryset, self.request.query_params)
+
+    def list(self, request, *args, **kwargs):
+        # plain rows instead of model instances + a serializer per row; same output as TransactionSerializer
+        queryset = self.filter_queryset(self.get_queryset()).values_list(*transaction_rows.columns, named=True)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(transaction_rows.many(page))
+        return Response(transaction_rows.many(queryset))
+
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        def create():
+            with transaction.atomic(): # the rollup update commits (or rolls back) together with the row
+                txn = serializer.save(user=self.request.user)
+                rollups.record_created(txn)
+            return txn
+        txn = writes.run(create) # through the single writer when running on SQLite, see config/sqlite.py
+        live.transactions_changed(txn.user_id, created=[txn]) # push to open dashboards, once committed and off the writer
 
 class TransactionDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = TransactionSerializer
@@ -22,40 +50,138 @@ class TransactionDetailView(generics.RetrieveUpdateDestroyAPIView):
     def get_queryset(self):
         return Transaction.objects.filter(user=self.request.user)
 
-class InsightsView(generics.GenericAPIView):
+    def perform_update(self, serializer):
+        old_key = rollups.rollup_key(serializer.instance)
+        old_amount = serializer.instance.amount
+        def update():
+            with transaction.atomic():
+                txn = serializer.save()
+                rollups.record_updated(old_key, old_amount, txn)
+            return txn
+        txn = writes.run(update)
+        live.transactions_changed(txn.user_id, updated=[txn], months=[old_key[1]])
+
+    def perform_destroy(self, instance):
+        pk, key = instance.pk, rollups.rollup_key(instance)
+        def destroy():
+            with transaction.atomic():
+                rollups.record_deleted(instance)
+                instance.delete()
+        writes.run(destroy)
+        live.transactions_changed(key[0], deleted=[pk], months=[key[1]])
+
+class TransactionImportView(APIView):
+    """
+    Bulk import of bank / Stripe exports. Send the file as a raw body (Content-Type text/csv or
+    application/x-ndjson) or as a multipart upload in the "file" field; ?file_format=csv|ndjson overrides
+    the detection. CSV needs a header row with amount, type, category and optionally date, description.
+    Bodies over TRANSACTION_IMPORT_MAX_BYTES get a 413; the import_transactions command takes any size.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    CONTENT_TYPES = {
+        "text/csv": "csv",
+        "application/csv": "csv",
+        "application/x-ndjson": "ndjson",
+        "application/ndjson": "ndjson",
+        "application/jsonl": "ndjson",
+    }
+
+    def post(self, request):
+        limit = settings.TRANSACTION_IMPORT_MAX_BYTES
+        try:
+            length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = 0
+        if length > limit: # checked before anything reads the body
+            return Response({"error": f"The file is too large to import over HTTP (at most {limit // (1024 * 1024)} MB). "
+                                      "Split it, or ask for it to be loaded with the import_transactions command."}, status=413)
+
+        content_type = request.content_type.split(";")[0].strip().lower()
+
+        if content_type == "multipart/form-data":
+            upload = request.FILES.get("file")
+            if upload is None:
+                return Response({"error": "Upload the file in the 'file' field."}, status=400)
+            lines = upload
+            detected = "ndjson" if upload.name.lower().endswith((".ndjson", ".jsonl")) else "csv"
+        else:
+            lines = request.stream or []
+            detected = self.CONTENT_TYPES.get(content_type)
+
+        fmt = request.query_params.get("file_format", detected)
+        if fmt not in ingest.FORMATS:
+            return Response({"error": "Unsupported format. Send CSV or NDJSON."}, status=415)
+
+        result = ingest.ingest(request.user, lines, fmt)
+        if result["created"]:
+            status = 201
+        elif result["failed"]:
+            status = 400
+        else:
+            status = 200
+        return Response(result, status=status)
+
+class TransactionExportView(ReplicaReadMixin, APIView):
+    """ Streams the user's transactions as CSV or NDJSON (?file_format=csv|ndjson), same filters as the list """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        fmt = request.query_params.get("file_format", "csv")
+        if fmt not in export.FORMATS:
+            return Response({"error": "Unsupported format. Use csv or ndjson."}, status=400)
+
+        queryset = filter_transactions(Transaction.objects.filter(user=request.user), request.query_params)
+        queryset = queryset.using(router.db_for_read(Transaction)) # the rows stream after the view returns, so pick the database now
+        response = StreamingHttpResponse(export.stream(queryset, fmt), content_type=export.FORMATS[fmt])
+        response["Content-Disposition"] = f'attachment; filename="transactions.{fmt}"'
+        return response
+
+class InsightsView(ReplicaReadMixin, generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
         user = request.user
+
+        if "from" in request.query_params or "to" in request.query_params:
+            return self.get_series(request)
+
         month = request.query_params.get("month")  # Format: YYYY-MM
         
         if not month:
             return Response({"error": "Month parameter is required (YYYY-MM)"}, status=400)
 
         try:
-            start_date = datetime.strptime(month, "%Y-%m").replace(day=1)
-            end_date = datetime.strptime(month, "%Y-%m").replace(day=28)  # Covers the whole month
+            month_start = datetime.strptime(month, "%Y-%m").date()
         except ValueError:
             return Response({"error": "Invalid month format. Use YYYY-MM."}, status=400)
 
-        transactions = Transaction.objects.filter(user=user, date__range=[start_date, end_date])
+        # Precomputed per-category totals for the month, see analytics.rollups
+        return Response(rollups.month_insights(user, month_start))
 
-        total_expenses = transactions.filter(type="expense").aggregate(Sum("amount"))['amount__sum'] or 0
-        total_revenue = transactions.filter(type="revenue").aggregate(Sum("amount"))['amount__sum'] or 0
-        
-        category_breakdown = (
-            transactions
-            .filter(type="expense")
-            .values("category")
-            .annotate(total=Sum("amount"))
-            .order_by("-total")
-        )
-        
-        top_category = category_breakdown[0]["category"] if category_breakdown else "None"
+    def get_series(self, request):
+        """ Range mode: ?from=YYYY-MM[-DD]&to=YYYY-MM[-DD]&granularity=month|week|day """
+        granularity = request.query_params.get("granularity", "month")
+        if granularity not in series.GRANULARITIES:
+            return Response({"error": "Invalid granularity. Use month, week or day."}, status=400)
+
+        try:
+            start = series.parse_bound(request.query_params.get("from", ""))
+            end = series.parse_bound(request.query_params.get("to", ""), end=True)
+        except ValueError:
+            return Response({"error": f"Both from and to are required (YYYY-MM or YYYY-MM-DD, years {series.MIN_YEAR}-{series.MAX_YEAR})."}, status=400)
+
+        if start > end:
+            return Response({"error": "from must not be after to."}, status=400)
+
+        limit = series.MAX_BUCKETS[granularity]
+        if series.bucket_count(start, end, granularity) > limit:
+            return Response({"error": f"Range too long: at most {limit} {granularity} buckets per request."}, status=400)
 
         return Response({
-            "total_expenses": total_expenses,
-            "total_revenue": total_revenue,
-            "top_expense_category": top_category,
-            "category_breakdown": {item["category"]: item["total"] for item in category_breakdown}
-        })
\ No newline at end of file
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "granularity": granularity,
+            "series": series.build_series(request.user, start, end, granularity),
+        })
@@ -0,0 +1,90 @@
+"""
+JWT authentication without a user query per request.
+
+JWTAuthentication fetches the CustomUser row on every authenticated request. CachedJWTAuthentication keeps a
+snapshot of the row (every field except the password hash) in a small process-local LRU with a short TTL,
+backed by Django's cache framework, and rebuilds the user instance from it with Model.from_db(). The user
+post_save / post_delete signals drop the snapshot (see signals.py), so a role change or deactivation is
+seen on the next request in this process, and within AUTH_USER_CACHE_LOCAL_TTL seconds in the others.
+"""
+import zlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from config.cache import LRUCache
+
+
+User = get_user_model()
+
+LOCAL_MAX_ENTRIES = getattr(settings, "AUTH_USER_CACHE_LOCAL_MAX_ENTRIES", 10_000)
+LOCAL_TTL = getattr(settings, "AUTH_USER_CACHE_LOCAL_TTL", 10) # seconds; bounds staleness across processes
+SHARED_TTL = getattr(settings, "AUTH_USER_CACHE_SHARED_TTL", 60 * 5)
+
+# The password hash stays out of the cache; it's deferred on cached instances and loads on first access
+SNAPSHOT_FIELDS = [field.attname for field in User._meta.concrete_fields if field.attname != "password"]
+SNAPSHOT_VERSION = zlib.crc32(",".join(SNAPSHOT_FIELDS).encode()) # a schema change mustn't read old snapshots
+
+_local = LRUCache(LOCAL_MAX_ENTRIES, LOCAL_TTL)
+
+
+def _cache_key(user_id):
+    return f"auth:user:{SNAPSHOT_VERSION}:{user_id}"
+
+
+def _from_snapshot(values):
+    return User.from_db(router.db_for_read(User), SNAPSHOT_FIELDS, values)
+
+
+def get_user(user_id):
+    """ Returns the user with primary key `user_id`, from the cache when possible; raises User.DoesNotExist """
+    key = _cache_key(user_id)
+    values = _local.get(key)
+    if values is None:
+        values = cache.get(key)
+        if values is None:
+            values = list(User.objects.values_list(*SNAPSHOT_FIELDS).get(pk=user_id))
+            cache.set(key, values, SHARED_TTL)
+        _local.set(key, values)
+    return _from_snapshot(values)
+
+
+def invalidate(user_id):
+    key = _cache_key(user_id)
+    _local.delete(key)
+    cache.delete(key)
+
+
+async def ainvalidate(user_id):
+    key = _cache_key(user_id)
+    _local.delete(key)
+    await cache.adelete(key)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """ JWTAuthentication that resolves the token's user through the snapshot cache """
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN or api_settings.USER_ID_FIELD != User._meta.pk.attname:
+            return super().get_user(validated_token) # these need the password hash / another lookup field
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = get_user(user_id)
+        except User.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        return user
@@ -0,0 +1,150 @@
+"""
+Password hashing on a small, bounded thread pool.
+
+Hashing a password is deliberately expensive (hundreds of ms of CPU with the default PBKDF2 settings). Run
+inline, a burst of sign-in attempts can occupy every worker and every core. Here at most
+AUTH_HASHING_WORKERS hashes run at once (hashlib releases the GIL, so they do run in parallel), and once
+AUTH_HASHING_MAX_PENDING are queued further attempts are turned away with a 503 straight away instead of
+piling up. So that an attack can't take every slot and lock everyone else out, each client (IP) may only
+have AUTH_HASHING_PER_CLIENT hashes pending, and AUTH_HASHING_RESERVED slots are kept for callers in good
+standing (LoginView: clients signing in no more than a few times a minute, and not failing), who also wait up to
+AUTH_HASHING_RESERVED_WAIT seconds for a slot rather than failing outright. Only the CPU work runs on the
+pool; database access stays on the request thread.
+"""
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.contrib.auth import _clean_credentials, get_user_model
+from django.contrib.auth import hashers
+from django.contrib.auth.signals import user_login_failed
+from rest_framework.exceptions import APIException
+
+User = get_user_model()
+
+WORKERS = getattr(settings, "AUTH_HASHING_WORKERS", None) or max(1, (os.cpu_count() or 2) // 2)
+MAX_PENDING = getattr(settings, "AUTH_HASHING_MAX_PENDING", None) or 4 * WORKERS
+RESERVED = getattr(settings, "AUTH_HASHING_RESERVED", None) # default: a quarter of max_pending
+RESERVED_WAIT = getattr(settings, "AUTH_HASHING_RESERVED_WAIT", 5.0) # seconds
+PER_CLIENT = getattr(settings, "AUTH_HASHING_PER_CLIENT", 1) # pending hashes per client (IP)
+
+
+class HashingBusy(APIException):
+    status_code = 503
+    default_detail = "Too many sign-in attempts in progress, please try again in a moment."
+    default_code = "hashing_busy"
+
+
+class HashingPool:
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING, reserved=RESERVED, reserved_wait=RESERVED_WAIT,
+                 per_client=PER_CLIENT):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.reserved = min(max_pending // 4 if reserved is None else reserved, max_pending - 1)
+        self.reserved_wait = reserved_wait
+        self.per_client = per_client
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hashing")
+        self._pending = 0
+        self._clients = {} # client -> pending hashes
+        self._slot_freed = threading.Condition()
+
+    def _has_slot(self, reserved, client):
+        if client is not None and self._clients.get(client, 0) >= self.per_client:
+            return False
+        # the last self.reserved slots aren't for everyone
+        return self._pending < self.max_pending - (0 if reserved else self.reserved)
+
+    def _acquire(self, reserved, client):
+        with self._slot_freed:
+            if reserved:
+                if not self._slot_freed.wait_for(lambda: self._has_slot(True, client), self.reserved_wait):
+                    raise HashingBusy()
+            elif not self._has_slot(False, client):
+                raise HashingBusy()
+            self._pending += 1
+            if client is not None:
+                self._clients[client] = self._clients.get(client, 0) + 1
+
+    def _release(self, client):
+        with self._slot_freed:
+            self._pending -= 1
+            if client is not None:
+                self._clients[client] -= 1
+                if not self._clients[client]:
+                    del self._clients[client]
+            self._slot_freed.notify_all() # waiters differ in what they wait for (any slot / their client's)
+
+    def run(self, func, *args, reserved=False, client=None):
+        """
+        Runs func(*args) on the pool and waits for it; raises HashingBusy if the queue is full, or if `client`
+        (e.g. an IP) already has per_client hashes pending. With reserved=True the reserved slots can be used
+        too, and instead of failing straight away the caller waits up to reserved_wait seconds for a slot.
+        """
+        self._acquire(reserved, client)
+        try:
+            return self._executor.submit(func, *args).result()
+        finally:
+            self._release(client)
+
+    def map(self, func, items, concurrency=None):
+        """
+        [func(item) for item in items] on the pool, taking one queue slot for the lot. At most `concurrency`
+        (half the workers by default) run at once, so a big batch doesn't make sign-ins wait behind all of it.
+        """
+        self._acquire(False, None)
+        try:
+            concurrency = concurrency or max(1, self.workers // 2)
+            results = [None] * len(items)
+            running = {}
+            for index, item in enumerate(items):
+                if len(running) >= concurrency:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        results[running.pop(future)] = future.result()
+                running[self._executor.submit(func, item)] = index
+            for future, index in running.items():
+                results[index] = future.result()
+            return results
+        finally:
+            self._release(None)
+
+
+pool = HashingPool()
+
+
+def make_password(raw_password, reserved=False, client=None):
+    return pool.run(hashers.make_password, raw_password, reserved=reserved, client=client)
+
+
+def authenticate(email, password, request=None, reserved=False, client=None):
+    """
+    Same outcome as django.contrib.auth.authenticate(request, email=..., password=...) with the ModelBackend,
+    user_login_failed signal included, but the hash is checked on the pool (reserved, client: see
+    HashingPool.run). Unknown emails still cost one hash, so response times don't reveal them.
+    """
+    user = _check_credentials(email, password, reserved, client)
+    if user is None:
+        user_login_failed.send(
+            sender=__name__, credentials=_clean_credentials({"email": email, "password": password}), request=request
+        )
+    return user
+
+
+def _check_credentials(email, password, reserved, client):
+    try:
+        user = User._default_manager.get_by_natural_key(email)
+    except User.DoesNotExist:
+        make_password(password, reserved, client)
+        return None
+
+    if not pool.run(hashers.check_password, password, user.password, reserved=reserved, client=client):
+        return None
+    if not user.is_active:
+        return None
+
+    hasher = hashers.identify_hasher(user.password)
+    if hasher.must_update(user.password): # e.g. the iteration count went up since this hash was made
+        user.password = make_password(password, reserved, client)
+        user.save(update_fields=["password"])
+    return user
@@ -0,0 +1,67 @@
+import json
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication import provisioning
+
+MAX_ERRORS_SHOWN = 50
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates users in bulk from a CSV (header: email,username,password[,role]) or JSON (a list of objects "
+        "with the same keys) file. All or nothing: if any row is invalid, nothing is created."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSON file, or - to read from stdin.")
+        parser.add_argument("--format", choices=["csv", "json"], help="Defaults to the file extension (csv for stdin).")
+        parser.add_argument("--basic-subscription", action="store_true", help="Also give every user an active Basic subscription.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes to hash the passwords on.")
+        parser.add_argument("--batch-size", type=int, default=500, help="Rows per INSERT.")
+        parser.add_argument("--dry-run", action="store_true", help="Only validate the file.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or ("json" if path.lower().endswith(".json") else "csv")
+        if path == "-":
+            text = sys.stdin.read()
+        else:
+            try:
+                with open(path, encoding="utf-8-sig") as f:
+                    text = f.read()
+            except OSError as e:
+                raise CommandError(f"Can't read {path}: {e}")
+
+        started = time.perf_counter()
+        try:
+            if file_format == "json":
+                try:
+                    rows = json.loads(text)
+                except ValueError as e:
+                    raise CommandError(f"Invalid JSON: {e}")
+            else:
+                rows = provisioning.parse_csv(text)
+            users = provisioning.provision(
+                rows,
+                basic_subscription=options["basic_subscription"],
+                processes=options["workers"],
+                batch_size=options["batch_size"],
+                dry_run=options["dry_run"],
+            )
+        except provisioning.ProvisioningError as e:
+            for error in e.errors[:MAX_ERRORS_SHOWN]:
+                self.stderr.write(f"row {error['row']}: {error['error']}" if error["row"] else error["error"])
+            if len(e.errors) > MAX_ERRORS_SHOWN:
+                self.stderr.write(f"... and {len(e.errors) - MAX_ERRORS_SHOWN} more")
+            raise CommandError("No users were created.")
+
+        elapsed = time.perf_counter() - started
+        if options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"{len(users)} users are valid (dry run, nothing created)."))
+        else:
+            subscriptions = " with Basic subscriptions" if options["basic_subscription"] else ""
+            self.stdout.write(self.style.SUCCESS(f"Created {len(users)} users{subscriptions} in {elapsed:.1f}s."))
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.5 on 2026-10-18 18:11
+
+from django.db import migrations, models
+
+
+def copy_customer_ids(apps, schema_editor):
+    """ Seeds CustomUser.stripe_customer_id from the newest subscription row that has one """
+    CustomUser = apps.get_model("authentication", "CustomUser")
+    Subscription = apps.get_model("subscriptions", "Subscription")
+
+    assigned = set()
+    rows = Subscription.objects.exclude(stripe_customer_id="").order_by("user_id", "-created_at")
+    for user_id, customer_id in rows.values_list("user_id", "stripe_customer_id"):
+        if customer_id in assigned:
+            continue
+        if CustomUser.objects.filter(pk=user_id, stripe_customer_id__isnull=True).update(stripe_customer_id=customer_id):
+            assigned.add(customer_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0005_delete_subscription'),
+        ('subscriptions', '0005_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='stripe_customer_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.RunPython(copy_customer_ids, migrations.RunPython.noop),
+    ]
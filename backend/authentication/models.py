@@ -6,6 +6,7 @@ from django.conf import settings
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True) # Users log in using emails (custome field) instead of username
     is_subscribed = models.BooleanField(default=False) # tracks whether a user has an active active subscription
+    stripe_customer_id = models.CharField(max_length=255, unique=True, null=True, blank=True) # created lazily on the first paid checkout
     
     groups = models.ManyToManyField(
         "auth.Group",
@@ -0,0 +1,163 @@
+"""
+Bulk user provisioning, for onboarding a whole organisation at once.
+
+Going through RegisterView costs two exists() queries, a password hash and an insert per user, one after the
+other. Here a batch is validated up front (one query checks every email and username against the table),
+the passwords are hashed in parallel (on the shared hashing pool for API requests, on a process pool for the
+provision_users command), and the users (plus, optionally, a Basic
+subscription each) are inserted with bulk_create in a single transaction. A batch is all or nothing: if any
+row is invalid, nothing is created and every problem is reported.
+"""
+import csv
+import io
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth import hashers
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from authentication import hashing
+from subscriptions.models import Subscription
+
+User = get_user_model()
+
+FIELDS = ("email", "username", "password", "role")
+ROLES = {role for role, _ in User.ROLE_CHOICES}
+MAX_USERS = getattr(settings, "AUTH_PROVISIONING_MAX_USERS", 1000) # per API request; the command has no limit
+INLINE_HASHES = 4 # smaller batches aren't worth starting processes for
+CHECK_CHUNK = 450
+
+
+class ProvisioningError(Exception):
+    """ The batch was rejected; `errors` lists {"row": ..., "error": ...} for every problem found """
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid rows")
+        self.errors = errors
+
+
+def parse_csv(text):
+    """ Rows of a CSV with a header line naming (some of) FIELDS """
+    reader = csv.DictReader(io.StringIO(text))
+    missing = {"email", "username", "password"} - set(reader.fieldnames or ())
+    if missing:
+        raise ProvisioningError([{"row": None, "error": f"CSV header is missing {', '.join(sorted(missing))}."}])
+    return [{field: (row.get(field) or "").strip() for field in FIELDS if row.get(field) is not None} for row in reader]
+
+
+def clean(rows):
+    """
+    Normalises the rows and checks them, including against each other and against existing users (one query
+    for the whole batch). Returns the cleaned rows or raises ProvisioningError.
+    """
+    if not isinstance(rows, list) or not rows:
+        raise ProvisioningError([{"row": None, "error": "Expected a non-empty list of users."}])
+
+    errors = []
+    cleaned = []
+    emails, usernames = {}, {}
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({"row": number, "error": "Expected an object with email, username and password."})
+            continue
+        email = row.get("email")
+        username = row.get("username")
+        password = row.get("password")
+        role = row.get("role") or "user"
+        if not email or not username or not password:
+            errors.append({"row": number, "error": "All fields are required."})
+            continue
+        if not all(isinstance(value, str) for value in (email, username, password, role)):
+            errors.append({"row": number, "error": "Fields must be strings."})
+            continue
+
+        email = User.objects.normalize_email(email.strip())
+        username = User.normalize_username(username.strip())
+        try:
+            validate_email(email)
+        except ValidationError:
+            errors.append({"row": number, "error": f"Invalid email {email!r}."})
+            continue
+        if role not in ROLES:
+            errors.append({"row": number, "error": f"Invalid role {role!r}."})
+            continue
+        if email in emails:
+            errors.append({"row": number, "error": f"Email {email} is repeated (row {emails[email]})."})
+            continue
+        if username in usernames:
+            errors.append({"row": number, "error": f"Username {username} is repeated (row {usernames[username]})."})
+            continue
+        emails[email] = usernames[username] = number
+        cleaned.append({"row": number, "email": email, "username": username, "password": password, "role": role})
+
+    # one query per CHECK_CHUNK rows instead of two exists() per user (chunked to stay under SQLite's parameter limit)
+    for start in range(0, len(cleaned), CHECK_CHUNK):
+        chunk = cleaned[start:start + CHECK_CHUNK]
+        chunk_emails = {row["email"] for row in chunk}
+        chunk_usernames = {row["username"] for row in chunk}
+        taken = User.objects.filter(Q(email__in=chunk_emails) | Q(username__in=chunk_usernames)).values_list("email", "username")
+        for email, username in taken:
+            if email in chunk_emails:
+                errors.append({"row": emails[email], "error": "Email already exists"})
+            if username in chunk_usernames:
+                errors.append({"row": usernames[username], "error": "Username already taken."})
+
+    if errors:
+        raise ProvisioningError(sorted(errors, key=lambda error: error["row"] or 0))
+    return cleaned
+
+
+def hash_passwords(passwords, processes=None):
+    """
+    make_password() for each password. By default on the bounded hashing pool (see hashing.py), which is what
+    requests must use: forking a process pool from a server with threads running isn't safe. The
+    provision_users command passes `processes` to spread a big file over that many worker processes instead;
+    those set Django up themselves, which also works where processes are spawned rather than forked.
+    """
+    if len(passwords) <= INLINE_HASHES:
+        return [hashing.make_password(password) for password in passwords]
+    if not processes or processes <= 1:
+        return hashing.pool.map(hashers.make_password, passwords)
+    processes = min(processes, len(passwords))
+    with ProcessPoolExecutor(max_workers=processes, initializer=django.setup) as executor:
+        chunksize = math.ceil(len(passwords) / (processes * 4))
+        return list(executor.map(hashers.make_password, passwords, chunksize=chunksize))
+
+
+def provision(rows, basic_subscription=False, processes=None, batch_size=500, dry_run=False):
+    """
+    Creates the users in `rows` (dicts with email, username, password and optionally role) and, with
+    basic_subscription, an active Basic subscription for each. `processes` goes to hash_passwords(). Returns
+    the created users, or raises ProvisioningError without creating anything.
+    """
+    cleaned = clean(rows)
+    if dry_run:
+        return [User(email=row["email"], username=row["username"], role=row["role"]) for row in cleaned]
+
+    passwords = hash_passwords([row["password"] for row in cleaned], processes)
+    users = [
+        User(email=row["email"], username=row["username"], role=row["role"], password=password)
+        for row, password in zip(cleaned, passwords)
+    ]
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=batch_size)
+            if users and users[0].pk is None: # backends that can't return the new primary keys
+                ids = dict(User.objects.filter(email__in=[user.email for user in users]).values_list("email", "pk"))
+                for user in users:
+                    user.pk = ids[user.email]
+            if basic_subscription:
+                # same row CreateSubscriptionView creates for the free plan; a new user has no Stripe customer yet
+                Subscription.objects.bulk_create([
+                    Subscription(user=user, stripe_customer_id="", plan="basic", is_active=True, status="active")
+                    for user in users
+                ], batch_size=batch_size)
+    except IntegrityError: # someone registered one of these in the meantime
+        raise ProvisioningError([{"row": None, "error": "Some of these users were created concurrently, please retry."}])
+    return users
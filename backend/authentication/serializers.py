@@ -0,0 +1,41 @@
+from django.contrib.auth import get_user_model
+from rest_framework import exceptions
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer as BaseTokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from authentication import authentication
+from authentication.tokens import RefreshToken
+
+User = get_user_model()
+
+
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    """ TokenRefreshSerializer using the in-memory blacklist (tokens.py) and the cached user lookup """
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        if api_settings.USER_ID_FIELD != User._meta.pk.attname:
+            return super().validate(attrs) # the user cache is keyed by primary key
+
+        refresh = self.token_class(attrs["refresh"])
+
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM, None)
+        if user_id:
+            try:
+                user = authentication.get_user(user_id)
+            except User.DoesNotExist:
+                user = None
+            if not api_settings.USER_AUTHENTICATION_RULE(user):
+                raise exceptions.AuthenticationFailed(self.error_messages["no_active_account"], "no_active_account")
+
+        data = {"access": str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data["refresh"] = str(refresh)
+
+        return data
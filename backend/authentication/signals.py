@@ -0,0 +1,16 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from authentication import authentication
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """ Drops the auth snapshot now, and again on commit in case a request re-cached the old row meanwhile """
+    authentication.invalidate(instance.pk)
+    transaction.on_commit(lambda: authentication.invalidate(instance.pk))
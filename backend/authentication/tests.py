@@ -1,3 +1,237 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from authentication import authentication, hashing, throttling
+from authentication.tokens import RefreshToken, revoked
+
+
+class BulkProvisionTests(APITestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create_user(username="admin", email="admin@example.com", password="pw-12345678", role="admin")
+        self.client.force_authenticate(self.admin)
+
+    def test_body_must_be_an_object(self):
+        response = self.client.post("/api/auth/admin-only/users/bulk/", [{"email": "a@example.com"}], format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_creates_users(self):
+        users = [{"email": f"user{i}@example.com", "username": f"user{i}", "password": "pw-12345678"} for i in range(6)]
+        response = self.client.post("/api/auth/admin-only/users/bulk/", {"users": users}, format="json")
+        self.assertEqual(response.status_code, 201)
+        created = get_user_model().objects.get(email="user5@example.com")
+        self.assertTrue(created.check_password("pw-12345678"))
+
+
+class CachedAuthenticationTests(APITestCase):
+    def setUp(self):
+        authentication._local.clear()
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username="cached", email="cached@example.com", password="pw-12345678")
+        self.headers = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def get(self, path="/api/auth/api/protected/"):
+        return self.client.get(path, headers=self.headers)
+
+    def test_user_is_not_queried_per_request(self):
+        self.assertEqual(self.get().status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().status_code, 200)
+
+    def test_saving_the_user_drops_the_snapshot(self):
+        self.assertEqual(self.get("/api/auth/api/admin/protected/").status_code, 403)
+        self.user.role = "admin"
+        self.user.save()
+        self.assertEqual(self.get("/api/auth/api/admin/protected/").status_code, 200)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_password_hash_stays_out_of_the_cache(self):
+        user = authentication.get_user(self.user.pk)
+        self.assertIn("password", user.get_deferred_fields())
+        self.assertTrue(user.check_password("pw-12345678")) # loaded on first access
+
+
+class RevokedTokenTests(APITestCase):
+    def setUp(self):
+        revoked.reset()
+        self.addCleanup(revoked.reset)
+        authentication._local.clear()
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username="revoked", email="revoked@example.com", password="pw-12345678")
+
+    def refresh(self, token):
+        return self.client.post("/api/auth/refresh/", {"refresh": str(token)}, format="json")
+
+    def test_logout_revokes_immediately(self):
+        token = RefreshToken.for_user(self.user)
+        self.assertEqual(self.refresh(token).status_code, 200)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.post("/api/auth/logout/", {"refresh": str(token)}, format="json").status_code, 205)
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_checks_are_answered_from_memory(self):
+        token = RefreshToken.for_user(self.user)
+        self.refresh(token) # first sync
+        with self.assertNumQueries(0): # blacklist from memory, user from the snapshot cache
+            self.assertEqual(self.refresh(token).status_code, 200)
+
+    def test_revocations_elsewhere_show_up_after_the_sync_interval(self):
+        token = RefreshToken.for_user(self.user)
+        self.assertEqual(self.refresh(token).status_code, 200)
+        # blacklisted by another process
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token["jti"]))
+        self.assertEqual(self.refresh(token).status_code, 200)
+        revoked._synced_at -= revoked.sync_interval
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_expired_tokens_are_pruned(self):
+        revoked.sync(force=True)
+        outstanding = OutstandingToken.objects.create(user=self.user, jti="gone", token="x", expires_at=timezone.now() - timedelta(seconds=1))
+        BlacklistedToken.objects.create(token=outstanding)
+        revoked.sync(force=True)
+        self.assertNotIn("gone", revoked._expiries)
+
+
+class SlidingWindowTests(SimpleTestCase):
+    def test_previous_window_fades_out(self):
+        store = throttling.LocalStore()
+        for now in (0, 10, 20):
+            self.assertTrue(store.hit("k", 3, 60, now=now)[0])
+        allowed, wait = store.hit("k", 3, 60, now=30)
+        self.assertFalse(allowed)
+        self.assertEqual(wait, 30) # the current window is full; only its reset helps
+
+        # 3 requests in the previous window, weighted by the share of it still in range
+        self.assertFalse(store.hit("k", 3, 60, now=75)[0]) # 3 * 0.75 + 1 > 3
+        self.assertTrue(store.hit("k", 3, 60, now=90)[0]) # 3 * 0.5 + 1 <= 3
+        self.assertTrue(store.hit("k", 3, 60, now=180)[0]) # two windows later nothing is left
+
+    def test_uncounted_checks_and_records(self):
+        store = throttling.LocalStore()
+        self.assertTrue(store.hit("k", 1, 60, count=False, now=0)[0])
+        self.assertTrue(store.hit("k", 1, 60, count=False, now=1)[0])
+        store.add("k", 60, now=2)
+        self.assertFalse(store.hit("k", 1, 60, count=False, now=3)[0])
+
+
+class HashingPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.pool = hashing.HashingPool(workers=8, max_pending=4, reserved=1, reserved_wait=0) # a worker per blocked call
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.threads = []
+
+    def start(self, slots, **kwargs):
+        """ Takes `slots` queue slots with calls that block until self.release is set """
+        pending = self.pool._pending + slots
+        for _ in range(slots):
+            self.threads.append(threading.Thread(target=self.pool.run, args=(self.release.wait,), kwargs=kwargs))
+            self.threads[-1].start()
+        while self.pool._pending < pending:
+            self.release.wait(0.01)
+
+    def finish(self):
+        self.release.set()
+        for thread in self.threads:
+            thread.join()
+
+    def test_reserved_slots_survive_a_full_queue(self):
+        self.start(3)
+        with self.assertRaises(hashing.HashingBusy): # the shared slots are taken
+            self.pool.run(len, "x")
+        self.start(1, reserved=True)
+        with self.assertRaises(hashing.HashingBusy): # and now the reserved one too
+            self.pool.run(len, "x", reserved=True)
+        self.finish()
+        self.assertEqual(self.pool._pending, 0)
+
+    def test_reserved_callers_wait_for_a_slot(self):
+        self.pool.reserved_wait = 10
+        self.start(4, reserved=True)
+        results = []
+        waiting = threading.Thread(target=lambda: results.append(self.pool.run(len, "x", reserved=True)))
+        waiting.start()
+        with self.assertRaises(hashing.HashingBusy): # only reserved callers wait
+            self.pool.run(len, "x")
+        self.finish()
+        waiting.join()
+        self.assertEqual(results, [1])
+
+    def test_clients_get_a_fair_share(self):
+        self.pool.reserved_wait = 10
+        self.start(1, client="203.0.113.1")
+        with self.assertRaises(hashing.HashingBusy): # one pending hash per client, even with slots to spare
+            self.pool.run(len, "x", client="203.0.113.1")
+        self.assertEqual(self.pool.run(len, "x", client="198.51.100.1"), 1)
+
+        results = []
+        waiting = threading.Thread(target=lambda: results.append(self.pool.run(len, "x", reserved=True, client="203.0.113.1")))
+        waiting.start() # reserved callers wait for their own client's slot too
+        self.finish()
+        waiting.join()
+        self.assertEqual((results, self.pool._clients), ([1], {}))
+
+    def test_tiny_pools_keep_a_shared_slot(self):
+        self.assertEqual(hashing.HashingPool(workers=1, max_pending=1).reserved, 0)
+
+
+class LoginTests(APITestCase):
+    def setUp(self):
+        throttling.get_store().clear()
+        self.addCleanup(throttling.get_store().clear)
+        self.user = get_user_model().objects.create_user(username="login", email="login@example.com", password="pw-12345678")
+
+    def login(self, password, ip="198.51.100.1", email="login@example.com"):
+        return self.client.post("/api/auth/login/", {"email": email, "password": password}, format="json", REMOTE_ADDR=ip)
+
+    def test_failed_sign_in_sends_user_login_failed(self):
+        failures = []
+
+        def receiver(**kwargs):
+            failures.append(kwargs)
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+
+        self.assertEqual(self.login("wrong").status_code, 400)
+        self.assertEqual(self.login("wrong", email="nobody@example.com").status_code, 400)
+        self.assertEqual(self.login("pw-12345678").status_code, 200)
+        self.assertEqual([f["credentials"]["email"] for f in failures], ["login@example.com", "nobody@example.com"])
+        self.assertNotEqual(failures[0]["credentials"]["password"], "wrong")
+        self.assertEqual(failures[0]["request"].path, "/api/auth/login/")
+
+    def test_ip_window_stops_hashing(self):
+        for _ in range(10): # login_ip: 10/m
+            self.login("pw-12345678", email="nobody@example.com")
+        with mock.patch.object(hashing, "authenticate") as authenticate:
+            response = self.login("pw-12345678")
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response.headers)
+        authenticate.assert_not_called()
+
+    def test_only_failures_count_per_account(self):
+        for number in range(12):
+            self.assertEqual(self.login("pw-12345678", ip=f"198.51.100.{number + 1}").status_code, 200)
+        for attempt in range(10): # login_account: 10/15m, from a different IP each time
+            self.assertEqual(self.login("wrong", ip=f"203.0.113.{attempt + 1}").status_code, 400)
+        self.assertEqual(self.login("pw-12345678", ip="192.0.2.1").status_code, 429)
+
+    def test_reserved_slots_are_for_occasional_sign_ins(self):
+        with mock.patch.object(hashing, "authenticate", wraps=hashing.authenticate) as authenticate:
+            self.login("wrong") # login_reserved_ip: 3/m, and a failure counts twice
+            self.login("pw-12345678")
+            self.login("pw-12345678")
+            self.login("pw-12345678", ip="198.51.100.2")
+        calls = [(c.kwargs["reserved"], c.kwargs["client"]) for c in authenticate.call_args_list]
+        self.assertEqual(calls, [(True, "198.51.100.1"), (True, "198.51.100.1"), (False, "198.51.100.1"), (True, "198.51.100.2")])
@@ -0,0 +1,211 @@
+"""
+Sliding-window throttles for the login / register endpoints.
+
+Each (scope, key) pair keeps two fixed-window counters, the current and the previous one; the request count
+over the last `window` seconds is estimated as previous * (share of the previous window still in range) +
+current. That's constant memory per key, unlike DRF's SimpleRateThrottle which keeps every timestamp.
+Throttles run before the view, so a throttled request never reaches the password hasher.
+
+The counters live in this process by default; set AUTH_THROTTLE_STORE = "cache" to keep them in Django's
+cache instead (shared between workers when a shared backend is configured).
+
+The per-IP throttles use DRF's get_ident(): REMOTE_ADDR, or the address NUM_PROXIES hops back in
+X-Forwarded-For when the app runs behind that many proxies (see settings.py).
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+RATE_PATTERN = re.compile(r"^(\d+)/(\d*)([smhd])")
+UNIT_SECONDS = {"s": 1, "m": 60, "h": 60 * 60, "d": 60 * 60 * 24}
+LOCAL_MAX_KEYS = getattr(settings, "AUTH_THROTTLE_LOCAL_MAX_KEYS", 100_000)
+
+
+def parse_rate(rate):
+    """ "30/min" -> (30, 60), "10/15m" -> (10, 900); the unit is its first letter, as in DRF """
+    match = RATE_PATTERN.match(rate)
+    if not match:
+        raise ValueError(f"Invalid throttle rate {rate!r}.")
+    limit, multiplier, unit = match.groups()
+    return int(limit), int(multiplier or 1) * UNIT_SECONDS[unit]
+
+
+def estimate(previous, current, now, window):
+    """ Requests in the sliding window ending at `now` """
+    elapsed = now % window
+    return previous * (1 - elapsed / window) + current
+
+
+def retry_after(previous, current, now, window, limit):
+    """ Seconds until one more request fits """
+    elapsed = now % window
+    if current + 1 > limit:
+        return window - elapsed # only the next window's reset helps
+    # previous * (1 - (elapsed + t) / window) + current + 1 <= limit
+    if not previous:
+        return 0.0
+    return min(window - elapsed, max(0.0, window * (1 - (limit - current - 1) / previous) - elapsed))
+
+
+class LocalStore:
+    """ In-process counters; the least recently used keys are dropped beyond LOCAL_MAX_KEYS """
+
+    def __init__(self, max_keys=LOCAL_MAX_KEYS):
+        self.max_keys = max_keys
+        self._counters = OrderedDict() # key -> [window number, previous count, current count]
+        self._lock = threading.Lock()
+
+    def _counter(self, key, number):
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters[key] = [number, 0, 0]
+        elif counter[0] != number:
+            counter[1] = counter[2] if counter[0] == number - 1 else 0
+            counter[0], counter[2] = number, 0
+        self._counters.move_to_end(key)
+        while len(self._counters) > self.max_keys:
+            self._counters.popitem(last=False)
+        return counter
+
+    def hit(self, key, limit, window, count=True, now=None):
+        """ Returns (allowed, seconds to wait); an allowed request is counted unless count=False """
+        now = time.time() if now is None else now
+        with self._lock:
+            counter = self._counter(key, int(now // window))
+            _, previous, current = counter
+            if estimate(previous, current, now, window) + 1 > limit:
+                return False, retry_after(previous, current, now, window, limit)
+            if count:
+                counter[2] += 1
+            return True, 0.0
+
+    def add(self, key, window, now=None):
+        """ Counts one event regardless of the limit """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._counter(key, int(now // window))[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+
+
+class CacheStore:
+    """ Counters in Django's cache: one key per (key, window number), expiring after two windows """
+
+    def _keys(self, key, now, window):
+        number = int(now // window)
+        return f"throttle:{key}:{number}", f"throttle:{key}:{number - 1}"
+
+    def hit(self, key, limit, window, count=True, now=None):
+        now = time.time() if now is None else now
+        current_key, previous_key = self._keys(key, now, window)
+        if count:
+            current = self._incr(current_key, window) - 1 # count first so concurrent workers can't all slip through
+        else:
+            current = cache.get(current_key, 0)
+        previous = cache.get(previous_key, 0)
+
+        if estimate(previous, current, now, window) + 1 > limit:
+            if count:
+                cache.decr(current_key)
+            return False, retry_after(previous, current, now, window, limit)
+        return True, 0.0
+
+    def add(self, key, window, now=None):
+        now = time.time() if now is None else now
+        self._incr(self._keys(key, now, window)[0], window)
+
+    def _incr(self, key, window):
+        cache.add(key, 0, timeout=2 * window)
+        try:
+            return cache.incr(key)
+        except ValueError: # expired between add() and incr()
+            cache.set(key, 1, timeout=2 * window)
+            return 1
+
+
+def get_store():
+    return CacheStore() if getattr(settings, "AUTH_THROTTLE_STORE", "local") == "cache" else _local_store
+
+
+_local_store = LocalStore()
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    Base class: subclasses set `scope` (a key of DEFAULT_THROTTLE_RATES) and implement get_key(). With
+    count_requests = False, allow_request() only checks the limit and the view calls record() for the
+    requests that should count.
+    """
+    scope = None
+    count_requests = True
+
+    def get_key(self, request, view):
+        raise NotImplementedError
+
+    def get_rate(self):
+        return parse_rate(api_settings.DEFAULT_THROTTLE_RATES[self.scope])
+
+    def allow_request(self, request, view):
+        key = self.get_key(request, view)
+        if key is None:
+            return True
+        limit, window = self.get_rate()
+        allowed, self.wait_seconds = get_store().hit(f"{self.scope}:{key}", limit, window, count=self.count_requests)
+        return allowed
+
+    def record(self, request, view=None):
+        key = self.get_key(request, view)
+        if key is not None:
+            get_store().add(f"{self.scope}:{key}", self.get_rate()[1])
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class LoginIPThrottle(SlidingWindowThrottle):
+    """ Sign-in attempts per client IP """
+    scope = "login_ip"
+
+    def get_key(self, request, view):
+        return self.get_ident(request)
+
+
+class LoginAccountThrottle(SlidingWindowThrottle):
+    """
+    Failed sign-ins per account, whichever IPs they come from. Only failures count (LoginView records
+    them), so signing in often doesn't lock anyone out, guessing does.
+    """
+    scope = "login_account"
+    count_requests = False
+
+    def get_key(self, request, view):
+        email = request.data.get("email")
+        return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+
+class LoginReservedIPThrottle(SlidingWindowThrottle):
+    """
+    Sign-in attempts per client IP that may use the hashing pool's reserved slots (see hashing.py). Nothing is
+    rejected with it: LoginView asks allow_request() whether the client is within the rate, and records failed
+    attempts a second time, so a client that sends a burst or guesses wrong falls back to the shared slots.
+    """
+    scope = "login_reserved_ip"
+
+    def get_key(self, request, view):
+        return self.get_ident(request)
+
+
+class RegisterIPThrottle(SlidingWindowThrottle):
+    """ Sign-ups per client IP """
+    scope = "register_ip"
+
+    def get_key(self, request, view):
+        return self.get_ident(request)
@@ -0,0 +1,101 @@
+"""
+Refresh tokens with an in-memory blacklist check.
+
+simplejwt checks every refresh token against BlacklistedToken (joined to OutstandingToken) with a query. Here
+the jtis of revoked, not yet expired tokens live in a process-local set that is kept in step with the
+database: new blacklist rows are picked up incrementally (by primary key) every few seconds, and the whole
+set is reloaded now and then to catch rows that committed out of order. Expired tokens drop out of the set,
+so it only ever holds what was revoked within the last REFRESH_TOKEN_LIFETIME. Revocations made by this
+process are visible immediately; ones made by another process after at most BLACKLIST_SYNC_INTERVAL seconds.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken as BaseRefreshToken
+
+SYNC_INTERVAL = getattr(settings, "JWT_BLACKLIST_SYNC_INTERVAL", 5) # seconds
+FULL_RELOAD_INTERVAL = getattr(settings, "JWT_BLACKLIST_FULL_RELOAD_INTERVAL", 60 * 5)
+
+
+class RevokedTokens:
+    """ jti -> expiry (unix time) of every blacklisted token that hasn't expired yet """
+
+    def __init__(self, sync_interval=SYNC_INTERVAL, full_reload_interval=FULL_RELOAD_INTERVAL):
+        self.sync_interval = sync_interval
+        self.full_reload_interval = full_reload_interval
+        self._expiries = {}
+        self._last_id = None
+        self._synced_at = 0.0
+        self._reloaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def is_revoked(self, jti):
+        self.sync()
+        expires = self._expiries.get(jti)
+        return expires is not None and expires > time.time()
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            self._expiries[jti] = expires_at.timestamp()
+
+    def sync(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._synced_at < self.sync_interval:
+            return
+        with self._lock:
+            if not force and now - self._synced_at < self.sync_interval:
+                return # another thread synced while we waited for the lock
+            if self._last_id is None or now - self._reloaded_at >= self.full_reload_interval:
+                self._reload()
+                self._reloaded_at = now
+            else:
+                self._fetch_new()
+            self._synced_at = now
+
+    def reset(self):
+        with self._lock:
+            self._expiries = {}
+            self._last_id = None
+            self._synced_at = self._reloaded_at = 0.0
+
+    def _rows(self, queryset):
+        return queryset.values_list("pk", "token__jti", "token__expires_at").order_by()
+
+    def _reload(self):
+        last_id = BlacklistedToken.objects.aggregate(last_id=Max("pk"))["last_id"] or 0 # read first: nothing slips between
+        expiries = {
+            jti: expires_at.timestamp()
+            for _, jti, expires_at in self._rows(BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now()))
+        }
+        self._expiries, self._last_id = expiries, last_id
+
+    def _fetch_new(self):
+        for pk, jti, expires_at in self._rows(BlacklistedToken.objects.filter(pk__gt=self._last_id)):
+            self._expiries[jti] = expires_at.timestamp()
+            self._last_id = max(self._last_id, pk)
+        now = time.time()
+        self._expiries = {jti: expires for jti, expires in self._expiries.items() if expires > now}
+
+
+revoked = RevokedTokens()
+
+
+class RefreshToken(BaseRefreshToken):
+    """ RefreshToken whose blacklist check is answered from `revoked` instead of a query """
+
+    def check_blacklist(self):
+        if revoked.is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        result = super().blacklist()
+        blacklisted = result[0]
+        revoked.add(blacklisted.token.jti, blacklisted.token.expires_at)
+        return result
@@ -1,5 +1,5 @@
 from django.urls import path # define URL routes in Django
-from .views import RegisterView, LoginView, AdminProtectedView, AdminView, ManagerView, UserView, LogoutView # Imports registerview and loginview so that we can access them
+from .views import RegisterView, LoginView, AdminProtectedView, AdminView, ManagerView, UserView, LogoutView, BulkProvisionView # Imports registerview and loginview so that we can access them
 from authentication.views import ProtectedView
 from rest_framework_simplejwt.views import TokenRefreshView
 
@@ -14,4 +14,5 @@ urlpatterns = [ # url / function we wrote earlier and then the name we use inter
     path("manager-only/", ManagerView.as_view(), name="manager-only"),
     path("user-only/", UserView.as_view(), name="user-only"),
     path("logout/", LogoutView.as_view(), name="logout"),
+    path("admin-only/users/bulk/", BulkProvisionView.as_view(), name="bulk-provision"),
 ]
\ No newline at end of file
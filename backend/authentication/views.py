@@ -1,20 +1,22 @@
 from rest_framework.views import APIView # Uses APIView to create API endpoints
 from rest_framework.response import Response # Uses Response to send JSON responses
 from rest_framework.permissions import AllowAny, IsAuthenticated, BasePermission # - to make certain routes public
-from rest_framework_simplejwt.tokens import RefreshToken # to genetrate JWT tokens
-from django.contrib.auth import get_user_model, authenticate # verify credentials
+from .tokens import RefreshToken # to genetrate JWT tokens (blacklist checks answered in memory, see tokens.py)
+from django.contrib.auth import get_user_model
+from . import hashing # verify credentials / hash passwords on a bounded pool
+from . import provisioning
+from dashboard import metrics
 from .permissions import IsAdmin, IsManager, IsUser # Imported functions from permissions
+from .throttling import LoginAccountThrottle, LoginIPThrottle, LoginReservedIPThrottle, RegisterIPThrottle
 from django.shortcuts import render
 from rest_framework import status
-from django.conf import settings
-import stripe
 
 # Create your views here.
 User = get_user_model()
-stripe.api_key = settings.STRIPE_SECRET_KEY
 
 class RegisterView(APIView): #Creates the APi for registering
     permission_classes = [AllowAny]
+    throttle_classes = [RegisterIPThrottle]
 
     def post(self, request): # accepts POST request with email, username and password
         email = request.data.get("email")
@@ -30,7 +32,10 @@ class RegisterView(APIView): #Creates the APi for registering
         if User.objects.filter(username=username).exists():
             return Response({"error": "Username already taken."}, status=status.HTTP_400_BAD_REQUEST)
 
-        user = User.objects.create_user(email=email, username=username, password=password) # creates a new user if the email is unique
+        # creates a new user if the email is unique (same as create_user, but hashed on the bounded pool)
+        user = User(email=User.objects.normalize_email(email), username=User.normalize_username(username))
+        user.password = hashing.make_password(password)
+        user.save()
 
         refresh = RefreshToken.for_user(user)
         access_token = str(refresh.access_token)
@@ -43,11 +48,18 @@ class RegisterView(APIView): #Creates the APi for registering
 
 class LoginView(APIView): # Creates the api for login
     permission_classes = [AllowAny] # Means anyone can access it even when not logged in
+    throttle_classes = [LoginIPThrottle, LoginAccountThrottle] # checked before any password hashing happens
 
     def post(self, request): # reads the request
         email = request.data.get("email") # extracts email entered by user
         password = request.data.get("password")
-        user = authenticate(email=email, password=password) # checks if the email and password match a real user in the database
+        if not email or not password:
+            return Response({"error": "Invalid Credentials"}, status=400)
+        # checks if the email and password match a real user in the database; hashing slots are shared out
+        # per IP, and clients that sign in now and then may use the ones an attack can't take (see hashing.py)
+        reserved_throttle = LoginReservedIPThrottle()
+        reserved = reserved_throttle.allow_request(request, self)
+        user = hashing.authenticate(email, password, request=request, reserved=reserved, client=reserved_throttle.get_ident(request))
 
         if user is not None: # checks if user exists and if they do then django generates a JWT refresh and access token so that the user can access the protected API requests
             refresh = RefreshToken.for_user(user)
@@ -55,6 +67,8 @@ class LoginView(APIView): # Creates the api for login
                 "refresh": str(refresh), #Refreshes the token every 15 minutes so that If a token is stolen then it expires quickly
                 "access": str(refresh.access_token)
             })
+        LoginAccountThrottle().record(request) # failed attempts count towards the per-account limit
+        LoginReservedIPThrottle().record(request) # and cost the IP its reserved hashing slots sooner
         return Response({"error": "Invalid Credentials"}, status=400)
 
 class ProtectedView(APIView):
@@ -78,7 +92,8 @@ class AdminView(APIView):
     permission_classes = [IsAuthenticated, IsAdmin]
 
     def get(self, request):
-        return Response({"dashboard": "Admin panel data here"})
+        # latest daily snapshot (MRR, plan mix, ...); date ranges are at admin-only/metrics/
+        return Response({"dashboard": metrics.latest()})
 
 class ManagerView(APIView):
     permission_classes = [IsAuthenticated, IsManager]
@@ -92,6 +107,39 @@ class UserView(APIView):
     def get(self, request):
         return Response({"message": "You are a user!"})
 
+class BulkProvisionView(APIView):
+    """ Creates many users at once for onboarding: JSON {"users": [...]} or a CSV upload in "file" """
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def post(self, request):
+        upload = request.FILES.get("file")
+        if upload is not None:
+            try:
+                rows = provisioning.parse_csv(upload.read().decode("utf-8-sig"))
+            except UnicodeDecodeError:
+                return Response({"error": "The CSV file must be UTF-8."}, status=status.HTTP_400_BAD_REQUEST)
+            except provisioning.ProvisioningError as e:
+                return Response({"error": "Invalid CSV file.", "errors": e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        elif isinstance(request.data, dict):
+            rows = request.data.get("users")
+        else:
+            return Response({"error": 'Send {"users": [...]} or a CSV file in "file".'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if isinstance(rows, list) and len(rows) > provisioning.MAX_USERS:
+            return Response({"error": f"At most {provisioning.MAX_USERS} users per request."}, status=status.HTTP_400_BAD_REQUEST)
+
+        basic_subscription = str(request.data.get("basic_subscription", "")).lower() in ("1", "true", "yes")
+        try:
+            users = provisioning.provision(rows, basic_subscription=basic_subscription)
+        except provisioning.ProvisioningError as e:
+            return Response({"error": "No users were created.", "errors": e.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "message": f"{len(users)} users created.",
+            "users": [{"id": user.pk, "email": user.email, "username": user.username, "role": user.role} for user in users],
+            "basic_subscription": basic_subscription,
+        }, status=status.HTTP_201_CREATED)
+
 class LogoutView(APIView):
     permission_classes = [IsAuthenticated]
 
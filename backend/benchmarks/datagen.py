@@ -0,0 +1,167 @@
+"""
+Synthetic data for the benchmarks: users, their subscriptions and (lots of) transactions.
+
+Rows are written in batches (transactions with a raw executemany) and the monthly rollups are totalled on
+the way, so a few million transactions take a minute or two rather than hours.
+Passing the same `seed` gives the same data.
+"""
+import random
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+
+from analytics import rollups
+from analytics.models import MonthlyRollup, Transaction
+from subscriptions.fake_stripe import PLAN_PRICES
+from subscriptions.models import Subscription
+
+User = get_user_model()
+
+USERNAME_PREFIX = "bench"
+PASSWORD = "bench-password"
+CATEGORIES = {
+    "expense": ["Rent", "Payroll", "Software", "Marketing", "Travel", "Office", "Utilities", "Taxes", "Insurance", "Hardware"],
+    "revenue": ["Subscriptions", "Consulting", "Licensing", "Interest"],
+    "sale": ["Online", "Retail", "Wholesale"],
+}
+TYPE_WEIGHTS = {"expense": 6, "revenue": 3, "sale": 1}
+PLAN_WEIGHTS = {"basic": 5, "pro": 35, "enterprise": 15}
+
+
+def _subscription(user, plan, index, active, now):
+    if plan == "basic":
+        return Subscription(
+            user=user, stripe_customer_id="", plan="basic", is_active=active, status="active" if active else "canceled",
+            canceled_at=None if active else now,
+        )
+    return Subscription(
+        user=user,
+        stripe_customer_id=user.stripe_customer_id,
+        stripe_subscription_id=f"sub_{USERNAME_PREFIX}{index:08d}",
+        plan=plan,
+        is_active=active,
+        status="active" if active else "canceled",
+        canceled_at=None if active else now,
+        current_period_end=now + timedelta(days=30) if active else now - timedelta(days=60),
+        price_id=settings.STRIPE_PRICE_IDS[plan],
+        product_name=plan.capitalize(),
+        amount=PLAN_PRICES[plan],
+        currency="usd",
+        interval="month",
+    )
+
+
+def create_users(count, seed=0, batch_size=2000):
+    """ Users bench00000000..., all with the password PASSWORD and (fake) Stripe customer ids """
+    rng = random.Random(seed)
+    password = make_password(PASSWORD) # hashing once instead of per user keeps seeding fast
+    User.objects.bulk_create([
+        User(
+            username=f"{USERNAME_PREFIX}{i:08d}",
+            email=f"{USERNAME_PREFIX}{i:08d}@example.com",
+            password=password,
+            role=rng.choice(["user", "user", "user", "manager"]),
+            stripe_customer_id=f"cus_{USERNAME_PREFIX}{i:08d}",
+        )
+        for i in range(count)
+    ], batch_size=batch_size)
+    return list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by("pk"))
+
+
+def create_subscriptions(users, seed=0, batch_size=2000, months=0):
+    """
+    One active subscription per user, plus a canceled earlier one for about a third of them. With `months`,
+    start (and cancellation) dates are spread over that many months instead of all being now.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    plans, weights = zip(*PLAN_WEIGHTS.items())
+    rows = []
+    for index, user in enumerate(users):
+        rows.append(_subscription(user, rng.choices(plans, weights)[0], 2 * index, True, now))
+        if rng.random() < 0.3:
+            rows.append(_subscription(user, rng.choices(plans, weights)[0], 2 * index + 1, False, now))
+    Subscription.objects.bulk_create(rows, batch_size=batch_size)
+
+    if months:
+        # created_at is auto_now_add, so the dates go in afterwards with one executemany
+        ops = connection.ops
+        span = int(timedelta(days=30 * months).total_seconds())
+        dates = []
+        for row in rows:
+            created = now - timedelta(seconds=rng.randrange(span))
+            canceled = None if row.is_active else created + (now - created) * rng.random()
+            dates.append((ops.adapt_datetimefield_value(created), ops.adapt_datetimefield_value(canceled), row.pk))
+        quote = connection.ops.quote_name
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE {quote(Subscription._meta.db_table)} SET {quote('created_at')} = %s, {quote('canceled_at')} = %s WHERE {quote('id')} = %s",
+                dates,
+            )
+    return len(rows)
+
+
+def _insert_rows(model, fields, rows):
+    """ executemany() straight through the cursor; for millions of rows the ORM's per-object overhead dominates """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = ", ".join(quote(model._meta.get_field(field).column) for field in fields)
+    placeholders = ", ".join(["%s"] * len(fields))
+    with connection.cursor() as cursor:
+        cursor.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", rows)
+
+
+def create_transactions(users, count, months=24, seed=0, batch_size=10000, progress=None):
+    """
+    `count` transactions spread over the last `months` months, skewed so a few users are much busier.
+    The users must not have any transactions yet: their monthly rollups are written here directly
+    (the same totals analytics.rollups.rebuild() would compute, without re-reading everything).
+    """
+    rng = random.Random(seed)
+    ops = connection.ops
+    now = timezone.now()
+    span = int(timedelta(days=30 * months).total_seconds())
+    user_ids = [user.pk for user in users]
+    user_weights = [rng.paretovariate(1.5) for _ in user_ids]
+    types, type_weights = zip(*TYPE_WEIGHTS.items())
+    totals = defaultdict(lambda: [Decimal("0"), 0])
+
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        rows = []
+        for owner, kind in zip(rng.choices(user_ids, user_weights, k=size), rng.choices(types, type_weights, k=size)):
+            amount = Decimal(rng.randrange(100, 500000)) / 100
+            category = rng.choice(CATEGORIES[kind])
+            date = now - timedelta(seconds=rng.randrange(span))
+            rows.append((
+                owner, ops.adapt_decimalfield_value(amount, 10, 2), kind, category, None, ops.adapt_datetimefield_value(date),
+            ))
+            total = totals[(owner, rollups.month_start(date), kind, category)]
+            total[0] += amount
+            total[1] += 1
+        with transaction.atomic():
+            _insert_rows(Transaction, ["user", "amount", "type", "category", "description", "date"], rows)
+        created += size
+        if progress:
+            progress(created)
+
+    MonthlyRollup.objects.bulk_create([
+        MonthlyRollup(user_id=user_id, month=month, type=kind, category=category, total=total, count=number)
+        for (user_id, month, kind, category), (total, number) in totals.items()
+    ], batch_size=batch_size)
+    return created, len(totals)
+
+
+def seed(users=1000, transactions=1_000_000, months=24, seed=0, progress=None):
+    """ Seeds the current database; returns the created users and how many rows of each kind were written """
+    bench_users = create_users(users, seed=seed)
+    subscriptions = create_subscriptions(bench_users, seed=seed, months=months)
+    created, rollup_rows = create_transactions(bench_users, transactions, months=months, seed=seed, progress=progress)
+    return {"users": bench_users, "subscriptions": subscriptions, "transactions": created, "rollups": rollup_rows}
@@ -0,0 +1,159 @@
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from benchmarks import datagen
+from benchmarks.utils import bench_database, compare_results, summarize, write_results
+from subscriptions import stripe_gateway
+from subscriptions.fake_stripe import fake_stripe_process
+from subscriptions.models import Subscription
+
+API = "/api/auth"
+
+
+def months_ago(months):
+    today = timezone.now().date().replace(day=1)
+    year, month = divmod(today.year * 12 + today.month - 1 - months, 12)
+    return f"{year:04d}-{month + 1:02d}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the hot API endpoints against a seeded throwaway database and the fake Stripe server: "
+        "throughput, p50/p95/p99 latency and SQL queries per request."
+    )
+
+    # name -> (method, path, body); run in this order, subscribe last since it changes the subscriptions
+    ENDPOINTS = {
+        "subscriptions": ("GET", lambda: f"{API}/subscriptions/", None),
+        "subscription": ("GET", lambda: f"{API}/subscription/", None),
+        "transactions": ("GET", lambda: f"{API}/transactions/", None),
+        "transactions_filtered": (
+            "GET",
+            lambda: f"{API}/transactions/?type=expense&category=Rent&date_from={(timezone.now() - timedelta(days=365)).date()}",
+            None,
+        ),
+        "transactions_page2": ("GET", None, None), # path is the `next` link of each user's first page
+        "insights": ("GET", lambda: f"{API}/insights/?month={months_ago(1)}", None),
+        "insights_monthly": ("GET", lambda: f"{API}/insights/?from={months_ago(12)}&to={months_ago(0)}", None),
+        "insights_weekly": (
+            "GET", lambda: f"{API}/insights/?from={months_ago(3)}&to={months_ago(0)}&granularity=week", None,
+        ),
+        "dashboard": ("GET", lambda: f"{API}/dashboard/", None),
+        "dashboard_mobile": ("GET", lambda: f"{API}/dashboard/?fields=subscription.plan,insights.total_expenses,insights.total_revenue&limit=5", None),
+        "transaction_create": ("POST", lambda: f"{API}/transactions/", {"amount": "12.50", "type": "expense", "category": "Software"}),
+        "subscribe": ("POST", lambda: f"{API}/subscribe/", {"plan": "pro"}),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=500)
+        parser.add_argument("--transactions", type=int, default=500_000)
+        parser.add_argument("--months", type=int, default=24, help="Spread the transactions over this many months.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--requests", type=int, default=200, help="Measured requests per endpoint.")
+        parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests per endpoint first.")
+        parser.add_argument("--endpoint", action="append", choices=list(self.ENDPOINTS), help="Only these (repeatable).")
+        parser.add_argument("--stripe-latency-ms", type=float, default=50)
+        parser.add_argument("--json", dest="json_path", help="Also write the results to this file.")
+        parser.add_argument("--compare", metavar="PATH", help="Fail if slower / chattier than this earlier --json output.")
+        parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative p95 slowdown for --compare.")
+
+    def handle(self, *args, **options):
+        endpoints = [name for name in self.ENDPOINTS if name in (options["endpoint"] or self.ENDPOINTS)]
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as fh:
+                baseline = json.load(fh)
+
+        results = []
+        fake = fake_stripe_process(latency_ms=options["stripe_latency_ms"], price_ids=settings.STRIPE_PRICE_IDS)
+        with bench_database(), fake as fake_url:
+            stripe_gateway.set_gateway(stripe_gateway.StripeGateway("sk_test_fake", api_base=fake_url))
+            try:
+                started = time.perf_counter()
+                seeded = datagen.seed(
+                    users=options["users"], transactions=options["transactions"], months=options["months"],
+                    seed=options["seed"], progress=self.seed_progress,
+                )
+                self.stdout.write(
+                    f"Seeded {options['users']} users, {seeded['subscriptions']} subscriptions, "
+                    f"{seeded['transactions']} transactions and {seeded['rollups']} rollups "
+                    f"in {time.perf_counter() - started:.1f}s"
+                )
+
+                rng = random.Random(options["seed"])
+                users = rng.sample(seeded["users"], min(len(seeded["users"]), options["requests"] + options["warmup"]))
+                tokens = [f"Bearer {AccessToken.for_user(user)}" for user in users]
+                client = Client()
+                for name in endpoints:
+                    requests = self.prepare(name, client, users, tokens)
+                    result = self.run(client, requests, options["warmup"], options["requests"])
+                    results.append({"endpoint": name, **result})
+                    self.stdout.write(f"  {name}: {result['throughput_rps']} req/s, p95 {result['p95_ms']}ms")
+            finally:
+                stripe_gateway.set_gateway(None)
+
+        dataset = {"users": options["users"], "transactions": options["transactions"]}
+        results = [{**result, **dataset} for result in results]
+        write_results(self.stdout, results, options["json_path"])
+
+        if baseline is not None:
+            regressions = compare_results(baseline, results, "endpoint", options["threshold"])
+            if regressions:
+                raise CommandError("Regressions against {}:\n  {}".format(options["compare"], "\n  ".join(regressions)))
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['compare']}."))
+
+    def seed_progress(self, created):
+        if created % 100_000 == 0:
+            self.stdout.write(f"  {created} transactions")
+
+    def prepare(self, name, client, users, tokens):
+        """ Returns (method, path, body, token) tuples, cycling over the sampled users """
+        method, path, body = self.ENDPOINTS[name]
+        if name == "subscribe":
+            # A paid checkout needs a user without an active subscription; the customer already exists
+            Subscription.objects.filter(user__in=users).update(is_active=False)
+        if name == "transactions_page2":
+            paths = []
+            for token in tokens:
+                next_link = client.get(f"{API}/transactions/", headers={"Authorization": token}).json()["next"]
+                paths.append(next_link or f"{API}/transactions/")
+            return [(method, path, body, token) for path, token in zip(paths, tokens)]
+        return [(method, path(), body, token) for token in tokens]
+
+    def run(self, client, requests, warmup, count):
+        latencies, queries = [], []
+        errors = 0
+        for i in range(warmup):
+            self.request(client, *requests[i % len(requests)])
+
+        started = time.perf_counter()
+        for i in range(count):
+            method, path, body, token = requests[(warmup + i) % len(requests)]
+            request_started = time.perf_counter()
+            response = self.request(client, method, path, body, token)
+            latencies.append(time.perf_counter() - request_started)
+            # counted by the instrumentation middleware, so queries on the dashboard's pool threads are in there too
+            queries.append(response.wsgi_request.request_stats.db_queries)
+            if response.status_code >= 400:
+                errors += 1
+        wall = time.perf_counter() - started
+
+        return summarize(
+            latencies, wall, errors=errors,
+            queries_mean=round(statistics.fmean(queries), 2) if queries else 0.0,
+            queries_max=max(queries, default=0),
+        )
+
+    def request(self, client, method, path, body, token):
+        if method == "GET":
+            return client.get(path, headers={"Authorization": token})
+        return client.post(path, body, content_type="application/json", headers={"Authorization": token})
@@ -0,0 +1,89 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from benchmarks import datagen
+from benchmarks.management.commands.bench_api import Command as ApiBenchmark
+from benchmarks.utils import bench_database, write_results
+from config import instrumentation
+
+MIDDLEWARE = "config.instrumentation.InstrumentationMiddleware"
+ENDPOINTS = ["transactions", "insights", "dashboard", "transaction_create"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Overhead of the request instrumentation (metrics middleware + query wrapper): the same requests with "
+        "and without it, alternating rounds so drift hits both sides, reported as the relative change in "
+        "mean and median latency per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--transactions", type=int, default=100_000)
+        parser.add_argument("--requests", type=int, default=200, help="Measured requests per endpoint, mode and round.")
+        parser.add_argument("--rounds", type=int, default=5)
+        parser.add_argument("--endpoint", action="append", choices=ENDPOINTS, help="Only these (repeatable).")
+        parser.add_argument("--max-overhead", type=float, help="Fail if the median overhead (%%) is above this.")
+        parser.add_argument("--json", dest="json_path", help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        if MIDDLEWARE not in settings.MIDDLEWARE:
+            raise CommandError(f"{MIDDLEWARE} isn't in MIDDLEWARE, nothing to measure.")
+        endpoints = options["endpoint"] or ENDPOINTS
+        api = ApiBenchmark(stdout=self.stdout)
+        results = []
+        with bench_database():
+            seeded = datagen.seed(users=options["users"], transactions=options["transactions"])
+            users = random.Random(0).sample(seeded["users"], min(options["users"], options["requests"] + 10))
+            tokens = [f"Bearer {AccessToken.for_user(user)}" for user in users]
+            for name in endpoints:
+                requests = api.prepare(name, Client(), users, tokens)
+                latencies = {"off": [], "on": []}
+                for _ in range(options["rounds"]):
+                    for mode in ("off", "on"):
+                        latencies[mode].extend(self.measure(mode, requests, options["requests"]))
+                results.append(self.compare(name, latencies))
+                self.stdout.write(f"  {name}: {results[-1]['median_overhead_pct']}% median overhead")
+
+        write_results(self.stdout, results, options["json_path"])
+        limit = options["max_overhead"]
+        if limit is not None and any(result["median_overhead_pct"] > limit for result in results):
+            raise CommandError(f"Instrumentation overhead above {limit}%.")
+
+    def measure(self, mode, requests, count):
+        middleware = settings.MIDDLEWARE if mode == "on" else [name for name in settings.MIDDLEWARE if name != MIDDLEWARE]
+        with override_settings(MIDDLEWARE=middleware):
+            if mode == "off":
+                instrumentation.uninstall() # no query wrapper either
+            client = Client() # builds its handler, and so the middleware chain, from the settings above
+            latencies = []
+            for i in range(count + 5): # the first few warm the new handler up
+                method, path, body, token = requests[i % len(requests)]
+                started = time.perf_counter()
+                if method == "GET":
+                    client.get(path, headers={"Authorization": token})
+                else:
+                    client.post(path, body, content_type="application/json", headers={"Authorization": token})
+                latencies.append(time.perf_counter() - started)
+            return latencies[5:]
+
+    def compare(self, name, latencies):
+        off, on = latencies["off"], latencies["on"]
+        mean_off, mean_on = statistics.fmean(off), statistics.fmean(on)
+        median_off, median_on = statistics.median(off), statistics.median(on)
+        return {
+            "endpoint": name,
+            "requests": len(on),
+            "mean_ms_off": round(mean_off * 1000, 3),
+            "mean_ms_on": round(mean_on * 1000, 3),
+            "mean_overhead_pct": round((mean_on / mean_off - 1) * 100, 2),
+            "p50_ms_off": round(median_off * 1000, 3),
+            "p50_ms_on": round(median_on * 1000, 3),
+            "median_overhead_pct": round((median_on / median_off - 1) * 100, 2),
+        }
@@ -0,0 +1,120 @@
+import random
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from rest_framework_simplejwt.tokens import AccessToken
+
+from authentication import hashing, throttling
+from authentication.views import LoginView
+from benchmarks import datagen
+from benchmarks.utils import bench_database, summarize, write_results
+
+API = "/api/auth"
+
+
+class Command(BaseCommand):
+    help = (
+        "Credential-stuffing drill: attacker threads hammer /login/ with wrong passwords while regular users load "
+        "the dashboard and sign in. Compares the unprotected login path (no throttles, hashing on the request "
+        "threads) with the protected one (sliding-window throttles + bounded hashing pool)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per mode.")
+        parser.add_argument("--attackers", type=int, default=16, help="Concurrent attacker threads.")
+        parser.add_argument("--attack-ips", type=int, default=8, help="Distinct source IPs the attack rotates through.")
+        parser.add_argument("--users", type=int, default=4, help="Concurrent regular users.")
+        parser.add_argument("--mode", choices=["unprotected", "protected", "both"], default="both")
+        parser.add_argument("--json", dest="json_path", help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        modes = ["unprotected", "protected"] if options["mode"] == "both" else [options["mode"]]
+        results = []
+        with bench_database():
+            users = datagen.create_users(max(options["users"], 50))
+            datagen.create_transactions(users, 20_000)
+            for mode in modes:
+                results.extend(self.run_mode(mode, users, options))
+                self.stdout.write(f"  {mode} done")
+
+        write_results(self.stdout, results, options["json_path"])
+
+    def run_mode(self, mode, users, options):
+        original_throttles, original_pool = LoginView.throttle_classes, hashing.pool
+        store = throttling.get_store()
+        if isinstance(store, throttling.LocalStore):
+            store.clear() # each mode starts with fresh counters
+        if mode == "unprotected":
+            LoginView.throttle_classes = []
+            # one slot per thread: as if every request hashed inline on its own worker thread
+            threads = options["attackers"] + options["users"]
+            hashing.pool = hashing.HashingPool(workers=threads, max_pending=threads, reserved=0, per_client=threads)
+
+        stop = threading.Event()
+        samples = {"attack": [], "login": [], "dashboard": []}
+        statuses = {"attack": Counter(), "login": Counter(), "dashboard": Counter()}
+        lock = threading.Lock()
+
+        def record(kind, started, response):
+            with lock:
+                samples[kind].append(time.perf_counter() - started)
+                statuses[kind][response.status_code] += 1
+
+        accounts = users[options["users"]:]
+
+        def attacker(number):
+            client = Client()
+            rng = random.Random(number)
+            while not stop.is_set():
+                # leaked addresses, some of them real accounts (not the regular users', whose latency we measure)
+                target = rng.choice(accounts).email if rng.random() < 0.3 else f"leaked{rng.randrange(10 ** 6)}@example.com"
+                started = time.perf_counter()
+                response = client.post(
+                    f"{API}/login/", {"email": target, "password": "hunter2"}, content_type="application/json",
+                    REMOTE_ADDR=f"203.0.113.{number % options['attack_ips'] + 1}",
+                )
+                record("attack", started, response)
+
+        def regular_user(number):
+            client = Client()
+            user = users[number]
+            token = f"Bearer {AccessToken.for_user(user)}"
+            next_login = time.monotonic() + 1
+            while not stop.is_set():
+                started = time.perf_counter()
+                if time.monotonic() >= next_login: # mostly dashboard reads, a sign-in every couple of seconds
+                    next_login = time.monotonic() + 2
+                    response = client.post(
+                        f"{API}/login/", {"email": user.email, "password": datagen.PASSWORD},
+                        content_type="application/json", REMOTE_ADDR=f"198.51.100.{number + 1}",
+                    )
+                    record("login", started, response)
+                else:
+                    response = client.get(f"{API}/transactions/?page_size=20", headers={"Authorization": token})
+                    record("dashboard", started, response)
+
+        workers = [threading.Thread(target=attacker, args=(i,)) for i in range(options["attackers"])]
+        workers += [threading.Thread(target=regular_user, args=(i,)) for i in range(options["users"])]
+        started = time.perf_counter()
+        try:
+            for worker in workers:
+                worker.start()
+            time.sleep(options["duration"])
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join()
+            LoginView.throttle_classes, hashing.pool = original_throttles, original_pool
+        wall = time.perf_counter() - started
+
+        results = []
+        for kind in ("dashboard", "login", "attack"):
+            codes = {str(code): count for code, count in sorted(statuses[kind].items())}
+            # "errors" here are anything unexpected: attackers are meant to get 400/429/503
+            expected = {"200"} if kind != "attack" else {"400", "429", "503"}
+            errors = sum(count for code, count in codes.items() if code not in expected)
+            results.append({"mode": mode, "traffic": kind, **summarize(samples[kind], wall, errors=errors), "statuses": codes})
+        return results
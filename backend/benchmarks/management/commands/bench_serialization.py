@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from analytics.models import Transaction
+from analytics.serializers import TransactionSerializer, transaction_rows
+from benchmarks import datagen
+from benchmarks.utils import bench_database, write_results
+from config.renderers import FastJSONRenderer, orjson
+
+
+class Command(BaseCommand):
+    help = (
+        "Rows per second of turning transactions into a JSON response body: the stock path (model instances, "
+        "TransactionSerializer, DRF's JSONRenderer) against the lean one (values_list rows, the row "
+        "encoder, FastJSONRenderer). Both must produce the same bytes (transactions have no floats, the one type "
+        "the two renderers can format differently)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, action="append", help="Row counts to measure (repeatable; default 10000 and 100000).")
+        parser.add_argument("--repeat", type=int, default=3, help="Best of this many runs per path.")
+        parser.add_argument("--json", dest="json_path", help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        sizes = options["rows"] or [10_000, 100_000]
+        if orjson is None:
+            self.stdout.write("orjson isn't installed: FastJSONRenderer falls back to the stock renderer.")
+        results = []
+        with bench_database():
+            datagen.create_transactions(datagen.create_users(10), max(sizes))
+            for size in sizes:
+                queryset = Transaction.objects.order_by("-date", "-id")[:size]
+                stock = self.measure(options["repeat"], lambda: list(queryset.all()),
+                                     lambda rows: TransactionSerializer(rows, many=True).data, JSONRenderer().render)
+                lean = self.measure(options["repeat"], lambda: list(queryset.values_list(*transaction_rows.columns)),
+                                    transaction_rows.many, FastJSONRenderer().render)
+                if stock.pop("body") != lean.pop("body"):
+                    raise CommandError(f"The two paths disagree at {size} rows.")
+                for path, timings in (("stock", stock), ("lean", lean)):
+                    results.append({"rows": size, "path": path, **timings})
+                results[-1]["speedup"] = round(stock["total_s"] / lean["total_s"], 2)
+                self.stdout.write(
+                    f"  {size} rows: {stock['rows_per_s']} -> {lean['rows_per_s']} rows/s ({results[-1]['speedup']}x)"
+                )
+
+        write_results(self.stdout, results, options["json_path"])
+
+    def measure(self, repeat, fetch, encode, render):
+        """ Best of `repeat` runs of each stage (fetching, encoding the rows, rendering the JSON) """
+        best = {"fetch_s": float("inf"), "encode_s": float("inf"), "render_s": float("inf")}
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = fetch()
+            fetched = time.perf_counter()
+            data = encode(rows)
+            encoded = time.perf_counter()
+            body = render(data)
+            rendered = time.perf_counter()
+            for stage, seconds in (("fetch_s", fetched - started), ("encode_s", encoded - fetched), ("render_s", rendered - encoded)):
+                best[stage] = min(best[stage], seconds)
+        total = sum(best.values())
+        return {
+            **{stage: round(seconds, 4) for stage, seconds in best.items()},
+            "total_s": round(total, 4),
+            "rows_per_s": round(len(rows) / total),
+            "body": body,
+        }
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.test import Client
+from rest_framework_simplejwt.tokens import AccessToken
+
+from benchmarks import datagen
+from benchmarks.utils import bench_database, summarize, write_results
+from config.sqlite import writes
+
+API = "/api/auth"
+MODES = ["shipped", "tuned", "queued"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Write throughput of SQLite with N concurrent clients creating transactions through the API, on a "
+        "database file: as shipped (rollback journal, full fsync, deferred transactions), tuned (the "
+        "SQLITE_PRODUCTION pragmas and BEGIN IMMEDIATE) and queued (tuned plus the single-writer queue)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=16, help="Concurrent clients.")
+        parser.add_argument("--writes", type=int, default=50, help="Transactions each client creates per mode.")
+        parser.add_argument("--mode", choices=MODES + ["all"], default="all")
+        parser.add_argument("--json", dest="json_path", help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("This benchmark is about SQLite; DATABASE_URL points elsewhere.")
+        modes = MODES if options["mode"] == "all" else [options["mode"]]
+        original = connection.settings_dict["OPTIONS"], writes.enabled
+        results = []
+        with tempfile.TemporaryDirectory() as directory, bench_database(name=os.path.join(directory, "bench.sqlite3")):
+            users = datagen.create_users(options["clients"])
+            try:
+                for mode in modes:
+                    self.configure(mode)
+                    results.append(self.run_mode(mode, users, options))
+                    self.stdout.write(f"  {mode}: {results[-1]['throughput_rps']} writes/s, p95 {results[-1]['p95_ms']}ms")
+            finally:
+                writes.stop()
+                connection.close()
+                connection.settings_dict["OPTIONS"], writes.enabled = original
+
+        write_results(self.stdout, results, options["json_path"])
+
+    def configure(self, mode):
+        writes.stop() # its connection was opened with the previous mode's options
+        connection.close()
+        # the settings every thread's connection is created from
+        connection.settings_dict["OPTIONS"] = {} if mode == "shipped" else dict(settings.SQLITE_OPTIONS)
+        writes.enabled = mode == "queued"
+        if mode == "shipped":
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA journal_mode=delete") # WAL sticks to the file once a tuned run set it
+
+    def run_mode(self, mode, users, options):
+        latencies, statuses = [], Counter()
+        lock = threading.Lock()
+        start = threading.Barrier(len(users) + 1)
+
+        def client(user):
+            api = Client(headers={"Authorization": f"Bearer {AccessToken.for_user(user)}"})
+            start.wait()
+            try:
+                for number in range(options["writes"]):
+                    began = time.perf_counter()
+                    try:
+                        response = api.post(f"{API}/transactions/", {
+                            "amount": "12.50", "type": "expense", "category": "groceries",
+                            "description": f"bench {number}", "date": "2026-01-15",
+                        }, content_type="application/json")
+                        status = response.status_code
+                    except OperationalError: # "database is locked"
+                        status = "locked"
+                    with lock:
+                        latencies.append(time.perf_counter() - began)
+                        statuses[status] += 1
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=client, args=(user,)) for user in users]
+        for worker in workers:
+            worker.start()
+        start.wait()
+        began = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        wall = time.perf_counter() - began
+
+        codes = {str(code): count for code, count in sorted(statuses.items(), key=str)}
+        errors = sum(count for code, count in codes.items() if code != "201")
+        return {"mode": mode, "clients": len(users), **summarize(latencies, wall, errors=errors), "statuses": codes}
@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from benchmarks.utils import bench_database, summarize, write_results
+from subscriptions import catalog, stripe_gateway
+from subscriptions.fake_stripe import fake_stripe_process
+from subscriptions.models import Subscription
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the sync and async subscription views under concurrent load, in-process through Django's "
+        "ASGI handler, against the fake Stripe server with artificial latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Requests per scenario and mode.")
+        parser.add_argument("--concurrency", type=int, default=100)
+        parser.add_argument("--stripe-latency-ms", type=float, default=150)
+        parser.add_argument("--scenario", choices=["subscribe", "upgrade", "all"], default="all")
+        parser.add_argument("--json", dest="json_path", help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        scenarios = ["subscribe", "upgrade"] if options["scenario"] == "all" else [options["scenario"]]
+        results = []
+
+        fake = fake_stripe_process(latency_ms=options["stripe_latency_ms"], price_ids=settings.STRIPE_PRICE_IDS)
+        with bench_database(), fake as fake_url, override_settings(ROOT_URLCONF="benchmarks.urls"):
+            stripe_gateway.set_gateway(stripe_gateway.StripeGateway(
+                "sk_test_fake", api_base=fake_url, pool_size=options["concurrency"], async_pool_size=options["concurrency"],
+            ))
+            try:
+                tokens = self.create_users(options["requests"])
+                catalog.get_price(settings.STRIPE_PRICE_IDS["enterprise"]) # warm the catalog cache for upgrades
+                catalog.get_product(f"prod_{settings.STRIPE_PRICE_IDS['enterprise']}")
+
+                for scenario in scenarios:
+                    for mode in ("sync", "async"):
+                        result = asyncio.run(self.run(scenario, mode, tokens, options["concurrency"]))
+                        results.append({"scenario": scenario, "mode": mode, "concurrency": options["concurrency"], **result})
+            finally:
+                stripe_gateway.set_gateway(None)
+
+        write_results(self.stdout, results, options["json_path"])
+        for scenario in scenarios:
+            sync_rps, async_rps = (r["throughput_rps"] for r in results if r["scenario"] == scenario)
+            self.stdout.write(self.style.SUCCESS(f"{scenario}: async is {async_rps / sync_rps:.1f}x the sync throughput"))
+
+    def create_users(self, count):
+        """ Users with a Stripe customer and an active paid subscription, both created on the fake server """
+        User.objects.bulk_create([
+            User(username=f"load{i}", email=f"load{i}@example.com", password="!") for i in range(count)
+        ])
+        tokens = []
+        subscriptions = []
+        for user in User.objects.filter(username__startswith="load"):
+            customer = stripe_gateway.call("Customer.create", email=user.email)
+            stripe_sub = stripe_gateway.call(
+                "Subscription.create", customer=customer["id"], items=[{"price": settings.STRIPE_PRICE_IDS["pro"]}]
+            )
+            user.stripe_customer_id = customer["id"]
+            subscriptions.append(Subscription(
+                user=user, stripe_customer_id=customer["id"], stripe_subscription_id=stripe_sub["id"],
+                plan="pro", is_active=True, status="active",
+            ))
+            tokens.append((user, str(AccessToken.for_user(user))))
+        User.objects.bulk_update([user for user, _ in tokens], ["stripe_customer_id"])
+        Subscription.objects.bulk_create(subscriptions)
+        return tokens
+
+    async def run(self, scenario, mode, tokens, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        errors = 0
+
+        if scenario == "subscribe":
+            # A paid checkout only needs an existing customer and no active subscription
+            await Subscription.objects.filter(user__username__startswith="load").aupdate(is_active=False)
+            path, body = f"/bench/{mode}/subscribe/", {"plan": "pro"}
+        else:
+            await Subscription.objects.filter(user__username__startswith="load").aupdate(is_active=True)
+            path, body = f"/bench/{mode}/upgrade/", {"price_id": settings.STRIPE_PRICE_IDS["enterprise"]}
+
+        async def one(token):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(path, body, content_type="application/json", headers={"Authorization": f"Bearer {token}"})
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(token) for _, token in tokens))
+        return summarize(latencies, time.perf_counter() - started, errors=errors)
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+
+from benchmarks import datagen
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills the configured database with synthetic users, subscriptions and transactions, for profiling the "
+        f"dev server by hand. Users are named {datagen.USERNAME_PREFIX}00000000... with password '{datagen.PASSWORD}'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--transactions", type=int, default=1_000_000)
+        parser.add_argument("--months", type=int, default=24, help="Spread the transactions over this many months.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if get_user_model().objects.filter(username__startswith=datagen.USERNAME_PREFIX).exists():
+            raise CommandError("This database already has benchmark users; start from a fresh one.")
+
+        started = time.perf_counter()
+        seeded = datagen.seed(
+            users=options["users"],
+            transactions=options["transactions"],
+            months=options["months"],
+            seed=options["seed"],
+            progress=self.progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(seeded['users'])} users, {seeded['subscriptions']} subscriptions, "
+            f"{seeded['transactions']} transactions and {seeded['rollups']} rollups "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
+
+    def progress(self, created):
+        if created % 100_000 == 0:
+            self.stdout.write(f"  {created} transactions")
@@ -0,0 +1,20 @@
+""" URLconf used by the load tests: the sync and async subscription views side by side """
+from django.urls import include, path
+
+from subscriptions import async_views
+from subscriptions.views import (
+    CancelSubscriptionView, CreateSubscriptionView, ListUserSubscriptionsView, UpgradeSubscriptionView,
+)
+
+urlpatterns = [
+    path("api/auth/", include("authentication.urls")),
+    path("api/auth/", include("analytics.urls")),
+    path("bench/sync/subscribe/", CreateSubscriptionView.as_view()),
+    path("bench/sync/upgrade/", UpgradeSubscriptionView.as_view()),
+    path("bench/sync/subscriptions/", ListUserSubscriptionsView.as_view()),
+    path("bench/sync/cancel/", CancelSubscriptionView.as_view()),
+    path("bench/async/subscribe/", async_views.create_subscription),
+    path("bench/async/upgrade/", async_views.upgrade_subscription),
+    path("bench/async/subscriptions/", async_views.list_subscriptions),
+    path("bench/async/cancel/", async_views.cancel_subscription),
+]
@@ -0,0 +1,78 @@
+"""
+Shared helpers for the benchmark / load-test management commands.
+
+Every command runs against a throwaway test database (never the configured one) and reports the same
+summary fields, optionally as JSON so runs can be diffed.
+"""
+import json
+import statistics
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def bench_database(keepdb=False, name=None):
+    """ Creates (and afterwards destroys) a test database, like the test runner does; `name` overrides TEST NAME """
+    if name is not None:
+        connection.settings_dict["TEST"]["NAME"] = name # e.g. a file instead of SQLite's in-memory test database
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, wall_seconds, errors=0, **extra):
+    """ latencies in seconds -> the summary dict every benchmark reports """
+    summary = {
+        "requests": len(latencies),
+        "errors": errors,
+        "wall_s": round(wall_seconds, 3),
+        "throughput_rps": round(len(latencies) / wall_seconds, 1) if wall_seconds else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+    summary.update(extra)
+    return summary
+
+
+def write_results(stdout, results, json_path=None):
+    """ Prints one line per result and optionally dumps everything to `json_path` """
+    for result in results:
+        stdout.write("  ".join(f"{key}={value}" for key, value in result.items()))
+    if json_path:
+        with open(json_path, "w") as fh:
+            json.dump(results, fh, indent=2, default=str)
+        stdout.write(f"Results written to {json_path}")
+
+
+def compare_results(baseline, results, key, threshold=0.25):
+    """
+    Regressions of `results` against an earlier run: p95 latency more than `threshold` (relative) slower, or
+    more queries per request. Rows are matched on `key` (e.g. "endpoint"); returns a list of messages.
+    """
+    previous = {row[key]: row for row in baseline}
+    regressions = []
+    for row in results:
+        before = previous.get(row[key])
+        if before is None:
+            continue
+        if before.get("p95_ms") and row["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append(f"{row[key]}: p95 {before['p95_ms']}ms -> {row['p95_ms']}ms")
+        if "queries_mean" in before and row.get("queries_mean", 0) > before["queries_mean"]:
+            regressions.append(f"{row[key]}: queries/request {before['queries_mean']} -> {row['queries_mean']}")
+    return regressions
@@ -0,0 +1,326 @@
+"""
+Request metrics, served in the Prometheus text format at /metrics.
+
+InstrumentationMiddleware records per endpoint (method + URL pattern): a latency histogram, the status codes,
+a response size histogram, and the number and time of the database queries (an execute wrapper on every
+connection) and Stripe calls (reported by the Stripe gateway). Queries and Stripe calls are added up in a
+per-request object held in a contextvar, so work handed to the dashboard's pool or the SQLite writer counts
+for the request too.
+
+Counters live in per-thread shards, so recording never takes a lock; /metrics adds the shards up and folds
+in those of threads that have exited. Everything is per process: with several workers, scrape each one.
+
+/metrics needs METRICS_TOKEN as a bearer token; without one set, it's only served when DEBUG is on.
+
+With SLOW_REQUEST_MS set, slower requests are logged (logger "instrumentation.slow") along with their SQL.
+"""
+import hmac
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+
+from subscriptions import stripe_gateway
+
+logger = logging.getLogger("instrumentation.slow")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # seconds
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576) # bytes
+METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+SLOW_REQUEST_SECONDS = getattr(settings, "SLOW_REQUEST_MS", 0) / 1000 or None
+MAX_LOGGED_QUERIES = 100
+
+_current = ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    """ What one request spent on the database and Stripe """
+    __slots__ = ("db_queries", "db_seconds", "stripe_calls", "stripe_seconds", "queries")
+
+    def __init__(self, capture_sql=False):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.stripe_calls = 0
+        self.stripe_seconds = 0.0
+        self.queries = [] if capture_sql else None # (seconds, sql) for the slow request log
+
+
+class EndpointStats:
+    __slots__ = ("statuses", "latency", "latency_sum", "sizes", "size_sum",
+                 "db_queries", "db_seconds", "stripe_calls", "stripe_seconds")
+
+    def __init__(self):
+        self.statuses = {} # status code -> requests
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1) # per bucket (not cumulative), the last one is +Inf
+        self.latency_sum = 0.0
+        self.sizes = [0] * (len(SIZE_BUCKETS) + 1)
+        self.size_sum = 0
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.stripe_calls = 0
+        self.stripe_seconds = 0.0
+
+    def merge(self, other):
+        for status, count in list(other.statuses.items()):
+            self.statuses[status] = self.statuses.get(status, 0) + count
+        self.latency = [a + b for a, b in zip(self.latency, other.latency)]
+        self.sizes = [a + b for a, b in zip(self.sizes, other.sizes)]
+        for name in ("latency_sum", "size_sum", "db_queries", "db_seconds", "stripe_calls", "stripe_seconds"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+
+def _bucket(buckets, value):
+    for index, bound in enumerate(buckets):
+        if value <= bound:
+            return index
+    return len(buckets)
+
+
+class Registry:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = [] # (thread, {(method, route): EndpointStats}) of the threads that recorded something
+        self._retired = {} # what exited threads recorded
+        self._lock = threading.Lock() # only taken to add a shard and to collect
+
+    def _shard(self):
+        try:
+            return self._local.endpoints
+        except AttributeError:
+            endpoints = self._local.endpoints = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), endpoints))
+            return endpoints
+
+    def record(self, method, route, status, seconds, size, stats):
+        endpoints = self._shard()
+        endpoint = endpoints.get((method, route))
+        if endpoint is None:
+            endpoint = endpoints[(method, route)] = EndpointStats()
+        endpoint.statuses[status] = endpoint.statuses.get(status, 0) + 1
+        endpoint.latency[_bucket(LATENCY_BUCKETS, seconds)] += 1
+        endpoint.latency_sum += seconds
+        if size is not None:
+            endpoint.sizes[_bucket(SIZE_BUCKETS, size)] += 1
+            endpoint.size_sum += size
+        endpoint.db_queries += stats.db_queries
+        endpoint.db_seconds += stats.db_seconds
+        endpoint.stripe_calls += stats.stripe_calls
+        endpoint.stripe_seconds += stats.stripe_seconds
+
+    def collect(self):
+        """ {(method, route): EndpointStats} over every thread """
+        with self._lock:
+            alive = []
+            for thread, endpoints in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, endpoints))
+                else:
+                    _merge_into(self._retired, endpoints)
+            self._shards = alive
+            total = _merge_into({}, self._retired)
+            for _, endpoints in alive:
+                _merge_into(total, endpoints)
+        return total
+
+    def clear(self):
+        with self._lock:
+            self._retired.clear()
+            for _, endpoints in self._shards:
+                endpoints.clear()
+
+
+def _merge_into(target, endpoints):
+    for key, endpoint in list(endpoints.items()):
+        target.setdefault(key, EndpointStats()).merge(endpoint)
+    return target
+
+
+registry = Registry()
+
+
+def record_query(execute, sql, params, many, context):
+    """ Execute wrapper on every connection: adds the query to the current request's stats """
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.db_queries += 1
+        stats.db_seconds += elapsed
+        if stats.queries is not None and len(stats.queries) < MAX_LOGGED_QUERIES:
+            stats.queries.append((elapsed, sql))
+
+
+def record_stripe_call(seconds):
+    """ Called by the Stripe gateway for every attempt """
+    stats = _current.get()
+    if stats is not None:
+        stats.stripe_calls += 1
+        stats.stripe_seconds += seconds
+
+
+def _add_wrapper(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def _connection_created(sender, connection, **kwargs):
+    _add_wrapper(connection)
+
+
+def install():
+    """ Wraps every database connection from now on (and the ones this thread already has) """
+    connection_created.connect(_connection_created, dispatch_uid="instrumentation")
+    for connection in connections.all(initialized_only=True):
+        _add_wrapper(connection)
+
+
+def uninstall():
+    connection_created.disconnect(dispatch_uid="instrumentation")
+    for connection in connections.all(initialized_only=True):
+        if record_query in connection.execute_wrappers:
+            connection.execute_wrappers.remove(record_query)
+
+
+class InstrumentationMiddleware:
+    """ Goes first in MIDDLEWARE so the latency covers the whole stack """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        install()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = request.request_stats = RequestStats(capture_sql=SLOW_REQUEST_SECONDS is not None) # also for bench_api
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = request.request_stats = RequestStats(capture_sql=SLOW_REQUEST_SECONDS is not None)
+        token = _current.set(stats) # sync_to_async copies the context, so the sync parts add to the same stats
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    def record(self, request, response, elapsed, stats):
+        match = request.resolver_match
+        route = "/" + match.route if match else "unmatched" # 404s would otherwise add a label per path
+        method = request.method if request.method in METHODS else "other"
+        size = None if response.streaming else len(response.content) # streams are still to be sent
+        registry.record(method, route, str(response.status_code), elapsed, size, stats)
+
+        if SLOW_REQUEST_SECONDS is not None and elapsed >= SLOW_REQUEST_SECONDS:
+            log_slow_request(request, response, elapsed, stats)
+
+
+def log_slow_request(request, response, elapsed, stats):
+    queries = "".join(f"\n  {seconds * 1000:8.2f} ms  {sql}" for seconds, sql in stats.queries)
+    logger.warning(
+        "Slow request: %s %s -> %s in %.0f ms; %d queries (%.0f ms), %d Stripe calls (%.0f ms)%s",
+        request.method, request.get_full_path(), response.status_code, elapsed * 1000,
+        stats.db_queries, stats.db_seconds * 1000, stats.stripe_calls, stats.stripe_seconds * 1000, queries,
+    )
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _histogram(lines, name, buckets, counts, total, labels):
+    cumulative = 0
+    for bound, count in zip(list(buckets) + ["+Inf"], counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+    lines.append(f"{name}_sum{_labels(**labels)} {total}")
+    lines.append(f"{name}_count{_labels(**labels)} {cumulative}")
+
+
+def render():
+    """ The Prometheus text exposition of everything recorded so far """
+    endpoints = sorted(registry.collect().items())
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    family("http_requests_total", "counter", "Requests by endpoint and status code.")
+    for (method, route), endpoint in endpoints:
+        for status, count in sorted(endpoint.statuses.items()):
+            lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+
+    family("http_request_duration_seconds", "histogram", "Time from the first to the last middleware.")
+    for (method, route), endpoint in endpoints:
+        _histogram(lines, "http_request_duration_seconds", LATENCY_BUCKETS, endpoint.latency, endpoint.latency_sum,
+                   {"method": method, "route": route})
+
+    family("http_response_size_bytes", "histogram", "Response body sizes (streamed responses aren't counted).")
+    for (method, route), endpoint in endpoints:
+        _histogram(lines, "http_response_size_bytes", SIZE_BUCKETS, endpoint.sizes, endpoint.size_sum,
+                   {"method": method, "route": route})
+
+    for name, attribute, help_text in (
+        ("http_request_db_queries_total", "db_queries", "Database queries run by requests."),
+        ("http_request_db_seconds_total", "db_seconds", "Time requests spent in database queries."),
+        ("http_request_stripe_calls_total", "stripe_calls", "Stripe API calls (attempts) made by requests."),
+        ("http_request_stripe_seconds_total", "stripe_seconds", "Time requests spent waiting for Stripe."),
+    ):
+        family(name, "counter", help_text)
+        for (method, route), endpoint in endpoints:
+            lines.append(f"{name}{_labels(method=method, route=route)} {getattr(endpoint, attribute)}")
+
+    # the gateway's own numbers also cover calls made outside requests (commands, webhooks processing)
+    operations = sorted(stripe_gateway.get_gateway().snapshot().items())
+    for name, key, help_text in (
+        ("stripe_api_calls_total", "count", "Stripe API attempts by operation."),
+        ("stripe_api_errors_total", "errors", "Failed Stripe API attempts by operation."),
+        ("stripe_api_retries_total", "retries", "Stripe API attempts that were retries."),
+        ("stripe_api_seconds_total", "total_seconds", "Time spent in Stripe API attempts."),
+    ):
+        family(name, "counter", help_text)
+        for operation, stats in operations:
+            lines.append(f"{name}{_labels(operation=operation)} {stats[key]}")
+
+    return "\n".join(lines) + "\n"
+
+
+@require_GET
+def metrics_view(request):
+    """ /metrics; scrapers have to send METRICS_TOKEN as a bearer token. Without a token it's only served with DEBUG on. """
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if not token:
+        if not settings.DEBUG:
+            raise Http404()
+    elif not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponse("Unauthorized\n", status=401, content_type="text/plain")
+    return HttpResponse(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
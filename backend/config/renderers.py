@@ -0,0 +1,189 @@
+"""
+Fast JSON for the API.
+
+FastJSONRenderer, the default renderer, encodes with orjson when it's installed and writes the same JSON
+values as DRF's JSONRenderer: whatever orjson doesn't encode natively (Decimal, datetime, lazy strings,
+querysets, ...) goes through DRF's own encoder, so a Decimal is still a number and an aware UTC datetime still
+ends in "Z". The bytes aren't always identical: orjson writes some floats differently (1e16, not 1e+16).
+Data with NaN or infinity, and anything orjson can't encode at all (e.g. integers wider than 64 bits), is
+handed to the stock renderer, which refuses the former under STRICT_JSON. Without orjson, or when the client
+asks for indented output, it is the stock renderer.
+
+RowEncoder is for long lists: it turns values_list() rows into exactly what a ModelSerializer makes of the
+instances, with the per-field conversions worked out once rather than per row.
+"""
+import datetime
+import decimal
+import math
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError: # falls back to the stock renderer
+    orjson = None
+
+_default = JSONEncoder().default
+if orjson is not None:
+    _options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS # datetimes are formatted DRF's way by _default
+
+
+_SCALARS = {str, int, bool, type(None)}
+
+
+def _non_finite(data):
+    """ Whether data holds a NaN or infinite float anywhere in its dicts / lists """
+    pending = [data]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, dict):
+            items = value.values()
+        elif isinstance(value, (list, tuple)):
+            items = value
+        else: # a float subclass; anything else is left to the encoder
+            if isinstance(value, float) and not math.isfinite(value):
+                return True
+            continue
+        for item in items:
+            kind = type(item)
+            if kind is float:
+                if not math.isfinite(item):
+                    return True
+            elif kind not in _SCALARS: # the common values are skipped without an isinstance() chain
+                pending.append(item)
+    return False
+
+
+def dumps(data, strict=None):
+    """ data as compact UTF-8 JSON bytes, the way JSONRenderer would write it """
+    strict = api_settings.STRICT_JSON if strict is None else strict
+    if orjson is None:
+        return _stock_dumps(data, strict)
+    try:
+        output = orjson.dumps(data, default=_default, option=_options)
+    except orjson.JSONEncodeError: # e.g. an int over 64 bits, which json handles
+        return _stock_dumps(data, strict)
+    # orjson writes NaN and infinity as null, where the stock renderer raises (STRICT_JSON) or writes NaN;
+    # only look for them when there's a null to explain
+    if b"null" in output and _non_finite(data):
+        return _stock_dumps(data, strict)
+    # like JSONRenderer, keep the output a strict subset of JavaScript
+    return output.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+def _stock_dumps(data, strict):
+    renderer = JSONRenderer()
+    renderer.strict = strict
+    return renderer.render(data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if orjson is None or self.ensure_ascii or not self.compact or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data, self.strict)
+
+
+def _decimal(field):
+    """ DecimalField.to_representation with the quantizing context built once """
+    if field.decimal_places is None:
+        quantize = decimal.Decimal
+    else:
+        exponent = decimal.Decimal(".1") ** field.decimal_places
+        context = decimal.getcontext().copy()
+        if field.max_digits is not None:
+            context.prec = field.max_digits
+
+        def quantize(value):
+            return decimal.Decimal(value).quantize(exponent, rounding=field.rounding, context=context)
+    if not getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING):
+        return quantize # the renderer turns it into a number
+    return lambda value: format(quantize(value), "f")
+
+
+def _iso_8601(field, setting):
+    if getattr(field, "format", setting) != ISO_8601:
+        raise ValueError(f"{field.field_name}: only ISO 8601 output is supported")
+
+
+def _date(field):
+    _iso_8601(field, api_settings.DATE_FORMAT)
+    return datetime.date.isoformat
+
+
+def _datetime(field):
+    """ DateTimeField.to_representation: in the field's (or the request's) time zone, UTC written as "Z" """
+    _iso_8601(field, api_settings.DATETIME_FORMAT)
+    fixed_timezone = getattr(field, "timezone", None)
+
+    def convert(value, current_timezone):
+        target = fixed_timezone or current_timezone
+        if value.tzinfo is not None and target is not None and value.tzinfo is not target:
+            value = value.astimezone(target)
+        representation = value.isoformat()
+        return representation[:-6] + "Z" if representation.endswith("+00:00") else representation
+    convert.needs_timezone = True
+    return convert
+
+
+# Field class -> factory of the conversion for a raw column value (None: the value is used as it is)
+CONVERTERS = {
+    serializers.DecimalField: _decimal,
+    serializers.DateTimeField: _datetime,
+    serializers.DateField: _date,
+    serializers.FloatField: lambda field: float,
+    serializers.IntegerField: lambda field: None,
+    serializers.BooleanField: lambda field: None,
+    serializers.CharField: lambda field: None, # also EmailField, ChoiceField is handled below
+    serializers.ChoiceField: lambda field: None, # the stored values are the choices' keys
+    serializers.PrimaryKeyRelatedField: lambda field: None, # values_list("fk") gives the key
+}
+
+
+class RowEncoder:
+    """
+    Formats values_list(*encoder.columns) rows like `serializer_class` formats instances:
+
+        encoder = RowEncoder(TransactionSerializer)
+        data = encoder.many(queryset.values_list(*encoder.columns))
+
+    Only plain model fields are supported (no method fields, nested serializers or custom sources).
+    """
+
+    def __init__(self, serializer_class, fields=None):
+        serializer_fields = serializer_class().fields
+        names = [name for name, field in serializer_fields.items() if not field.write_only and (fields is None or name in fields)]
+        self.fields = tuple(names)
+        self.columns = tuple(serializer_fields[name].source for name in names)
+
+        columns = []
+        for index, name in enumerate(names):
+            field = serializer_fields[name]
+            factory = next((CONVERTERS[cls] for cls in type(field).__mro__ if cls in CONVERTERS), None)
+            if factory is None or "." in field.source or field.source == "*":
+                raise ValueError(f"{serializer_class.__name__}.{name}: {type(field).__name__} can't be encoded from a column")
+            convert = factory(field)
+            columns.append((name, index, convert, getattr(convert, "needs_timezone", False))) # worked out once, not per row
+        columns = tuple(columns)
+
+        def encode(row, tz):
+            return {
+                name: row[index] if convert is None or row[index] is None
+                else convert(row[index], tz) if needs_timezone else convert(row[index])
+                for name, index, convert, needs_timezone in columns
+            }
+        self._encode = encode
+
+    def many(self, rows):
+        current_timezone = timezone.get_current_timezone() if settings.USE_TZ else None # looked up once, not per row
+        if current_timezone is not None and str(current_timezone) == "UTC":
+            current_timezone = datetime.timezone.utc # what the database hands back, so nothing to convert
+        encode = self._encode
+        return [encode(row, current_timezone) for row in rows]
@@ -0,0 +1,190 @@
+"""
+Read replicas for the analytics / dashboard reads.
+
+Views opt in with ReplicaReadMixin: their GET requests read from a healthy replica (picked once per request),
+everything else keeps using `default`. Writes always go to `default`, and after a request that wrote,
+its user is pinned to `default` for DATABASE_REPLICA_STICKY_SECONDS, so they read their own writes while
+the replicas catch up. Pins live in Django's cache (shared between processes if the backend is).
+
+A replica counts as healthy if it answers a query against django_migrations (so an empty or missing SQLite
+file doesn't pass) and, on Postgres, isn't more than DATABASE_REPLICA_MAX_LAG seconds behind. Each replica
+is checked at most every DATABASE_REPLICA_CHECK_INTERVAL seconds per process; with none healthy, reads
+fall back to `default`.
+
+Replicas are the DATABASES aliases starting with "replica" (see settings.py).
+"""
+import random
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+REPLICAS = [alias for alias in settings.DATABASES if alias.startswith("replica")]
+STICKY_SECONDS = getattr(settings, "DATABASE_REPLICA_STICKY_SECONDS", 10)
+CHECK_INTERVAL = getattr(settings, "DATABASE_REPLICA_CHECK_INTERVAL", 10)
+MAX_LAG = getattr(settings, "DATABASE_REPLICA_MAX_LAG", 30) # seconds
+
+_replica = ContextVar("replica", default=None) # the replica this request reads from, if any
+_wrote = ContextVar("wrote", default=False) # whether this request has written to the primary
+
+
+class ReplicaHealth:
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._status = {} # alias -> (healthy, checked at)
+        self._lock = threading.Lock()
+
+    def is_healthy(self, alias):
+        healthy, checked_at = self._status.get(alias, (True, 0.0))
+        if time.monotonic() - checked_at < self.check_interval:
+            return healthy
+        if not self._lock.acquire(blocking=False):
+            return healthy # another thread is checking; go with what we knew
+        try:
+            healthy = self.check(alias)
+            self._status[alias] = (healthy, time.monotonic())
+        finally:
+            self._lock.release()
+        return healthy
+
+    def check(self, alias):
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM django_migrations LIMIT 1")
+                if connection.vendor == "postgresql":
+                    cursor.execute(
+                        "SELECT CASE WHEN pg_is_in_recovery() "
+                        "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) ELSE 0 END"
+                    )
+                    if cursor.fetchone()[0] > MAX_LAG:
+                        return False
+            return True
+        except DatabaseError:
+            connection.close() # don't keep a broken persistent connection around
+            return False
+
+    def reset(self):
+        self._status.clear()
+
+
+health = ReplicaHealth()
+
+
+def choose_replica():
+    """ A random healthy replica, or None """
+    healthy = [alias for alias in REPLICAS if health.is_healthy(alias)]
+    return random.choice(healthy) if healthy else None
+
+
+def mark_written():
+    """ Reads for the rest of this request go to the primary, and the user gets pinned to it """
+    _wrote.set(True)
+
+
+def _pin_key(user_id):
+    return f"db:pinned:{user_id}"
+
+
+def pin(user_id):
+    cache.set(_pin_key(user_id), 1, STICKY_SECONDS)
+
+
+def is_pinned(user_id):
+    return bool(cache.get(_pin_key(user_id)))
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = _replica.get()
+        if replica is not None and not _wrote.get():
+            return replica
+        return None # default
+
+    def db_for_write(self, model, **hints):
+        mark_written()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True # same data everywhere
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in REPLICAS:
+            return False # replicas get the schema from the primary
+        return None
+
+
+class ReplicaStickinessMiddleware:
+    """ Pins the user to the primary for a while after a request that wrote """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if REPLICAS and _wrote.get():
+                _pin_user(request)
+            return response
+        finally:
+            _wrote.reset(token)
+
+    async def __acall__(self, request):
+        token = _wrote.set(False)
+        try:
+            response = await self.get_response(request)
+            if REPLICAS and _wrote.get():
+                await sync_to_async(_pin_user)(request) # request.user may still be lazy, i.e. a query
+            return response
+        finally:
+            _wrote.reset(token)
+
+
+def _pin_user(request):
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        pin(user.pk)
+
+
+class ReplicaReadMixin:
+    """ For APIViews: safe requests read from a replica unless the user is pinned to the primary """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs) # authenticates, so request.user is known below
+        if REPLICAS and request.method in SAFE_METHODS and not (request.user.is_authenticated and is_pinned(request.user.pk)):
+            replica = choose_replica()
+            if replica is not None:
+                self._replica_token = _replica.set(replica)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, "_replica_token", None)
+        if token is not None:
+            _replica.reset(token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+def copy_sqlite(source, target):
+    """ Copies the SQLite database `source` into `target` (file paths), a stand-in for replication in development """
+    primary, replica = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        primary.backup(replica) # a consistent copy; readers of the replica see either the old or the new data
+    finally:
+        primary.close()
+        replica.close()
@@ -0,0 +1,99 @@
+"""
+Single-writer queue for SQLite.
+
+SQLite lets one connection write at a time, so concurrent request threads that write queue up on the
+database lock (busy_timeout) and each pays for its own commit. writes.run(func) hands the work to one writer
+thread instead, which takes everything queued so far and runs it as one transaction, each job in its own
+savepoint so a failing job doesn't take the others down: one lock and one commit per batch. The caller
+blocks until its batch has committed and gets func's result (or exception).
+
+On when SQLITE_WRITE_QUEUE is set and the database is SQLite. Otherwise, and inside an open transaction
+(whose lock the writer would be waiting on), run() just calls func.
+"""
+import contextvars
+import queue
+import threading
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, transaction
+
+from config import replicas
+
+MAX_BATCH = 100
+
+
+class WriteQueue:
+    def __init__(self, alias=DEFAULT_DB_ALIAS, max_batch=MAX_BATCH):
+        self.alias = alias
+        self.max_batch = max_batch
+        self.enabled = getattr(settings, "SQLITE_WRITE_QUEUE", False) and connections[alias].vendor == "sqlite"
+        self._jobs = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def run(self, func, *args, **kwargs):
+        """ Runs func(*args, **kwargs) in the writer thread and returns once it has committed """
+        if not self.enabled or threading.current_thread() is self._thread or connections[self.alias].in_atomic_block:
+            return func(*args, **kwargs)
+        self._start()
+        future = Future()
+        self._jobs.put((contextvars.copy_context(), func, args, kwargs, future))
+        result = future.result()
+        replicas.mark_written() # the write happened on the writer's connection, not this request's
+        return result
+
+    def stop(self):
+        """ Lets the writer finish what's queued and exit (closing its connection); run() starts a new one """
+        with self._lock:
+            if self._thread is not None:
+                self._jobs.put(None)
+                self._thread.join()
+                self._thread = None
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="sqlite-writer", daemon=True)
+                self._thread.start()
+
+    def _work(self):
+        while True:
+            batch = [self._jobs.get()]
+            while batch[-1] is not None and len(batch) < self.max_batch:
+                try:
+                    batch.append(self._jobs.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is None
+            if stopping:
+                batch.pop()
+            if batch:
+                self._run_batch(batch)
+            if stopping:
+                connections[self.alias].close()
+                return
+
+    def _run_batch(self, batch):
+        close_old_connections() # this thread never sees request_finished
+        outcomes = []
+        try:
+            with transaction.atomic(using=self.alias):
+                for context, func, args, kwargs, future in batch:
+                    try:
+                        with transaction.atomic(using=self.alias):
+                            outcomes.append((future, context.run(func, *args, **kwargs), None))
+                    except Exception as exc:
+                        outcomes.append((future, None, exc))
+        except Exception as exc: # the batch itself failed (e.g. the commit), so did every job in it
+            for *_, future in batch:
+                future.set_exception(exc)
+            return
+        for future, result, exc in outcomes:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
+
+
+writes = WriteQueue()
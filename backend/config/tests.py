@@ -0,0 +1,242 @@
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+
+from analytics.models import Transaction
+from config import instrumentation, replicas
+from config.renderers import FastJSONRenderer
+from config.sqlite import WriteQueue
+
+
+class WriteQueueTests(TransactionTestCase): # the queue runs inline inside a transaction, so no TestCase
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="writer", email="writer@example.com", password="pw-12345678")
+        self.queue = WriteQueue()
+        self.queue.enabled = True
+
+    def tearDown(self):
+        self.queue.stop()
+
+    def create(self, category):
+        return Transaction.objects.create(user=self.user, amount=1, type="expense", category=category).pk
+
+    def fail(self):
+        self.create("Doomed")
+        raise ValueError("job failed")
+
+    def test_runs_on_the_writer_and_returns_the_result(self):
+        pk = self.queue.run(self.create, "Rent")
+        self.assertEqual(Transaction.objects.get(pk=pk).category, "Rent")
+        self.assertEqual(self.queue._thread.name, "sqlite-writer")
+
+    def test_exception_reaches_the_caller(self):
+        with self.assertRaisesMessage(ValueError, "job failed"):
+            self.queue.run(self.fail)
+        self.assertFalse(Transaction.objects.filter(category="Doomed").exists())
+
+    def test_failing_job_does_not_affect_its_batch(self):
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        blocker = threading.Thread(target=self.queue.run, args=(block,)) # holds the writer while the batch queues up
+        blocker.start()
+        started.wait()
+
+        outcomes = {}
+
+        def submit(name, func, *args):
+            try:
+                outcomes[name] = self.queue.run(func, *args)
+            except Exception as exc:
+                outcomes[name] = exc
+
+        threads = [
+            threading.Thread(target=submit, args=("first", self.create, "Food")),
+            threading.Thread(target=submit, args=("failing", self.fail)),
+            threading.Thread(target=submit, args=("last", self.create, "Travel")),
+        ]
+        for thread in threads:
+            thread.start()
+        while self.queue._jobs.qsize() < len(threads):
+            time.sleep(0.001)
+        release.set()
+        for thread in threads + [blocker]:
+            thread.join()
+
+        self.assertIsInstance(outcomes["failing"], ValueError)
+        self.assertEqual(set(Transaction.objects.values_list("category", flat=True)), {"Food", "Travel"})
+        self.assertEqual({outcomes["first"], outcomes["last"]}, set(Transaction.objects.values_list("pk", flat=True)))
+
+
+class MetricsViewTests(SimpleTestCase):
+    @override_settings(METRICS_TOKEN=None, DEBUG=False)
+    def test_hidden_without_a_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+    @override_settings(METRICS_TOKEN=None, DEBUG=True)
+    def test_open_in_debug(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    @override_settings(METRICS_TOKEN="secret", DEBUG=True)
+    def test_token_required_when_set(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", headers={"Authorization": "Bearer secret"}).status_code, 200)
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        instrumentation.registry.clear()
+        self.user = get_user_model().objects.create_user(username="measured", email="measured@example.com", password="pw-12345678")
+        self.client.force_login(self.user)
+
+    def endpoint(self, method, route):
+        return instrumentation.registry.collect()[(method, route)]
+
+    def test_requests_are_recorded_per_route(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/admin/analytics/transaction/") # staff only, so a redirect
+        endpoint = self.endpoint("GET", "/admin/analytics/transaction/")
+        self.assertEqual(endpoint.statuses, {str(response.status_code): 1})
+        self.assertEqual(endpoint.db_queries, len(queries))
+        self.assertEqual(sum(endpoint.sizes), 1)
+        self.assertEqual(endpoint.size_sum, len(response.content))
+
+        self.client.get("/no/such/page/")
+        self.client.get("/another/missing/page/")
+        self.assertEqual(self.endpoint("GET", "unmatched").statuses, {"404": 2}) # one label for every unknown path
+
+        exposition = instrumentation.render()
+        self.assertIn('http_requests_total{method="GET",route="unmatched",status="404"} 2', exposition)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/admin/analytics/transaction/"} 1', exposition)
+
+    def test_stripe_calls_count_for_the_current_request(self):
+        stats = instrumentation.RequestStats()
+        token = instrumentation._current.set(stats)
+        try:
+            instrumentation.record_stripe_call(0.25)
+            instrumentation.record_stripe_call(0.5)
+        finally:
+            instrumentation._current.reset(token)
+        instrumentation.record_stripe_call(1.0) # outside a request: only the gateway's own stats have it
+        self.assertEqual((stats.stripe_calls, stats.stripe_seconds), (2, 0.75))
+
+    def test_shards_of_finished_threads_are_kept(self):
+        stats = instrumentation.RequestStats()
+        threads = [threading.Thread(target=instrumentation.registry.record, args=("GET", "/x", "200", 0.001, 10, stats)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        self.assertEqual(self.endpoint("GET", "/x").statuses, {"200": 3})
+        self.assertEqual(self.endpoint("GET", "/x").statuses, {"200": 3}) # folded in once, not per collect()
+
+    def test_slow_requests_are_logged_with_their_sql(self):
+        with mock.patch.object(instrumentation, "SLOW_REQUEST_SECONDS", 0), self.assertLogs("instrumentation.slow") as logs:
+            self.client.get("/admin/analytics/transaction/")
+        self.assertIn("Slow request: GET /admin/analytics/transaction/", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    def test_falls_back_for_what_orjson_cannot_encode(self):
+        data = {"big": 2 ** 70, "amount": Decimal("1.50")}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_non_finite_floats(self):
+        for value in (float("nan"), float("inf")):
+            with self.assertRaises(ValueError):
+                FastJSONRenderer().render({"rows": [{"value": value}]})
+        renderer = FastJSONRenderer()
+        renderer.strict = False
+        self.assertEqual(renderer.render([float("nan"), None]), b"[NaN,null]")
+
+
+class ReadDatabaseView(replicas.ReplicaReadMixin, APIView):
+    def get(self, request):
+        return Response({"db": router.db_for_read(Transaction)})
+
+
+@mock.patch.object(replicas, "REPLICAS", ["replica1"])
+@mock.patch.object(replicas.health, "is_healthy", lambda alias: True)
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username="reader", email="reader@example.com", password="pw-12345678")
+        token = replicas._wrote.set(False) # a new request, as ReplicaStickinessMiddleware would start it
+        self.addCleanup(replicas._wrote.reset, token)
+
+    def read(self, method="get"):
+        request = getattr(APIRequestFactory(), method)("/")
+        force_authenticate(request, self.user)
+        return ReadDatabaseView.as_view()(request).data
+
+    def test_safe_requests_read_from_a_replica(self):
+        self.assertEqual(self.read(), {"db": "replica1"})
+        self.assertEqual(router.db_for_read(Transaction), "default") # only for the duration of the request
+
+    def test_a_write_sends_the_rest_of_the_request_to_the_primary(self):
+        token = replicas._replica.set("replica1")
+        self.addCleanup(replicas._replica.reset, token)
+        self.assertEqual(router.db_for_read(Transaction), "replica1")
+        self.assertEqual(router.db_for_write(Transaction), "default")
+        self.assertEqual(router.db_for_read(Transaction), "default")
+
+    def test_writers_stay_on_the_primary_for_a_while(self):
+        def write(request):
+            router.db_for_write(Transaction)
+            return HttpResponse()
+
+        request = RequestFactory().post("/")
+        request.user = self.user
+        replicas.ReplicaStickinessMiddleware(write)(request)
+        self.assertTrue(replicas.is_pinned(self.user.pk))
+        self.assertEqual(self.read(), {"db": "default"})
+
+        cache.delete(replicas._pin_key(self.user.pk)) # DATABASE_REPLICA_STICKY_SECONDS later
+        self.assertEqual(self.read(), {"db": "replica1"})
+
+    async def test_async_middleware_pins_too(self):
+        async def write(request):
+            router.db_for_write(Transaction)
+            return HttpResponse()
+
+        request = RequestFactory().post("/")
+        request.user = self.user
+        await replicas.ReplicaStickinessMiddleware(write)(request)
+        self.assertTrue(replicas.is_pinned(self.user.pk))
+
+    def test_reads_alone_do_not_pin(self):
+        request = RequestFactory().get("/")
+        request.user = self.user
+        replicas.ReplicaStickinessMiddleware(lambda request: HttpResponse())(request)
+        self.assertFalse(replicas.is_pinned(self.user.pk))
+
+    def test_unhealthy_replicas_fall_back_to_the_primary(self):
+        with mock.patch.object(replicas.health, "is_healthy", lambda alias: False):
+            self.assertEqual(self.read(), {"db": "default"})
+
+
+class ReplicaHealthTests(TestCase):
+    def test_checks_are_cached(self):
+        health = replicas.ReplicaHealth(check_interval=60)
+        with mock.patch.object(health, "check", return_value=False) as check:
+            self.assertFalse(health.is_healthy("replica1"))
+            self.assertFalse(health.is_healthy("replica1"))
+        check.assert_called_once_with("replica1")
+
+    def test_a_migrated_database_is_healthy(self):
+        self.assertTrue(replicas.ReplicaHealth().check("default"))
@@ -17,9 +17,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from config.instrumentation import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("api/auth/", include("authentication.urls")),
     path("api/auth/", include("subscriptions.urls")),
     path("api/auth/", include("analytics.urls")),
+    path("api/auth/", include("dashboard.urls")),
+    path("metrics", metrics_view, name="metrics"), # Prometheus scrape endpoint
 ]
@@ -1,3 +1,6 @@
 from django.contrib import admin
+from .models import CohortRetention, DailyMetrics, DailyPlanMetrics
 
-# Register your models here.
+admin.site.register(DailyMetrics)
+admin.site.register(DailyPlanMetrics)
+admin.site.register(CohortRetention)
@@ -0,0 +1,54 @@
+"""
+Server-sent events stream for the dashboard, so an open dashboard doesn't have to poll.
+
+GET /api/auth/live/ keeps the response open and writes one event per change to the user's data (see
+live.py): "transactions" (new / updated / deleted rows plus the recomputed insights of the months they
+touch), "subscription" (the active subscription after a Stripe webhook) and "resync" (the stream fell
+behind; reload the dashboard). A comment line goes out every LIVE_KEEPALIVE seconds so proxies keep the
+connection open. It needs the ASGI server: under WSGI every open stream would hold a worker thread.
+"""
+import json
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+from subscriptions.async_views import async_api_view
+
+from .broker import get_broker
+
+KEEPALIVE = getattr(settings, "LIVE_KEEPALIVE", 15) # seconds
+MAX_STREAMS_PER_USER = getattr(settings, "LIVE_MAX_STREAMS_PER_USER", 5) # per process
+
+
+def format_event(event):
+    data = json.dumps(event["data"], cls=JSONEncoder, separators=(",", ":")) # same encoding as the API responses
+    return f"event: {event['type']}\ndata: {data}\n\n"
+
+
+async def event_stream(broker, user_id):
+    listener = broker.listen(user_id) # here rather than in the view, so it's always closed by the finally below
+    try:
+        yield "retry: 5000\n\n" # how long browsers wait before reconnecting
+        yield format_event({"type": "ready", "data": {}})
+        while True:
+            event = await listener.get(timeout=KEEPALIVE)
+            yield ": keepalive\n\n" if event is None else format_event(event)
+    finally:
+        listener.close() # runs when the client disconnects and the server cancels the stream
+
+
+@async_api_view("GET")
+async def live_updates(request):
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error": "Live updates need the ASGI server."}, status=501)
+
+    broker = get_broker()
+    if broker.listener_count(request.user.pk) >= MAX_STREAMS_PER_USER:
+        return JsonResponse({"error": "Too many open live streams."}, status=429)
+
+    response = StreamingHttpResponse(event_stream(broker, request.user.pk), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no" # nginx would otherwise buffer the stream
+    return response
@@ -0,0 +1,170 @@
+"""
+Fan-out of live dashboard events to the open /live/ streams.
+
+publish(user_id, event) can be called from any thread; every stream the user has open gets the event on its
+asyncio queue. Two brokers, picked with LIVE_BROKER:
+
+- "local" (the default): in-process only. Events published by another process (a second ASGI worker, the
+  process_webhooks command) don't reach this one's streams.
+- "cache": events go through Django's cache (a per-user sequence number plus one key per event) and every
+  process polls it for the users it has streams for, so with a shared cache backend all processes see all
+  events, at LIVE_CACHE_POLL_INTERVAL latency. The default cache (LocMemCache) is per process, so this
+  needs a shared one, e.g. REDIS_URL (see settings.py).
+
+Anything but "cache" with a shared backend leaves webhook-driven changes out of the streams; process_webhooks
+warns about it on start, and the dashboard.W001 check flags "cache" over a per-process cache.
+
+A stream that falls LIVE_QUEUE_SIZE events behind gets a single "resync" event instead, telling the client
+to reload the dashboard.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+QUEUE_SIZE = getattr(settings, "LIVE_QUEUE_SIZE", 100)
+CACHE_POLL_INTERVAL = getattr(settings, "LIVE_CACHE_POLL_INTERVAL", 1.0) # seconds
+CACHE_EVENT_TTL = getattr(settings, "LIVE_CACHE_EVENT_TTL", 60)
+
+RESYNC = {"type": "resync", "data": {}}
+
+PROCESS_LOCAL_CACHES = {"django.core.cache.backends.locmem.LocMemCache", "django.core.cache.backends.dummy.DummyCache"}
+
+
+class Listener:
+    """ One open stream; get() is called from the event loop the listener was created on """
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+
+    def put(self, event):
+        """ Runs on the listener's loop """
+        if self.queue.full():
+            while not self.queue.empty(): # too far behind: drop the backlog, the client reloads instead
+                self.queue.get_nowait()
+            event = RESYNC
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout):
+        """ The next event, or None if there was none within `timeout` seconds """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.remove(self)
+
+
+class LocalBroker:
+    def __init__(self):
+        self._listeners = defaultdict(set) # user_id -> {Listener}
+        self._lock = threading.Lock()
+
+    def listen(self, user_id):
+        listener = Listener(self, user_id)
+        with self._lock:
+            self._listeners[user_id].add(listener)
+        return listener
+
+    def remove(self, listener):
+        with self._lock:
+            listeners = self._listeners.get(listener.user_id)
+            if listeners is not None:
+                listeners.discard(listener)
+                if not listeners:
+                    del self._listeners[listener.user_id]
+
+    def listener_count(self, user_id):
+        return len(self._listeners.get(user_id, ()))
+
+    def has_listeners(self, user_id):
+        """ Publishers check this first, so nothing is built for users without an open stream """
+        return user_id in self._listeners
+
+    def publish(self, user_id, event):
+        self.deliver(user_id, event)
+
+    def deliver(self, user_id, event):
+        with self._lock:
+            listeners = list(self._listeners.get(user_id, ()))
+        for listener in listeners:
+            try:
+                listener.loop.call_soon_threadsafe(listener.put, event)
+            except RuntimeError: # the loop has shut down
+                self.remove(listener)
+
+
+class CacheBroker(LocalBroker):
+    """ LocalBroker whose events travel through Django's cache, see the module docstring """
+
+    def __init__(self):
+        super().__init__()
+        self._pollers = {} # user_id -> asyncio task polling the cache for that user
+
+    def _seq_key(self, user_id):
+        return f"live:{user_id}:seq"
+
+    def _event_key(self, user_id, seq):
+        return f"live:{user_id}:{seq}"
+
+    def _listening_key(self, user_id):
+        return f"live:{user_id}:listening"
+
+    def has_listeners(self, user_id):
+        return bool(cache.get(self._listening_key(user_id)))
+
+    def publish(self, user_id, event):
+        seq_key = self._seq_key(user_id)
+        cache.add(seq_key, 0, timeout=None)
+        try:
+            seq = cache.incr(seq_key)
+        except ValueError: # evicted between add() and incr()
+            seq = 1
+            cache.set(seq_key, seq, timeout=None)
+        cache.set(self._event_key(user_id, seq), event, timeout=CACHE_EVENT_TTL)
+
+    def listen(self, user_id):
+        listener = super().listen(user_id)
+        if user_id not in self._pollers:
+            self._pollers[user_id] = listener.loop.create_task(self._poll(user_id))
+        return listener
+
+    async def _poll(self, user_id):
+        """ Forwards the user's events from the cache to this process's listeners while there are any """
+        try:
+            last_seq = await cache.aget(self._seq_key(user_id)) or 0
+            while self.listener_count(user_id):
+                await cache.aset(self._listening_key(user_id), 1, timeout=max(CACHE_POLL_INTERVAL * 3, 5))
+                seq = await cache.aget(self._seq_key(user_id)) or 0
+                if seq < last_seq: # the counter was evicted and restarted
+                    last_seq = 0
+                if seq > last_seq:
+                    keys = [self._event_key(user_id, number) for number in range(max(last_seq + 1, seq - QUEUE_SIZE + 1), seq + 1)]
+                    events = await cache.aget_many(keys)
+                    if len(events) < seq - last_seq: # expired or beyond QUEUE_SIZE: some were missed
+                        self.deliver(user_id, RESYNC)
+                    for key in keys:
+                        if key in events:
+                            self.deliver(user_id, events[key])
+                    last_seq = seq
+                await asyncio.sleep(CACHE_POLL_INTERVAL)
+        finally:
+            self._pollers.pop(user_id, None)
+
+
+def reaches_other_processes():
+    """ Whether events published in this process reach streams served by the others """
+    return getattr(settings, "LIVE_BROKER", "local") == "cache" and settings.CACHES["default"]["BACKEND"] not in PROCESS_LOCAL_CACHES
+
+
+def get_broker():
+    return _brokers["cache" if getattr(settings, "LIVE_BROKER", "local") == "cache" else "local"]
+
+
+_brokers = {"local": LocalBroker(), "cache": CacheBroker()}
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+from .broker import PROCESS_LOCAL_CACHES
+
+
+@register(Tags.caches)
+def check_live_broker(app_configs, **kwargs):
+    """ LIVE_BROKER = "cache" over a per-process cache is just a slower "local" """
+    backend = settings.CACHES["default"]["BACKEND"]
+    if getattr(settings, "LIVE_BROKER", "local") != "cache" or backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        f"LIVE_BROKER is 'cache' but the default cache ({backend}) is per process, so live dashboard streams won't "
+        "see changes applied by process_webhooks or other workers.",
+        hint="Point CACHES at a shared backend, e.g. set REDIS_URL.",
+        id="dashboard.W001",
+    )]
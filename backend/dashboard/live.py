@@ -0,0 +1,61 @@
+"""
+The events behind the live dashboard stream (/api/auth/live/).
+
+Writers call transactions_changed() / subscription_changed() after changing a user's data. Nothing happens
+unless the user has a stream open; otherwise, once the write commits, the event is built (the new rows plus
+the recomputed insights of every month they touch, or the user's active subscription) and published.
+"""
+from django.db import transaction
+
+from analytics.rollups import month_start
+from analytics.serializers import TransactionSerializer
+from subscriptions.models import Subscription
+
+from . import sections
+from .broker import get_broker
+
+MAX_ROWS = 100 # bigger imports only send the new aggregates and a count
+
+
+def transactions_changed(user_id, created=(), updated=(), deleted=(), months=(), created_count=None):
+    """
+    `created` / `updated` are Transaction instances, `deleted` the ids of removed rows; `months` adds months
+    whose totals changed besides those of the rows (e.g. the month an updated row was moved out of).
+    Imports pass only the first rows and the full count as `created_count`.
+    """
+    broker = get_broker()
+    if not broker.has_listeners(user_id):
+        return
+    created, updated = list(created), list(updated)
+    touched = {month_start(txn.date) for txn in created + updated} | set(months)
+
+    def send():
+        count = len(created) if created_count is None else created_count
+        data = {
+            "created": TransactionSerializer(created[:MAX_ROWS], many=True).data,
+            "updated": TransactionSerializer(updated[:MAX_ROWS], many=True).data,
+            "deleted": list(deleted),
+            "created_count": count,
+            "truncated": count > MAX_ROWS or len(updated) > MAX_ROWS,
+            "insights": {month.strftime("%Y-%m"): sections.insights(user_id, month, None) for month in sorted(touched)},
+        }
+        broker.publish(user_id, {"type": "transactions", "data": data})
+
+    transaction.on_commit(send) # straight away if we're not in a transaction
+
+
+def subscription_changed(user_id):
+    broker = get_broker()
+    if not broker.has_listeners(user_id):
+        return
+
+    def send():
+        broker.publish(user_id, {"type": "subscription", "data": {"subscription": sections.subscription(user_id, None, None)}})
+
+    transaction.on_commit(send)
+
+
+def stripe_subscription_changed(stripe_subscription_id):
+    """ For updates that only know the Stripe id (the invoice.* webhooks) """
+    for user_id in Subscription.objects.filter(stripe_subscription_id=stripe_subscription_id).values_list("user_id", flat=True):
+        subscription_changed(user_id)
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard import metrics
+
+
+class Command(BaseCommand):
+    help = (
+        "Brings the admin metrics snapshots (daily MRR / plan mix / new / churned, monthly cohort retention) up "
+        "to date. Run it daily, e.g. from cron shortly after midnight; each run only computes the days and "
+        "months that finished since the previous one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="Drop the snapshots and recompute them from the start.")
+        parser.add_argument("--today", help="Pretend it's this date (YYYY-MM-DD): snapshot the days before it.")
+
+    def handle(self, *args, **options):
+        today = None
+        if options["today"]:
+            try:
+                today = datetime.strptime(options["today"], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("--today must be YYYY-MM-DD.")
+
+        result = metrics.snapshot(today=today, rebuild=options["rebuild"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshotted {result['days']} days and {result['cohort_months']} months of cohort retention."
+        ))
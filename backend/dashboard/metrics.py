@@ -0,0 +1,239 @@
+"""
+Platform-wide subscription metrics for the admin dashboard: MRR, plan mix, new and churned subscriptions per
+day, and monthly cohort retention.
+
+snapshot() (run daily by the snapshot_metrics command) only computes what's missing since the last run:
+
+- Days: the current state is one grouped query over the active subscriptions; the new / churned
+  subscriptions since the last snapshotted day come from range scans on the created_at / canceled_at
+  indexes. The state at the end of each missing day is found by walking back from now (undoing the
+  subscriptions that started after that day and re-adding the ones that ended after it), so the most recent
+  day is exact and a backfill is as good as the history allows (plan changes aren't recorded, every
+  subscription counts at its current price).
+- Cohorts: once a month is over, one grouped query records how many of every earlier month's subscriptions
+  were still active at its end.
+
+The admin endpoint then reads a date range from the snapshot tables (see range_report()), never Subscription.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Max, Q, Sum, When
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+from django.utils import timezone
+
+from analytics.rollups import month_start
+from analytics.series import next_month
+from subscriptions.models import Subscription
+
+from .models import CohortRetention, DailyMetrics, DailyPlanMetrics
+
+ONE_DAY = timedelta(days=1)
+
+# What a subscription's price is worth per month, whatever its billing interval (Basic has no amount)
+MONTHLY_AMOUNT = Coalesce(
+    Case(
+        When(interval="year", then=F("amount") / 12),
+        When(interval="week", then=F("amount") * 52 / 12),
+        When(interval="day", then=F("amount") * 365 / 12),
+        default=F("amount"),
+        output_field=IntegerField(),
+    ),
+    0,
+)
+
+
+def midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def months_between(start, end):
+    return (end.year - start.year) * 12 + end.month - start.month
+
+
+def _totals(queryset, *group_by):
+    return (
+        queryset
+        .values(*group_by)
+        .annotate(count=Count("id"), mrr=Sum(MONTHLY_AMOUNT))
+        .order_by()
+        .values_list(*group_by, "count", "mrr")
+    )
+
+
+def _per_day(queryset, date_field):
+    """ {day: {plan: (count, mrr)}} of the subscriptions in `queryset`, by the day of `date_field` """
+    result = defaultdict(dict)
+    for day, plan, count, mrr in _totals(queryset.annotate(day=TruncDate(date_field)), "day", "plan"):
+        result[day][plan] = (count, mrr or 0)
+    return result
+
+
+def snapshot_days(today=None):
+    """ Writes DailyMetrics / DailyPlanMetrics for every finished day since the last snapshot; returns how many days """
+    today = today or timezone.localdate()
+    last = DailyMetrics.objects.aggregate(last=Max("date"))["last"]
+    if last is not None:
+        start = last + ONE_DAY
+    else:
+        first = Subscription.objects.order_by("created_at").values_list("created_at", flat=True).first()
+        start = timezone.localdate(first) if first else today - ONE_DAY
+    end = today - ONE_DAY
+    if start > end:
+        return 0
+
+    since = midnight(start)
+    state = defaultdict(lambda: [0, 0]) # plan -> [active subscriptions, mrr], walked back from now
+    for plan, count, mrr in _totals(Subscription.objects.filter(is_active=True), "plan"):
+        state[plan] = [count, mrr or 0]
+    started = _per_day(Subscription.objects.filter(created_at__gte=since), "created_at")
+    ended = _per_day(Subscription.objects.filter(is_active=False, canceled_at__gte=since), "canceled_at")
+
+    def undo(day):
+        for plan, (count, mrr) in started.get(day, {}).items():
+            state[plan][0] -= count
+            state[plan][1] -= mrr
+        for plan, (count, mrr) in ended.get(day, {}).items():
+            state[plan][0] += count
+            state[plan][1] += mrr
+
+    for day in set(started) | set(ended): # today so far (and anything dated in the future)
+        if day > end:
+            undo(day)
+
+    days, plans = [], []
+    day = end
+    while day >= start:
+        active = {plan: (max(count, 0), max(mrr, 0)) for plan, (count, mrr) in state.items()}
+        new, churned = started.get(day, {}).values(), ended.get(day, {}).values()
+        days.append(DailyMetrics(
+            date=day,
+            mrr=sum(mrr for _, mrr in active.values()),
+            active_subscriptions=sum(count for count, _ in active.values()),
+            new_subscriptions=sum(count for count, _ in new),
+            churned_subscriptions=sum(count for count, _ in churned),
+            new_mrr=sum(mrr for _, mrr in new),
+            churned_mrr=sum(mrr for _, mrr in churned),
+        ))
+        plans.extend(
+            DailyPlanMetrics(date=day, plan=plan, active_subscriptions=count, mrr=mrr)
+            for plan, (count, mrr) in active.items() if count
+        )
+        undo(day) # now the state at the end of the day before
+        day -= ONE_DAY
+
+    with transaction.atomic():
+        DailyMetrics.objects.bulk_create(days, batch_size=1000)
+        DailyPlanMetrics.objects.bulk_create(plans, batch_size=1000)
+    return len(days)
+
+
+def snapshot_cohorts(today=None):
+    """ Writes CohortRetention for every month that ended since the last snapshot; returns how many months """
+    this_month = (today or timezone.localdate()).replace(day=1)
+    last_cohort = CohortRetention.objects.aggregate(last=Max("cohort"))["last"]
+    if last_cohort is None:
+        first = Subscription.objects.order_by("created_at").values_list("created_at", flat=True).first()
+        if first is None:
+            return 0
+        month_end = next_month(month_start(first))
+    else:
+        # the newest cohort is always the month that had just ended when the last run measured
+        month_end = next_month(next_month(last_cohort))
+    first_cohort = CohortRetention.objects.order_by("cohort").values_list("cohort", flat=True).first()
+
+    measured = 0
+    while month_end <= this_month:
+        cutoff = midnight(month_end)
+        rows = (
+            Subscription.objects
+            .filter(created_at__lt=cutoff)
+            .annotate(cohort=TruncMonth("created_at"))
+            .values("cohort")
+            .annotate(size=Count("id"), retained=Count("id", filter=Q(is_active=True) | Q(canceled_at__gte=cutoff)))
+            .order_by()
+            .values_list("cohort", "size", "retained")
+        )
+        counts = {month_start(cohort): (size, retained) for cohort, size, retained in rows}
+        first_cohort = first_cohort or min(counts, default=None)
+        cells = []
+        cohort = first_cohort
+        while cohort is not None and cohort < month_end: # every month, so empty cohorts get a row too
+            size, retained = counts.get(cohort, (0, 0))
+            cells.append(CohortRetention(cohort=cohort, months=months_between(cohort, month_end) - 1, size=size, retained=retained))
+            cohort = next_month(cohort)
+        CohortRetention.objects.bulk_create(cells, batch_size=1000)
+        measured += 1
+        month_end = next_month(month_end)
+    return measured
+
+
+def snapshot(today=None, rebuild=False):
+    """ Brings the snapshot tables up to date; rebuild=True recomputes them from scratch """
+    with transaction.atomic():
+        if rebuild:
+            DailyMetrics.objects.all().delete()
+            DailyPlanMetrics.objects.all().delete()
+            CohortRetention.objects.all().delete()
+        return {"days": snapshot_days(today), "cohort_months": snapshot_cohorts(today)}
+
+
+def _ratio(part, whole):
+    return round(part / whole, 4) if whole else None
+
+
+def range_report(start, end, cohorts=True):
+    """ The admin metrics for start..end (inclusive dates), read from the snapshot tables only """
+    days = list(
+        DailyMetrics.objects
+        .filter(date__range=(start, end))
+        .order_by("date")
+        .values("date", "mrr", "active_subscriptions", "new_subscriptions", "churned_subscriptions", "new_mrr", "churned_mrr")
+    )
+    plan_mix = defaultdict(dict)
+    for day, plan, count, mrr in DailyPlanMetrics.objects.filter(date__range=(start, end)).values_list("date", "plan", "active_subscriptions", "mrr"):
+        plan_mix[day][plan] = {"active_subscriptions": count, "mrr": mrr}
+
+    for row in days:
+        # active at the start of the day = at its end, minus the day's new, plus the day's churned
+        opening = row["active_subscriptions"] - row["new_subscriptions"] + row["churned_subscriptions"]
+        row["churn_rate"] = _ratio(row["churned_subscriptions"], opening)
+        row["plans"] = plan_mix.get(row["date"], {})
+
+    summary = None
+    if days:
+        first, last = days[0], days[-1]
+        opening = first["active_subscriptions"] - first["new_subscriptions"] + first["churned_subscriptions"]
+        opening_mrr = first["mrr"] - first["new_mrr"] + first["churned_mrr"]
+        churned = sum(row["churned_subscriptions"] for row in days)
+        summary = {
+            "mrr": last["mrr"],
+            "mrr_change": last["mrr"] - opening_mrr,
+            "active_subscriptions": last["active_subscriptions"],
+            "new_subscriptions": sum(row["new_subscriptions"] for row in days),
+            "churned_subscriptions": churned,
+            "churn_rate": _ratio(churned, opening),
+            "plans": last["plans"],
+        }
+
+    report = {"from": start, "to": end, "summary": summary, "days": days}
+    if cohorts:
+        retention = defaultdict(list)
+        sizes = {}
+        rows = CohortRetention.objects.filter(cohort__range=(start.replace(day=1), end)).order_by("cohort", "months")
+        for cohort, size, retained in rows.values_list("cohort", "size", "retained"):
+            sizes[cohort] = size
+            retention[cohort].append(_ratio(retained, size))
+        report["cohorts"] = [
+            {"cohort": cohort.strftime("%Y-%m"), "size": sizes[cohort], "retention": retention[cohort]} for cohort in sizes
+        ]
+    return report
+
+
+def latest():
+    """ The most recent day's numbers, for the admin dashboard's overview """
+    last = DailyMetrics.objects.aggregate(last=Max("date"))["last"]
+    if last is None:
+        return None
+    return range_report(last, last, cohorts=False)["summary"] | {"date": last}
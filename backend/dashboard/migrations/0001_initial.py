@@ -0,0 +1,54 @@
+# Generated by Django 5.1.5 on 2026-10-18 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('mrr', models.BigIntegerField(default=0)),
+                ('active_subscriptions', models.PositiveIntegerField(default=0)),
+                ('new_subscriptions', models.PositiveIntegerField(default=0)),
+                ('churned_subscriptions', models.PositiveIntegerField(default=0)),
+                ('new_mrr', models.BigIntegerField(default=0)),
+                ('churned_mrr', models.BigIntegerField(default=0)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CohortRetention',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cohort', models.DateField()),
+                ('months', models.PositiveSmallIntegerField()),
+                ('size', models.PositiveIntegerField()),
+                ('retained', models.PositiveIntegerField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('cohort', 'months'), name='unique_cohort_retention')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyPlanMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('plan', models.CharField(max_length=50)),
+                ('active_subscriptions', models.PositiveIntegerField(default=0)),
+                ('mrr', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'plan'), name='unique_daily_plan_metrics')],
+            },
+        ),
+    ]
@@ -1,3 +1,48 @@
 from django.db import models
 
-# Create your models here.
+# Platform-wide subscription metrics, written by the snapshot_metrics command (see dashboard/metrics.py) so
+# the admin endpoints never have to scan Subscription. Amounts are in the currency's smallest unit.
+
+class DailyMetrics(models.Model):
+    """ Totals at the end of `date` (and what happened during it) """
+    date = models.DateField(unique=True)
+    mrr = models.BigIntegerField(default=0) # monthly recurring revenue of the active subscriptions
+    active_subscriptions = models.PositiveIntegerField(default=0)
+    new_subscriptions = models.PositiveIntegerField(default=0)
+    churned_subscriptions = models.PositiveIntegerField(default=0)
+    new_mrr = models.BigIntegerField(default=0)
+    churned_mrr = models.BigIntegerField(default=0)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.date}: {self.active_subscriptions} active, MRR {self.mrr}"
+
+class DailyPlanMetrics(models.Model):
+    """ The plan mix: active subscriptions and MRR per plan at the end of `date` """
+    date = models.DateField()
+    plan = models.CharField(max_length=50)
+    active_subscriptions = models.PositiveIntegerField(default=0)
+    mrr = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["date", "plan"], name="unique_daily_plan_metrics"),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.plan}: {self.active_subscriptions} active"
+
+class CohortRetention(models.Model):
+    """ Of the subscriptions started in `cohort`'s month, how many were still active `months` months later """
+    cohort = models.DateField() # first day of the month the subscriptions started in
+    months = models.PositiveSmallIntegerField() # 0 = at the end of the cohort month itself
+    size = models.PositiveIntegerField()
+    retained = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["cohort", "months"], name="unique_cohort_retention"),
+        ]
+
+    def __str__(self):
+        return f"{self.cohort:%Y-%m} +{self.months}: {self.retained}/{self.size}"
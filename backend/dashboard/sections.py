@@ -0,0 +1,82 @@
+"""
+The pieces of the dashboard response. Each section is built from at most one query, and none of them
+depends on another, so DashboardView can run them side by side.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+from django.db.models import Sum
+
+from analytics import rollups
+from analytics.models import MonthlyRollup, Transaction
+from analytics.serializers import TransactionSerializer, transaction_rows
+from config.renderers import RowEncoder
+from subscriptions.models import Subscription
+from subscriptions.serializers import serialize_subscription
+
+TRANSACTION_FIELDS = TransactionSerializer.Meta.fields
+
+
+def user(user, month, options):
+    return {"id": user.pk, "email": user.email, "username": user.username, "role": user.role} # no query, it's request.user
+
+
+def subscription(user, month, options):
+    sub = Subscription.objects.filter(user=user, is_active=True).order_by("-created_at").first()
+    return serialize_subscription(sub) if sub is not None else None
+
+
+def insights(user, month, options):
+    """ Same numbers as InsightsView for `month`, from the rollup table """
+    return {"month": month.strftime("%Y-%m"), **rollups.month_insights(user, month)}
+
+
+@lru_cache(maxsize=None) # one per field selection, and there are only so many
+def transaction_encoder(fields):
+    return RowEncoder(TransactionSerializer, fields=fields)
+
+
+def transactions(user, month, options):
+    """ The latest `limit` transactions (a range scan on the (user, date, id) index), only the requested columns """
+    fields = options["transaction_fields"]
+    encoder = transaction_rows if fields is None else transaction_encoder(frozenset(fields))
+    rows = Transaction.objects.filter(user=user).order_by("-date", "-id").values_list(*encoder.columns)[:options["limit"]]
+    return encoder.many(rows)
+
+
+def delta(user, month, options):
+    """ Month over month change of the expense and revenue totals """
+    previous = (month - timedelta(days=1)).replace(day=1)
+    totals = {(m, txn_type): Decimal("0") for m in (previous, month) for txn_type in ("expense", "revenue")}
+    rows = (
+        MonthlyRollup.objects
+        .filter(user=user, month__in=[previous, month], type__in=["expense", "revenue"])
+        .values("month", "type")
+        .annotate(total=Sum("total"))
+        .order_by()
+        .values_list("month", "type", "total")
+    )
+    for row_month, txn_type, total in rows:
+        totals[row_month, txn_type] = total
+
+    result = {"previous_month": previous.strftime("%Y-%m")}
+    for txn_type, key in (("expense", "total_expenses"), ("revenue", "total_revenue")):
+        current, before = totals[month, txn_type], totals[previous, txn_type]
+        result[key] = {
+            "current": current,
+            "previous": before,
+            "change": current - before,
+            "change_pct": round(float((current - before) / before * 100), 1) if before else None,
+        }
+    return result
+
+
+SECTIONS = {
+    "user": user,
+    "subscription": subscription,
+    "insights": insights,
+    "transactions": transactions,
+    "delta": delta,
+}
+NO_QUERY = {"user"} # cheap enough to build inline
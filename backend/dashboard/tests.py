@@ -1,3 +1,162 @@
-from django.test import TestCase
+import asyncio
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from analytics import rollups
+from analytics.models import Transaction
+from analytics.serializers import TransactionSerializer
+from subscriptions.models import Subscription
+
+from . import broker, checks, metrics
+from .models import CohortRetention, DailyMetrics
+
+
+class DashboardViewTests(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="dash", email="dash@example.com", password="pw-12345678")
+        self.client.force_authenticate(self.user)
+        start = timezone.make_aware(datetime(2025, 3, 1))
+        for day in range(20):
+            Transaction.objects.create(user=self.user, amount=Decimal(10 + day), type=("expense", "revenue")[day % 2],
+                                       category=("rent", "food")[day % 3 == 0], description=f"#{day}", date=start + timedelta(days=day))
+        rollups.rebuild([self.user.pk])
+
+    def test_field_selection_reads_only_those_columns(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/auth/dashboard/?fields=transactions.amount,transactions.date&month=2025-03")
+        rows = response.json()["transactions"]
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[0], {"amount": "29.00", "date": "2025-03-20T00:00:00Z"})
+
+    def test_transactions_match_the_serializer(self):
+        response = self.client.get("/api/auth/dashboard/?fields=transactions&limit=3")
+        latest = Transaction.objects.order_by("-date", "-id")[:3]
+        self.assertEqual(response.json()["transactions"], TransactionSerializer(latest, many=True).data)
+
+    def test_insights_match_the_insights_view(self):
+        dashboard = self.client.get("/api/auth/dashboard/?fields=insights&month=2025-03").json()["insights"]
+        insights = self.client.get("/api/auth/insights/?month=2025-03").json()
+        self.assertEqual(dashboard, {"month": "2025-03", **insights})
+        self.assertEqual(insights["total_expenses"], sum(10 + day for day in range(0, 20, 2)))
+
+    def test_unknown_transaction_field(self):
+        self.assertEqual(self.client.get("/api/auth/dashboard/?fields=transactions.password").status_code, 400)
+
+
+class MetricsSnapshotTests(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="subs", email="subs@example.com", password="pw-12345678")
+        self.subscribe("pro", 1900, "month", date(2025, 1, 10))
+        self.subscribe("enterprise", 9900, "year", date(2025, 1, 20), canceled=date(2025, 2, 5)) # 825 a month
+        self.subscribe("pro", 1900, "month", date(2025, 2, 3))
+
+    def subscribe(self, plan, amount, interval, created, canceled=None):
+        subscription = Subscription.objects.create(user=self.user, stripe_customer_id="cus_1", plan=plan, amount=amount, interval=interval,
+                                                   is_active=canceled is None, canceled_at=canceled and metrics.midnight(canceled))
+        Subscription.objects.filter(pk=subscription.pk).update(created_at=metrics.midnight(created) + timedelta(hours=12))
+
+    def day(self, value):
+        return DailyMetrics.objects.get(date=value)
+
+    def test_days_and_cohorts(self):
+        self.assertEqual(metrics.snapshot(today=date(2025, 3, 1)), {"days": 50, "cohort_months": 2})
+        self.assertEqual((self.day(date(2025, 1, 10)).active_subscriptions, self.day(date(2025, 1, 10)).mrr), (1, 1900))
+        self.assertEqual(self.day(date(2025, 1, 20)).mrr, 2725)
+        churn_day = self.day(date(2025, 2, 5))
+        self.assertEqual((churn_day.active_subscriptions, churn_day.churned_subscriptions, churn_day.churned_mrr, churn_day.mrr), (2, 1, 825, 3800))
+
+        retention = {(row.cohort, row.months): (row.size, row.retained) for row in CohortRetention.objects.all()}
+        self.assertEqual(retention, {
+            (date(2025, 1, 1), 0): (2, 2),
+            (date(2025, 1, 1), 1): (2, 1),
+            (date(2025, 2, 1), 0): (1, 1),
+        })
+
+    def test_runs_only_add_what_is_missing(self):
+        metrics.snapshot(today=date(2025, 3, 1))
+        self.assertEqual(metrics.snapshot(today=date(2025, 3, 1)), {"days": 0, "cohort_months": 0})
+        self.assertEqual(metrics.snapshot(today=date(2025, 3, 3)), {"days": 2, "cohort_months": 0})
+        self.assertEqual(self.day(date(2025, 3, 2)).active_subscriptions, 2)
+        self.assertEqual(metrics.snapshot(today=date(2025, 3, 3), rebuild=True), {"days": 52, "cohort_months": 2})
+
+    def test_admin_endpoint_reads_the_snapshots(self):
+        metrics.snapshot(today=date(2025, 3, 1))
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get("/api/auth/admin-only/metrics/").status_code, 403)
+
+        self.user.role = "admin"
+        with self.assertNumQueries(3): # days, plan mix, cohorts; Subscription isn't touched
+            response = self.client.get("/api/auth/admin-only/metrics/?from=2025-02-01&to=2025-02-28")
+        summary = response.json()["summary"]
+        self.assertEqual((summary["mrr"], summary["mrr_change"], summary["churned_subscriptions"]), (3800, 1075, 1))
+        self.assertEqual(summary["churn_rate"], 0.5)
+        self.assertEqual(summary["plans"], {"pro": {"active_subscriptions": 2, "mrr": 3800}})
+
+
+class BrokerTests(SimpleTestCase):
+    event = {"type": "subscription", "data": {"subscription": None}}
+
+    async def test_local_broker_delivers_to_the_users_streams(self):
+        local = broker.LocalBroker()
+        first, second, other = local.listen(1), local.listen(1), local.listen(2)
+        await asyncio.to_thread(local.publish, 1, self.event) # publishers run on request / worker threads
+        self.assertEqual(await first.get(timeout=1), self.event)
+        self.assertEqual(await second.get(timeout=1), self.event)
+        self.assertIsNone(await other.get(timeout=0.05))
+
+        for listener in (first, second, other):
+            listener.close()
+        self.assertFalse(local.has_listeners(1))
+
+    async def test_a_stream_that_falls_behind_resyncs(self):
+        local = broker.LocalBroker()
+        listener = local.listen(1)
+        for _ in range(broker.QUEUE_SIZE + 1):
+            local.publish(1, self.event)
+        await asyncio.sleep(0) # let the loop run the deliveries
+        self.assertEqual(await listener.get(timeout=1), broker.RESYNC)
+        self.assertIsNone(await listener.get(timeout=0.05))
+        listener.close()
+
+    @mock.patch.object(broker, "CACHE_POLL_INTERVAL", 0.01)
+    async def test_cache_broker_reaches_other_processes(self):
+        cache.clear()
+        serving, publishing = broker.CacheBroker(), broker.CacheBroker() # e.g. the ASGI worker and process_webhooks
+        self.assertFalse(publishing.has_listeners(1))
+        listener = serving.listen(1)
+        while not await asyncio.to_thread(publishing.has_listeners, 1):
+            await asyncio.sleep(0.01)
+
+        await asyncio.to_thread(publishing.publish, 1, self.event)
+        self.assertEqual(await listener.get(timeout=1), self.event)
+        listener.close()
+        await asyncio.sleep(0.05) # the poller stops once the user has no streams here
+        self.assertEqual(serving._pollers, {})
+
+    def test_cache_broker_over_a_per_process_cache_is_flagged(self):
+        self.assertEqual(checks.check_live_broker(None), [])
+        with override_settings(LIVE_BROKER="cache"):
+            self.assertEqual([warning.id for warning in checks.check_live_broker(None)], ["dashboard.W001"])
+
+
+class ProcessWebhooksBrokerTests(TestCase):
+    def run_command(self):
+        stderr = StringIO()
+        call_command("process_webhooks", stdout=StringIO(), stderr=stderr)
+        return stderr.getvalue()
+
+    def test_warns_when_streams_cannot_see_the_updates(self):
+        self.assertIn("LIVE_BROKER=cache", self.run_command())
+
+    @override_settings(LIVE_BROKER="cache", CACHES={"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://127.0.0.1:6379/0"}})
+    def test_quiet_with_a_shared_cache(self):
+        self.assertEqual(self.run_command(), "")
@@ -0,0 +1,9 @@
+from django.urls import path
+from .views import AdminMetricsView, DashboardView
+from .async_views import live_updates
+
+urlpatterns = [
+    path("dashboard/", DashboardView.as_view(), name="dashboard"),
+    path("live/", live_updates, name="live-updates"),
+    path("admin-only/metrics/", AdminMetricsView.as_view(), name="admin-metrics"),
+]
@@ -1,3 +1,131 @@
-from django.shortcuts import render
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
-# Create your views here.
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from authentication.permissions import IsAdmin
+from config.replicas import ReplicaReadMixin
+
+from . import metrics, sections
+
+MAX_WORKERS = getattr(settings, "DASHBOARD_MAX_WORKERS", 4)
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+DEFAULT_METRICS_DAYS = 30
+MAX_METRICS_DAYS = 5 * 366
+
+# Shared by all requests; each worker thread keeps its own database connection
+pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="dashboard")
+
+
+def build_section(name, user, month, options):
+    close_old_connections() # worker threads don't see request_started / request_finished, so do their part
+    try:
+        return sections.SECTIONS[name](user, month, options)
+    finally:
+        close_old_connections()
+
+
+class DashboardView(ReplicaReadMixin, APIView):
+    """
+    Everything the dashboard page shows in one response: the user, the active subscription, the month's
+    insights, the latest transactions and the month over month change. One query per section at most, and
+    the sections are fetched concurrently.
+
+    ?fields=subscription,insights.total_expenses,transactions.amount,transactions.date picks sections (and,
+    after a dot, the keys within them); ?month=YYYY-MM defaults to the current month; ?limit= caps the
+    transactions (default 10, at most 50).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        selected = self.parse_fields(request.query_params.get("fields"))
+        if selected is None:
+            return Response({"error": f"Unknown field. Choose from: {', '.join(sections.SECTIONS)}."}, status=400)
+
+        month = request.query_params.get("month")
+        try:
+            month = datetime.strptime(month, "%Y-%m").date() if month else timezone.localdate().replace(day=1)
+        except ValueError:
+            return Response({"error": "Invalid month format. Use YYYY-MM."}, status=400)
+
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", DEFAULT_LIMIT)), MAX_LIMIT))
+        except ValueError:
+            return Response({"error": "limit must be a number."}, status=400)
+
+        options = {"limit": limit, "transaction_fields": selected.get("transactions")}
+        if options["transaction_fields"] is not None and not set(options["transaction_fields"]) <= set(sections.TRANSACTION_FIELDS):
+            return Response({"error": f"Unknown transaction field. Choose from: {', '.join(sections.TRANSACTION_FIELDS)}."}, status=400)
+
+        inline = [name for name in selected if name in sections.NO_QUERY]
+        queried = [name for name in selected if name not in sections.NO_QUERY]
+        data = {name: sections.SECTIONS[name](request.user, month, options) for name in inline}
+        if len(queried) == 1:
+            data[queried[0]] = sections.SECTIONS[queried[0]](request.user, month, options)
+        else:
+            # each in a copy of this context, so the sections read from the same database as the request
+            futures = {
+                name: pool.submit(contextvars.copy_context().run, build_section, name, request.user, month, options)
+                for name in queried
+            }
+            data.update({name: future.result() for name, future in futures.items()})
+
+        for name, keys in selected.items():
+            if keys is not None and isinstance(data[name], dict):
+                data[name] = {key: value for key, value in data[name].items() if key in keys}
+        return Response({name: data[name] for name in selected})
+
+    def parse_fields(self, value):
+        """ "a,b.x,b.y" -> {"a": None, "b": ["x", "y"]} (None: the whole section); None if a section is unknown """
+        if not value:
+            return dict.fromkeys(sections.SECTIONS)
+        selected = {}
+        for field in filter(None, (part.strip() for part in value.split(","))):
+            name, _, key = field.partition(".")
+            if name not in sections.SECTIONS:
+                return None
+            if not key:
+                selected[name] = None
+            elif name not in selected or selected[name] is not None:
+                selected.setdefault(name, []).append(key)
+        return selected or dict.fromkeys(sections.SECTIONS)
+
+
+class AdminMetricsView(ReplicaReadMixin, APIView):
+    """
+    Platform-wide subscription metrics for ?from=YYYY-MM-DD&to=YYYY-MM-DD (the last 30 snapshotted days by
+    default): daily MRR, plan mix, new / churned subscriptions and churn rate, a summary of the range and
+    the retention of the cohorts that started in it (?cohorts=0 leaves them out). Served from the snapshots
+    the snapshot_metrics command writes, so any range is a few indexed reads.
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        try:
+            start = self.parse_date(request.query_params.get("from"))
+            end = self.parse_date(request.query_params.get("to"))
+        except ValueError:
+            return Response({"error": "Invalid date. Use YYYY-MM-DD."}, status=400)
+
+        if end is None:
+            latest = metrics.DailyMetrics.objects.order_by("-date").values_list("date", flat=True).first()
+            end = latest or timezone.localdate()
+        if start is None:
+            start = end - timedelta(days=DEFAULT_METRICS_DAYS - 1)
+        if start > end:
+            return Response({"error": "from must not be after to."}, status=400)
+        if (end - start).days >= MAX_METRICS_DAYS:
+            return Response({"error": f"At most {MAX_METRICS_DAYS} days per request."}, status=400)
+
+        cohorts = request.query_params.get("cohorts", "1") not in ("0", "false")
+        return Response(metrics.range_report(start, end, cohorts=cohorts))
+
+    def parse_date(self, value):
+        return datetime.strptime(value, "%Y-%m-%d").date() if value else None
@@ -1,4 +1,5 @@
 from django.contrib import admin
-from .models import Subscription
+from .models import Subscription, WebhookEvent
 
-admin.site.register(Subscription)
\ No newline at end of file
+admin.site.register(Subscription)
+admin.site.register(WebhookEvent)
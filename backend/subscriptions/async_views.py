@@ -0,0 +1,172 @@
+"""
+Async (ASGI) versions of the Stripe-bound subscription endpoints.
+
+They behave like CreateSubscriptionView, UpgradeSubscriptionView, CancelSubscriptionView and
+ListUserSubscriptionsView, but use the async ORM and stripe_gateway.acall(), so while a request waits on
+Stripe it doesn't hold a worker thread. DRF's APIView is sync-only, hence plain Django async views with
+the same authentication classes. urls.py routes to these when ASYNC_SUBSCRIPTION_VIEWS is on.
+"""
+import json
+from functools import wraps
+
+import stripe
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+
+from subscriptions import catalog, customers, stripe_gateway, sync
+from subscriptions.models import Subscription
+from subscriptions.serializers import serialize_subscription
+from subscriptions.views import CHECKOUT_CANCEL_URL, CHECKOUT_SUCCESS_URL
+
+
+def _authenticate(request):
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        result = authentication_class().authenticate(request)
+        if result is not None:
+            return result[0]
+    return None
+
+
+def async_api_view(*methods):
+    """ Authentication (401 like DRF's IsAuthenticated), method check and JSON body parsing for async views """
+    def decorator(view):
+        @csrf_exempt
+        @require_http_methods(methods)
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                user = await sync_to_async(_authenticate)(request)
+            except exceptions.AuthenticationFailed as e:
+                detail = e.detail if isinstance(e.detail, dict) else {"detail": e.detail}
+                return JsonResponse(detail, status=401)
+            if user is None:
+                return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+            request.user = user
+
+            try:
+                request.data = json.loads(request.body) if request.body else {}
+            except ValueError:
+                return JsonResponse({"detail": "JSON parse error."}, status=400)
+            if not isinstance(request.data, dict):
+                return JsonResponse({"detail": "Expected a JSON object."}, status=400)
+
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@async_api_view("POST")
+async def create_subscription(request):
+    user = request.user
+    plan = request.data.get("plan")
+    price_id = settings.STRIPE_PRICE_IDS.get(plan)
+
+    if not plan:
+        return JsonResponse({"error": "Plan is required."}, status=400)
+
+    if plan not in ["basic", "pro", "enterprise"]:
+        return JsonResponse({"error": "Invalid plan type."}, status=400)
+
+    if await Subscription.objects.filter(user=user, is_active=True).aexists():
+        return JsonResponse({"error": "User already has an active subscription."}, status=400)
+
+    if plan == "basic":
+        try:
+            await Subscription.objects.acreate(
+                user=user,
+                stripe_customer_id=user.stripe_customer_id or "",
+                stripe_subscription_id=None,
+                plan="basic",
+                is_active=True,
+                status="active",
+            )
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        return JsonResponse({
+            "message": "Basic plan activated successfully.",
+            "subscription_id": None,
+            "plan": "Basic",
+            "checkout_url": None,
+        })
+
+    if not price_id:
+        return JsonResponse({"error": "Invalid plan selected."}, status=400)
+
+    try:
+        customer_id = await customers.aensure_stripe_customer(user)
+        checkout_session = await stripe_gateway.acall(
+            "checkout.Session.create",
+            payment_method_types=["card"],
+            customer=customer_id,
+            line_items=[{"price": price_id, "quantity": 1}],
+            mode="subscription",
+            success_url=CHECKOUT_SUCCESS_URL,
+            cancel_url=CHECKOUT_CANCEL_URL,
+        )
+    except stripe.error.StripeError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    return JsonResponse({"checkout_url": checkout_session.url})
+
+
+@async_api_view("POST")
+async def upgrade_subscription(request):
+    new_price_id = request.data.get("price_id")
+
+    if not new_price_id:
+        return JsonResponse({"error": "Invalid plan choice."}, status=400)
+
+    try:
+        subscription = await Subscription.objects.aget(user=request.user, is_active=True)
+        price = await catalog.aget_price(new_price_id)
+        product = await catalog.aget_product(price["product"])
+        new_plan_name = product["name"]
+
+        stripe_sub = await stripe_gateway.acall(
+            "Subscription.modify",
+            subscription.stripe_subscription_id,
+            items=[{"price": new_price_id}],
+            expand=["items.data.price.product"], # so the mirror update below needs no further Stripe calls
+        )
+        await sync_to_async(sync.update_from_stripe)(subscription, stripe_sub)
+    except Subscription.DoesNotExist:
+        return JsonResponse({"error": "No active subscription found."}, status=404)
+    except stripe.error.StripeError as e:
+        return JsonResponse({"error": f"Stripe error: {str(e)}"}, status=400)
+
+    return JsonResponse({"message": f"Subscription upgraded to {new_plan_name} successfully.", "plan": new_plan_name})
+
+
+@async_api_view("POST")
+async def cancel_subscription(request):
+    try:
+        subscription = await Subscription.objects.aget(user=request.user, is_active=True)
+
+        await stripe_gateway.acall(
+            "Subscription.modify",
+            subscription.stripe_subscription_id,
+            cancel_at_period_end=False,
+        )
+
+        subscription.is_active = False
+        subscription.status = "canceled"
+        subscription.canceled_at = timezone.now()
+        await subscription.asave()
+    except Subscription.DoesNotExist:
+        return JsonResponse({"error": "No active subscription found."}, status=404)
+    except stripe.error.StripeError as e:
+        return JsonResponse({"error": f"Stripe error: {str(e)}"}, status=400)
+
+    return JsonResponse({"message": "Subscription canceled successfully."})
+
+
+@async_api_view("GET")
+async def list_subscriptions(request):
+    subscriptions = Subscription.objects.filter(user=request.user).order_by("-created_at")
+    return JsonResponse({"subscriptions": [serialize_subscription(sub) async for sub in subscriptions]})
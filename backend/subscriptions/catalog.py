@@ -0,0 +1,121 @@
+"""
+Cached Stripe Price / Product metadata.
+
+Lookups go through a small process-local LRU (short TTL), then Django's cache framework (shared between
+workers when a shared backend is configured), and only then to Stripe. price.* / product.* webhook
+events drop the cached entry, see handle_event().
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from config.cache import LRUCache
+from subscriptions import stripe_gateway
+
+LOCAL_MAX_ENTRIES = getattr(settings, "STRIPE_CATALOG_LOCAL_MAX_ENTRIES", 512)
+LOCAL_TTL = getattr(settings, "STRIPE_CATALOG_LOCAL_TTL", 60) # seconds
+SHARED_TTL = getattr(settings, "STRIPE_CATALOG_SHARED_TTL", 60 * 60 * 24)
+
+_local = LRUCache(LOCAL_MAX_ENTRIES, LOCAL_TTL)
+
+
+def _cache_key(kind, object_id):
+    return f"stripe:catalog:{kind}:{object_id}"
+
+
+def _price_to_dict(price):
+    recurring = price.get("recurring") or {}
+    product = price["product"]
+    return {
+        "id": price["id"],
+        "product": product if isinstance(product, str) else product["id"],
+        "unit_amount": price.get("unit_amount"),
+        "currency": price.get("currency"),
+        "interval": recurring.get("interval"),
+        "nickname": price.get("nickname"),
+    }
+
+
+def _product_to_dict(product):
+    return {
+        "id": product["id"],
+        "name": product.get("name"),
+        "active": product.get("active"),
+    }
+
+
+def _lookup(kind, object_id, fetch):
+    key = _cache_key(kind, object_id)
+    value = _local.get(key)
+    if value is not None:
+        return value
+
+    value = cache.get(key)
+    if value is None:
+        value = fetch(object_id)
+        cache.set(key, value, SHARED_TTL)
+    _local.set(key, value)
+    return value
+
+
+async def _alookup(kind, object_id, fetch):
+    key = _cache_key(kind, object_id)
+    value = _local.get(key)
+    if value is not None:
+        return value
+
+    value = await cache.aget(key)
+    if value is None:
+        value = await fetch(object_id)
+        await cache.aset(key, value, SHARED_TTL)
+    _local.set(key, value)
+    return value
+
+
+def get_price(price_id):
+    """ Returns {"id", "product", "unit_amount", "currency", "interval", "nickname"} for a Stripe price """
+    return _lookup("price", price_id, lambda pk: _price_to_dict(stripe_gateway.call("Price.retrieve", pk)))
+
+
+def get_product(product_id):
+    """ Returns {"id", "name", "active"} for a Stripe product """
+    return _lookup("product", product_id, lambda pk: _product_to_dict(stripe_gateway.call("Product.retrieve", pk)))
+
+
+async def aget_price(price_id):
+    async def fetch(pk):
+        return _price_to_dict(await stripe_gateway.acall("Price.retrieve", pk))
+    return await _alookup("price", price_id, fetch)
+
+
+async def aget_product(product_id):
+    async def fetch(pk):
+        return _product_to_dict(await stripe_gateway.acall("Product.retrieve", pk))
+    return await _alookup("product", product_id, fetch)
+
+
+def remember(obj):
+    """ Seeds the cache from a Price / Product that was fetched anyway (e.g. through `expand`) """
+    if obj.get("object") == "price":
+        kind, value = "price", _price_to_dict(obj)
+    elif obj.get("object") == "product":
+        kind, value = "product", _product_to_dict(obj)
+    else:
+        return
+    key = _cache_key(kind, obj["id"])
+    cache.set(key, value, SHARED_TTL)
+    _local.set(key, value)
+
+
+def invalidate(kind, object_id):
+    key = _cache_key(kind, object_id)
+    _local.delete(key)
+    cache.delete(key)
+
+
+def handle_event(event):
+    """ Drops cached metadata on price.* / product.* webhook events. Returns True if the event was handled. """
+    kind = event["type"].split(".", 1)[0]
+    if kind not in ("price", "product"):
+        return False
+    invalidate(kind, event["data"]["object"]["id"])
+    return True
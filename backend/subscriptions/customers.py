@@ -0,0 +1,56 @@
+"""
+Stripe customer resolution.
+
+The customer id is stored on the user, so subscribing never has to search Stripe by email. The customer
+is created lazily, once, under a row lock and with an idempotency key, so two concurrent checkouts for
+the same user end up with the same customer.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from authentication import authentication as user_cache
+from subscriptions import stripe_gateway
+
+User = get_user_model()
+
+
+def ensure_stripe_customer(user):
+    """ Returns the user's Stripe customer id, creating the customer on first use """
+    if user.stripe_customer_id:
+        return user.stripe_customer_id
+
+    with transaction.atomic():
+        locked = User.objects.select_for_update().only("id", "email", "stripe_customer_id").get(pk=user.pk)
+        if not locked.stripe_customer_id:
+            customer = stripe_gateway.call(
+                "Customer.create",
+                email=locked.email,
+                metadata={"user_id": str(locked.pk)},
+                idempotency_key=f"customer-create-user-{locked.pk}",
+            )
+            locked.stripe_customer_id = customer.id
+            locked.save(update_fields=["stripe_customer_id"])
+
+    user.stripe_customer_id = locked.stripe_customer_id
+    return user.stripe_customer_id
+
+
+async def aensure_stripe_customer(user):
+    """
+    Async variant for the async views. Row locks aren't available to the async ORM, so this leans on the
+    idempotency key alone: concurrent callers get the same customer back and the update is a no-op for all
+    but the first.
+    """
+    if user.stripe_customer_id:
+        return user.stripe_customer_id
+
+    customer = await stripe_gateway.acall(
+        "Customer.create",
+        email=user.email,
+        metadata={"user_id": str(user.pk)},
+        idempotency_key=f"customer-create-user-{user.pk}",
+    )
+    await User.objects.filter(pk=user.pk, stripe_customer_id__isnull=True).aupdate(stripe_customer_id=customer.id)
+    await user_cache.ainvalidate(user.pk) # update() doesn't send post_save
+    user.stripe_customer_id = await User.objects.values_list("stripe_customer_id", flat=True).aget(pk=user.pk)
+    return user.stripe_customer_id
@@ -0,0 +1,300 @@
+"""
+A small in-memory stand-in for the Stripe API, for local development, tests and benchmarks.
+
+Implements just the endpoints this project uses (prices, products, customers, subscriptions, checkout
+sessions) with configurable latency and failure rate. Point the app at it with STRIPE_API_BASE, e.g.
+
+    python manage.py fake_stripe --port 12111 --latency-ms 150
+    STRIPE_API_BASE=http://127.0.0.1:12111 python manage.py runserver
+"""
+import itertools
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+PLAN_PRICES = {
+    "basic": 0,
+    "pro": 1900,
+    "enterprise": 9900,
+}
+
+
+def decode_form(pairs):
+    """ Turns Stripe's form encoding (items[0][price]=x, expand[0]=y) into nested dicts and lists """
+    result = {}
+    for key, value in pairs:
+        parts = re.findall(r"[^\[\]]+", key)
+        target = result
+        for part, following in zip(parts, parts[1:]):
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return _listify(result)
+
+
+def _listify(value):
+    if not isinstance(value, dict):
+        return value
+    if value and all(key.isdigit() for key in value):
+        return [_listify(value[key]) for key in sorted(value, key=int)]
+    return {key: _listify(item) for key, item in value.items()}
+
+
+class FakeStripeState:
+    def __init__(self, price_ids=None):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.customers = {}
+        self.subscriptions = {}
+        self.prices = {}
+        self.products = {}
+        self.idempotent_responses = {}
+        self.request_count = 0
+        for plan, price_id in (price_ids or {}).items():
+            self.add_price(price_id, plan.capitalize(), PLAN_PRICES.get(plan, 1000))
+
+    def new_id(self, prefix):
+        return f"{prefix}_fake{next(self.ids):08d}"
+
+    def add_price(self, price_id, product_name, unit_amount, currency="usd", interval="month"):
+        product_id = f"prod_{price_id}"
+        self.products[product_id] = {"id": product_id, "object": "product", "name": product_name, "active": True}
+        self.prices[price_id] = {
+            "id": price_id,
+            "object": "price",
+            "product": product_id,
+            "unit_amount": unit_amount,
+            "currency": currency,
+            "recurring": {"interval": interval},
+            "nickname": None,
+        }
+        return self.prices[price_id]
+
+    def create_customer(self, params):
+        customer = {
+            "id": self.new_id("cus"),
+            "object": "customer",
+            "email": params.get("email"),
+            "metadata": params.get("metadata", {}),
+        }
+        self.customers[customer["id"]] = customer
+        return customer
+
+    def create_subscription(self, customer_id, price_id, status="active"):
+        now = int(time.time())
+        subscription = {
+            "id": self.new_id("sub"),
+            "object": "subscription",
+            "customer": customer_id,
+            "status": status,
+            "created": now,
+            "current_period_end": now + 30 * 24 * 3600,
+            "cancel_at_period_end": False,
+            "items": {"object": "list", "data": [], "has_more": False, "url": "/v1/subscription_items"},
+        }
+        self.set_price(subscription, price_id)
+        self.subscriptions[subscription["id"]] = subscription
+        return subscription
+
+    def set_price(self, subscription, price_id):
+        subscription["items"]["data"] = [{"id": self.new_id("si"), "object": "subscription_item", "price_id": price_id}]
+
+    def render_subscription(self, subscription, expand=()):
+        rendered = dict(subscription)
+        items = []
+        for item in subscription["items"]["data"]:
+            price = dict(self.prices[item["price_id"]])
+            if any(path.endswith("price.product") for path in expand):
+                price["product"] = self.products[price["product"]]
+            items.append({"id": item["id"], "object": "subscription_item", "price": price})
+        rendered["items"] = dict(subscription["items"], data=items)
+        return rendered
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    server_version = "FakeStripe/1.0"
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True # keep-alive + delayed ACKs would otherwise add ~40ms per response
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        params = decode_form(parse_qsl(url.query))
+        if method == "POST":
+            length = int(self.headers.get("Content-Length") or 0)
+            params.update(decode_form(parse_qsl(self.rfile.read(length).decode())))
+
+        server = self.server
+        if server.latency:
+            time.sleep(max(0.0, random.gauss(server.latency, server.latency * server.jitter)))
+        if server.failure_rate and random.random() < server.failure_rate:
+            return self.respond(500, {"error": {"type": "api_error", "message": "Injected failure"}})
+
+        state = server.state
+        idempotency_key = self.headers.get("Idempotency-Key")
+        with state.lock:
+            state.request_count += 1
+            if idempotency_key and idempotency_key in state.idempotent_responses:
+                return self.respond(*state.idempotent_responses[idempotency_key])
+            status, body = self.route(state, method, url.path, params)
+            if idempotency_key and method == "POST":
+                state.idempotent_responses[idempotency_key] = (status, body)
+        self.respond(status, body)
+
+    def route(self, state, method, path, params):
+        expand = params.get("expand") or []
+        match = re.fullmatch(r"/v1/(\w+)(?:/(\w+))?(?:/(\w+))?", path)
+        if not match:
+            return self.not_found(path)
+        resource, object_id, sub_resource = match.groups()
+
+        if resource == "prices" and method == "GET" and object_id in state.prices:
+            return 200, state.prices[object_id]
+        if resource == "products" and method == "GET" and object_id in state.products:
+            return 200, state.products[object_id]
+
+        if resource == "customers":
+            if method == "POST" and object_id is None:
+                return 200, state.create_customer(params)
+            if method == "GET" and object_id is None:
+                customers = [c for c in state.customers.values() if params.get("email") in (None, c["email"])]
+                return 200, self.page(customers, params, "/v1/customers")
+            if method == "GET" and object_id in state.customers:
+                return 200, state.customers[object_id]
+
+        if resource == "checkout" and object_id == "sessions" and method == "POST":
+            session_id = state.new_id("cs")
+            return 200, {"id": session_id, "object": "checkout.session", "url": f"https://checkout.fake/{session_id}"}
+
+        if resource == "subscriptions":
+            if object_id is None and method == "GET":
+                subscriptions = [
+                    s for s in state.subscriptions.values()
+                    if params.get("customer") in (None, s["customer"])
+                    and (params.get("status", "all") == "all" or s["status"] == params.get("status"))
+                    and self.created_matches(s["created"], params.get("created"))
+                ]
+                page = self.page(subscriptions, params, "/v1/subscriptions")
+                page["data"] = [state.render_subscription(s, expand) for s in page["data"]]
+                return 200, page
+            if object_id is None and method == "POST":
+                price_id = params["items"][0]["price"]
+                return 200, state.render_subscription(state.create_subscription(params["customer"], price_id), expand)
+            subscription = state.subscriptions.get(object_id)
+            if subscription is None:
+                return self.not_found(path)
+            if method == "POST":
+                if params.get("items"):
+                    state.set_price(subscription, params["items"][0]["price"])
+                if "cancel_at_period_end" in params:
+                    subscription["cancel_at_period_end"] = params["cancel_at_period_end"] == "true"
+            elif method == "DELETE":
+                subscription["status"] = "canceled"
+            return 200, state.render_subscription(subscription, expand)
+
+        return self.not_found(path)
+
+    def created_matches(self, created, bounds):
+        if not isinstance(bounds, dict):
+            return bounds is None or created == int(bounds)
+        checks = {"gt": int.__gt__, "gte": int.__ge__, "lt": int.__lt__, "lte": int.__le__}
+        return all(checks[op](created, int(value)) for op, value in bounds.items() if op in checks)
+
+    def page(self, objects, params, url):
+        """ Cursor pagination the way Stripe does it: newest first, limit + starting_after """
+        objects = sorted(objects, key=lambda obj: obj["id"], reverse=True)
+        if params.get("starting_after"):
+            objects = [obj for obj in objects if obj["id"] < params["starting_after"]]
+        limit = min(int(params.get("limit", 10)), 100)
+        return {"object": "list", "url": url, "data": objects[:limit], "has_more": len(objects) > limit}
+
+    def not_found(self, path):
+        return 404, {"error": {"type": "invalid_request_error", "message": f"No such resource: {path}"}}
+
+    def respond(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("Request-Id", f"req_fake{random.randrange(10 ** 8):08d}")
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeStripeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024 # load tests open hundreds of connections at once
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0, jitter=0.1, failure_rate=0.0, price_ids=None, verbose=False):
+        super().__init__((host, port), FakeStripeHandler)
+        self.latency = latency_ms / 1000
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.verbose = verbose
+        self.state = FakeStripeState(price_ids)
+        self._thread = None
+
+    def handle_error(self, request, client_address):
+        # Clients that time out on purpose (see the gateway's per-call timeouts) aren't worth a traceback
+        if self.verbose:
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """ Serves from a background thread; returns self so it can be used as `with FakeStripeServer().start():` """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _serve(ready, options):
+    server = FakeStripeServer(**options)
+    ready.put(server.url)
+    server.serve_forever()
+
+
+@contextmanager
+def fake_stripe_process(**options):
+    """
+    Runs a FakeStripeServer in a child process and yields its URL. Load tests use this so the fake's
+    request handling doesn't compete with the code under test for the GIL.
+    """
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(ready, options), daemon=True)
+    process.start()
+    try:
+        yield ready.get(timeout=10)
+    finally:
+        process.terminate()
+        process.join()
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from subscriptions.fake_stripe import FakeStripeServer
+
+
+class Command(BaseCommand):
+    help = "Runs a local in-memory fake of the Stripe API (use with STRIPE_API_BASE=http://host:port)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=12111)
+        parser.add_argument("--latency-ms", type=float, default=0, help="Average latency added to every request.")
+        parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests answered with a 500.")
+        parser.add_argument("--verbose", action="store_true")
+
+    def handle(self, *args, **options):
+        server = FakeStripeServer(
+            host=options["host"],
+            port=options["port"],
+            latency_ms=options["latency_ms"],
+            failure_rate=options["failure_rate"],
+            price_ids=settings.STRIPE_PRICE_IDS,
+            verbose=options["verbose"],
+        )
+        self.stdout.write(f"Fake Stripe listening on {server.url} (latency {options['latency_ms']} ms)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
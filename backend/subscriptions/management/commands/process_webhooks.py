@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dashboard.broker import reaches_other_processes
+from subscriptions.webhooks import process_batch
+
+
+class Command(BaseCommand):
+    help = "Applies queued Stripe webhook events. Safe to run several workers in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--loop", action="store_true", help="Keep polling the queue instead of exiting when it is empty.")
+        parser.add_argument("--sleep", type=float, default=1.0, help="Seconds to wait between polls when the queue is empty.")
+
+    def handle(self, *args, **options):
+        if not reaches_other_processes(): # the changes applied here would never show up on open dashboards
+            self.stderr.write(self.style.WARNING(
+                "Live dashboard streams won't see these updates: they need LIVE_BROKER=cache with a shared cache "
+                "backend (e.g. REDIS_URL), see dashboard/broker.py."
+            ))
+
+        total = 0
+        while True:
+            handled = process_batch(options["batch_size"])
+            total += handled
+            if handled:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} webhook events."))
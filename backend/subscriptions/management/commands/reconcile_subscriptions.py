@@ -0,0 +1,90 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+
+from subscriptions import reconcile
+from subscriptions.models import Subscription
+
+
+class Command(BaseCommand):
+    help = (
+        "Resyncs the local Subscription mirror with Stripe (e.g. after missed webhooks) by paging through "
+        "Subscription.list and bulk-updating whatever drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing anything.")
+        parser.add_argument(
+            "--checkpoint", metavar="PATH",
+            help="Progress file; an existing one is resumed, and it's removed once the run completes.",
+        )
+        parser.add_argument("--concurrency", type=int, default=4, help="Number of time slices paged in parallel.")
+        parser.add_argument(
+            "--rate", type=float, default=20.0,
+            help="Max Stripe requests per second across all threads (Stripe allows 100/s live, 25/s in test mode).",
+        )
+        parser.add_argument("--batch-size", type=int, default=500, help="Rows per bulk_update / bulk_create.")
+        parser.add_argument(
+            "--since", type=datetime.fromisoformat,
+            help="Only subscriptions created in Stripe on or after this date (default: a day before the oldest local one).",
+        )
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1 or options["rate"] <= 0 or options["batch_size"] < 1:
+            raise CommandError("--concurrency, --rate and --batch-size must be positive.")
+
+        try:
+            state = reconcile.load_checkpoint(options["checkpoint"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if state is not None:
+            done = sum(time_slice["done"] for time_slice in state["slices"])
+            self.stdout.write(f"Resuming from {options['checkpoint']} ({done}/{len(state['slices'])} slices done).")
+        else:
+            until = int(datetime.now(timezone.utc).timestamp()) + 60
+            state = reconcile.new_state(self.since(options["since"]), until, options["concurrency"])
+
+        reconciler = reconcile.Reconciler(
+            state,
+            concurrency=options["concurrency"],
+            rate=options["rate"],
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+            checkpoint_path=options["checkpoint"],
+            progress=self.progress if options["verbosity"] > 1 else None,
+        )
+        stats = reconciler.run()
+
+        updated, created = ("would update", "would create") if options["dry_run"] else ("updated", "created")
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {stats['seen']} Stripe subscriptions: {updated} {stats['updated']}, "
+            f"{created} {stats['created']}, {stats['unchanged']} unchanged, "
+            f"{stats['unknown_customer']} with unknown customers."
+        ))
+
+        if reconciler.errors:
+            for index, error in reconciler.errors.items():
+                self.stderr.write(f"Slice {index} failed: {error}")
+            hint = f" Rerun with --checkpoint {options['checkpoint']} to resume." if options["checkpoint"] else ""
+            raise CommandError(f"{len(reconciler.errors)} slices failed.{hint}")
+        if options["checkpoint"] and not options["dry_run"] and reconciler.complete:
+            os.remove(options["checkpoint"])
+
+    def since(self, since):
+        if since is None:
+            oldest = (
+                Subscription.objects.exclude(stripe_subscription_id__isnull=True)
+                .aggregate(oldest=Min("created_at"))["oldest"]
+            )
+            if oldest is None:
+                return 0
+            since = oldest - timedelta(days=1) # Stripe's `created` can be a bit older than our row
+        elif since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return int(since.timestamp())
+
+    def progress(self, stats):
+        if stats["pages"] % 50 == 0:
+            self.stdout.write(f"  {stats['pages']} pages, {stats['seen']} subscriptions checked")
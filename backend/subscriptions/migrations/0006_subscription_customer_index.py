@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 18:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0005_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='subscription',
+            name='stripe_customer_id',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.5 on 2026-10-18 18:58
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_canceled_at(apps, schema_editor):
+    """ Best guess for rows that were already inactive: the last time they were saved """
+    Subscription = apps.get_model("subscriptions", "Subscription")
+    Subscription.objects.filter(is_active=False, canceled_at__isnull=True).update(canceled_at=F("updated_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0006_subscription_customer_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='canceled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['created_at'], name='subscription_created'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['canceled_at'], name='subscription_canceled'),
+        ),
+        migrations.RunPython(backfill_canceled_at, migrations.RunPython.noop),
+    ]
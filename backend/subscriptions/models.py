@@ -1,15 +1,26 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 class Subscription(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    stripe_customer_id = models.CharField(max_length=255)
-    stripe_subscription_id = models.CharField(max_length=255, null=True, blank=True)
+    stripe_customer_id = models.CharField(max_length=255, db_index=True)
+    stripe_subscription_id = models.CharField(max_length=255, null=True, blank=True, db_index=True)
     plan = models.CharField(max_length=50, default="basic")
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Local mirror of the Stripe subscription, kept current by webhooks and reconcile_subscriptions (see sync.py)
+    status = models.CharField(max_length=32, blank=True, default="")
+    current_period_end = models.DateTimeField(null=True, blank=True)
+    price_id = models.CharField(max_length=255, blank=True, default="")
+    product_name = models.CharField(max_length=255, blank=True, default="")
+    amount = models.PositiveIntegerField(null=True, blank=True) # in the currency's smallest unit, as Stripe sends it
+    currency = models.CharField(max_length=3, blank=True, default="")
+    interval = models.CharField(max_length=16, blank=True, default="") # billing interval of the price: month, year, ...
+    canceled_at = models.DateTimeField(null=True, blank=True) # when it stopped being active; cleared if it's reactivated
+
     PLAN_CHOICES = [
     ("basic", "Basic"),
     ("pro", "Pro"),
@@ -18,6 +29,48 @@ class Subscription(models.Model):
 
     plan = models.CharField(max_length=50, choices=PLAN_CHOICES, default="basic")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "is_active"], name="subscription_user_active"),
+            models.Index(fields=["created_at"], name="subscription_created"), # admin metrics: new per day
+            models.Index(fields=["canceled_at"], name="subscription_canceled"), # admin metrics: churned per day
+        ]
+
+    @property
+    def plan_name(self):
+        return self.product_name or self.get_plan_display()
 
     def __str__(self):
         return f"Subscription of {self.user.email} for plan {self.plan}"
+
+class WebhookEvent(models.Model):
+    """ Raw Stripe webhook events, queued by the webhook endpoint and applied by process_webhooks """
+    PENDING = "pending"
+    PROCESSED = "processed"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (PROCESSED, "Processed"),
+        (FAILED, "Failed"),
+    ]
+
+    stripe_event_id = models.CharField(max_length=255, unique=True) # Stripe retries reuse the id, so duplicates are dropped on insert
+    type = models.CharField(max_length=100)
+    object_id = models.CharField(max_length=255, blank=True, default="") # events for the same object are applied in order
+    payload = models.JSONField()
+    stripe_created = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    available_at = models.DateTimeField(default=timezone.now) # pushed back after a failed attempt
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "stripe_created", "id"], name="webhook_queue"),
+            models.Index(fields=["object_id", "stripe_created"], name="webhook_object_order"),
+        ]
+
+    def __str__(self):
+        return f"{self.type} ({self.stripe_event_id}) - {self.status}"
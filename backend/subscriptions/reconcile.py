@@ -0,0 +1,237 @@
+"""
+Bulk resync of the local Subscription mirror with Stripe, used by the reconcile_subscriptions command.
+
+Stripe's subscription list is split into `created` time slices that fetcher threads page through in
+parallel, all sharing one RateLimiter. The calling thread diffs each page against the local rows (one query
+per page, by stripe_subscription_id) and writes the changes with bulk_update / bulk_create. The page queue is
+bounded, so memory stays flat however many subscriptions there are. The per-slice cursors are saved to a
+checkpoint file after every flush, so an interrupted run picks up where it stopped.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import stripe
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from subscriptions import stripe_gateway, sync
+from subscriptions.models import Subscription
+
+User = get_user_model()
+
+PAGE_SIZE = 100 # Stripe's maximum
+CHECKPOINT_VERSION = 1
+
+
+class RateLimiter:
+    """ Token bucket shared by the fetcher threads; slow_down() halves the rate after Stripe answers 429 """
+
+    def __init__(self, rate, min_rate=1.0):
+        self.rate = float(rate)
+        self.min_rate = min(min_rate, self.rate)
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def slow_down(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+
+def time_slices(since, until, count):
+    """ Splits [since, until) (unix timestamps) into `count` contiguous ranges for Stripe's `created` filter """
+    count = max(1, min(count, until - since))
+    step = (until - since) / count
+    bounds = [since + round(step * i) for i in range(count)] + [until]
+    return [{"gte": low, "lt": high, "starting_after": None, "done": False} for low, high in zip(bounds, bounds[1:])]
+
+
+def load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        state = json.load(f)
+    if state.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"{path} is not a reconcile checkpoint this version understands.")
+    return state
+
+
+def save_checkpoint(path, state):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path) # never leave a half-written checkpoint behind
+
+
+def new_state(since, until, concurrency):
+    return {"version": CHECKPOINT_VERSION, "since": since, "until": until, "slices": time_slices(since, until, concurrency)}
+
+
+class Reconciler:
+    def __init__(self, state, concurrency=4, rate=20.0, batch_size=500, page_size=PAGE_SIZE,
+                 dry_run=False, checkpoint_path=None, progress=None):
+        self.state = state
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate)
+        self.batch_size = batch_size
+        self.page_size = min(page_size, PAGE_SIZE)
+        self.dry_run = dry_run
+        self.checkpoint_path = None if dry_run else checkpoint_path
+        self.progress = progress
+
+        self.pages = queue.Queue(maxsize=concurrency * 2) # back-pressure: fetchers wait while the writer catches up
+        self.stop = threading.Event()
+        self.to_update = []
+        self.to_create = []
+        self.cursors = {} # slice index -> (starting_after, done), applied to the checkpoint on the next flush
+        self.errors = {}
+        self.stats = {"pages": 0, "seen": 0, "updated": 0, "created": 0, "unchanged": 0, "unknown_customer": 0}
+
+    def run(self):
+        pending = [index for index, time_slice in enumerate(self.state["slices"]) if not time_slice["done"]]
+        executor = ThreadPoolExecutor(max_workers=max(1, min(self.concurrency, len(pending))))
+        try:
+            for index in pending:
+                executor.submit(self._fetch_slice, index)
+            remaining = len(pending)
+            while remaining:
+                kind, index, payload = self.pages.get()
+                if kind == "error":
+                    self.errors[index] = payload
+                    remaining -= 1
+                    continue
+                data, last_id, done = payload
+                self._diff_page(data)
+                self.cursors[index] = (last_id, done)
+                if done:
+                    remaining -= 1
+                if len(self.to_update) + len(self.to_create) >= self.batch_size:
+                    self._flush()
+            self._flush()
+        finally:
+            self.stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+        return self.stats
+
+    @property
+    def complete(self):
+        return all(time_slice["done"] for time_slice in self.state["slices"])
+
+    def _put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fetch_slice(self, index):
+        try:
+            self._fetch_pages(index)
+        except Exception as e: # run() waits for every slice to finish or fail, so nothing may escape
+            self._put(("error", index, e))
+
+    def _fetch_pages(self, index):
+        time_slice = self.state["slices"][index]
+        starting_after = time_slice["starting_after"]
+        while not self.stop.is_set():
+            params = {"starting_after": starting_after} if starting_after else {}
+            self.limiter.acquire()
+            try:
+                page = stripe_gateway.call(
+                    "Subscription.list",
+                    status="all", # canceled subscriptions too, that's usually what drifted
+                    limit=self.page_size,
+                    created={"gte": time_slice["gte"], "lt": time_slice["lt"]},
+                    **params,
+                )
+            except stripe.error.RateLimitError:
+                self.limiter.slow_down() # the gateway already retried; back off for everyone and try again
+                continue
+
+            data = list(page["data"])
+            done = not page["has_more"] or not data
+            if data:
+                starting_after = data[-1]["id"]
+            if not self._put(("page", index, (data, starting_after, done))) or done:
+                return
+
+    def _customers_to_users(self, customer_ids):
+        users = dict(
+            User.objects.filter(stripe_customer_id__in=customer_ids).values_list("stripe_customer_id", "pk")
+        )
+        rest = set(customer_ids) - users.keys()
+        if rest:
+            for customer_id, user_id in (
+                Subscription.objects.filter(stripe_customer_id__in=rest).values_list("stripe_customer_id", "user_id")
+            ):
+                users.setdefault(customer_id, user_id)
+        return users
+
+    def _diff_page(self, data):
+        self.stats["pages"] += 1
+        self.stats["seen"] += len(data)
+
+        local = defaultdict(list)
+        for subscription in Subscription.objects.filter(stripe_subscription_id__in=[s["id"] for s in data]):
+            local[subscription.stripe_subscription_id].append(subscription)
+        missing = [stripe_sub for stripe_sub in data if stripe_sub["id"] not in local]
+        users = self._customers_to_users({stripe_sub["customer"] for stripe_sub in missing}) if missing else {}
+
+        now = timezone.now()
+        for stripe_sub in data:
+            rows = local.get(stripe_sub["id"])
+            if rows is None:
+                user_id = users.get(stripe_sub["customer"])
+                if user_id is None:
+                    self.stats["unknown_customer"] += 1 # created outside this app, same as sync.apply_subscription
+                    continue
+                subscription = Subscription(user_id=user_id, stripe_subscription_id=stripe_sub["id"])
+                sync.update_from_stripe(subscription, stripe_sub, save=False)
+                self.to_create.append(subscription)
+                continue
+            for subscription in rows:
+                if sync.update_from_stripe(subscription, stripe_sub, save=False):
+                    subscription.updated_at = now # bulk_update skips auto_now
+                    self.to_update.append(subscription)
+                else:
+                    self.stats["unchanged"] += 1
+
+        if self.progress:
+            self.progress(self.stats)
+
+    def _flush(self):
+        if not self.dry_run and (self.to_update or self.to_create):
+            with transaction.atomic():
+                Subscription.objects.bulk_update(
+                    self.to_update, [*sync.MIRROR_FIELDS, "updated_at"], batch_size=self.batch_size
+                )
+                Subscription.objects.bulk_create(self.to_create, batch_size=self.batch_size)
+        self.stats["updated"] += len(self.to_update)
+        self.stats["created"] += len(self.to_create)
+        self.to_update, self.to_create = [], []
+
+        for index, (starting_after, done) in self.cursors.items():
+            self.state["slices"][index].update(starting_after=starting_after, done=done)
+        self.cursors = {}
+        if self.checkpoint_path:
+            save_checkpoint(self.checkpoint_path, self.state)
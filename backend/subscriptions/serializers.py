@@ -0,0 +1,18 @@
+"""
+Subscription as the API returns it, shared by the subscription views and the dashboard.
+"""
+
+
+def serialize_subscription(subscription):
+    return {
+        "subscription_id": subscription.stripe_subscription_id,
+        "plan": subscription.plan_name,
+        "status": subscription.status,
+        "is_active": subscription.is_active,
+        "current_period_end": subscription.current_period_end,
+        "price_id": subscription.price_id,
+        "amount": subscription.amount,
+        "currency": subscription.currency,
+        "created_at": subscription.created_at,
+        "updated_at": subscription.updated_at,
+    }
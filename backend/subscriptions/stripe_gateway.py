@@ -0,0 +1,317 @@
+"""
+Single entry point for every Stripe API call.
+
+    from subscriptions import stripe_gateway
+    price = stripe_gateway.call("Price.retrieve", price_id)
+    price = await stripe_gateway.acall("Price.retrieve", price_id)  # from async views
+
+The gateway owns the SDK configuration (API key, optional STRIPE_API_BASE for a local fake server, a pooled
+keep-alive HTTP session and an httpx pool for the *_async SDK methods) and wraps each call with a timeout,
+jittered retries for calls that are safe to repeat, a circuit breaker that fails fast while Stripe is
+unhealthy, and per-operation latency stats.
+"""
+import asyncio
+import contextvars
+import random
+import ssl
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+
+import requests
+import stripe
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from config import instrumentation
+
+try:
+    import httpx
+except ImportError: # only needed by the async views
+    httpx = None
+
+# Read-only calls can always be retried; writes only when the caller passes an idempotency_key
+IDEMPOTENT_METHODS = {"retrieve", "list", "search"}
+
+_call_timeout = contextvars.ContextVar("stripe_call_timeout", default=None)
+
+
+class CircuitOpenError(stripe.error.APIConnectionError):
+    """ Raised instead of calling Stripe while the circuit breaker is open """
+
+
+class _PooledRequestsClient(stripe.RequestsClient):
+    """ RequestsClient whose timeout can be overridden per call (the SDK only supports a client-wide one) """
+
+    @property
+    def _timeout(self):
+        return _call_timeout.get() or self._default_timeout
+
+    @_timeout.setter
+    def _timeout(self, value):
+        self._default_timeout = value
+
+
+class _PooledHTTPXClient(stripe.HTTPXClient):
+    """
+    Async client used by the *_async SDK methods. httpx connection pools belong to one event loop, so one
+    AsyncClient is kept per running loop (an ASGI server has one; async_to_sync creates short-lived ones).
+    """
+
+    def __init__(self, timeout, pool_size, **kwargs):
+        self._pool_size = pool_size
+        self._loop_clients = weakref.WeakKeyDictionary()
+        super().__init__(timeout=timeout, **kwargs)
+
+    @property
+    def _timeout(self):
+        return _call_timeout.get() or self._default_timeout
+
+    @_timeout.setter
+    def _timeout(self, value):
+        self._default_timeout = value
+
+    @property
+    def _client_async(self):
+        loop = asyncio.get_running_loop()
+        client = self._loop_clients.get(loop)
+        if client is None:
+            verify = ssl.create_default_context(cafile=stripe.ca_bundle_path) if self._verify_ssl_certs else False
+            limits = httpx.Limits(max_connections=self._pool_size, max_keepalive_connections=self._pool_size)
+            client = self._loop_clients[loop] = httpx.AsyncClient(verify=verify, limits=limits)
+        return client
+
+    @_client_async.setter
+    def _client_async(self, value):
+        pass # the SDK's own AsyncClient is replaced by the per-loop ones above
+
+
+class CircuitBreaker:
+    """ Opens after `failure_threshold` consecutive failures and lets a single trial call through after `reset_timeout` """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+@dataclass
+class OperationStats:
+    count: int = 0
+    errors: int = 0
+    retries: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "retries": self.retries,
+            "total_seconds": round(self.total_seconds, 6),
+            "avg_ms": round(self.total_seconds / self.count * 1000, 2) if self.count else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 2),
+        }
+
+
+def is_retryable(error):
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, (stripe.error.APIConnectionError, stripe.error.RateLimitError)):
+        return True
+    return isinstance(error, stripe.error.APIError) and (error.http_status or 500) >= 500
+
+
+def trips_breaker(error):
+    """ Client errors (bad params, declined cards, ...) say nothing about Stripe's health """
+    if isinstance(error, stripe.error.APIConnectionError):
+        return True
+    return isinstance(error, stripe.error.APIError) and (error.http_status or 500) >= 500
+
+
+class StripeGateway:
+    def __init__(self, api_key, api_base=None, timeout=10.0, max_retries=2, backoff=0.25,
+                 pool_size=20, async_pool_size=200, failure_threshold=5, reset_timeout=30.0):
+        self.api_key = api_key
+        self.api_base = api_base
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        async_client = _PooledHTTPXClient(timeout=timeout, pool_size=async_pool_size) if httpx else None
+        self.http_client = _PooledRequestsClient(timeout=timeout, session=session, async_fallback_client=async_client)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            api_key=settings.STRIPE_SECRET_KEY,
+            api_base=getattr(settings, "STRIPE_API_BASE", None),
+            timeout=getattr(settings, "STRIPE_TIMEOUT", 10.0),
+            max_retries=getattr(settings, "STRIPE_MAX_RETRIES", 2),
+            pool_size=getattr(settings, "STRIPE_POOL_SIZE", 20),
+            async_pool_size=getattr(settings, "STRIPE_ASYNC_POOL_SIZE", 200),
+            failure_threshold=getattr(settings, "STRIPE_CIRCUIT_FAILURE_THRESHOLD", 5),
+            reset_timeout=getattr(settings, "STRIPE_CIRCUIT_RESET_TIMEOUT", 30.0),
+        )
+
+    def install(self):
+        """ Points the global SDK configuration at this gateway """
+        stripe.api_key = self.api_key
+        if self.api_base:
+            stripe.api_base = self.api_base
+        stripe.default_http_client = self.http_client
+        stripe.max_network_retries = 0 # retries are handled in call()
+        return self
+
+    def resolve(self, operation):
+        target = stripe
+        for part in operation.split("."):
+            target = getattr(target, part)
+        return target
+
+    def is_retryable_call(self, operation, kwargs):
+        return operation.rsplit(".", 1)[-1] in IDEMPOTENT_METHODS or "idempotency_key" in kwargs
+
+    def _check_breaker(self, operation):
+        if not self.breaker.allow():
+            self._record(operation, 0.0, error=True)
+            raise CircuitOpenError(f"Stripe circuit breaker is open, not calling {operation}.")
+
+    def _failed(self, operation, error, elapsed, attempt, attempts):
+        """ Records a failed attempt; returns the backoff to sleep before retrying or raises if out of attempts """
+        self._record(operation, elapsed, error=True, retry=attempt > 0)
+        if trips_breaker(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        if attempt + 1 >= attempts or not is_retryable(error):
+            raise error
+        return self.backoff * 2 ** attempt * random.uniform(0.5, 1.5) # jittered exponential backoff
+
+    def _succeeded(self, operation, elapsed, attempt):
+        self._record(operation, elapsed, retry=attempt > 0)
+        self.breaker.record_success()
+
+    def call(self, operation, *args, timeout=None, **kwargs):
+        """ Runs e.g. call("Subscription.modify", sub_id, items=[...]) with retries, breaker and stats """
+        func = self.resolve(operation)
+        attempts = 1 + (self.max_retries if self.is_retryable_call(operation, kwargs) else 0)
+
+        token = _call_timeout.set(timeout)
+        try:
+            for attempt in range(attempts):
+                self._check_breaker(operation)
+                started = time.perf_counter()
+                try:
+                    result = func(*args, **kwargs)
+                except stripe.error.StripeError as error:
+                    time.sleep(self._failed(operation, error, time.perf_counter() - started, attempt, attempts))
+                    continue
+                self._succeeded(operation, time.perf_counter() - started, attempt)
+                return result
+        finally:
+            _call_timeout.reset(token)
+
+    async def acall(self, operation, *args, timeout=None, **kwargs):
+        """ Async twin of call(), backed by the SDK's *_async methods and the httpx pool """
+        func = self.resolve(f"{operation}_async")
+        attempts = 1 + (self.max_retries if self.is_retryable_call(operation, kwargs) else 0)
+
+        token = _call_timeout.set(timeout)
+        try:
+            for attempt in range(attempts):
+                self._check_breaker(operation)
+                started = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                except stripe.error.StripeError as error:
+                    await asyncio.sleep(self._failed(operation, error, time.perf_counter() - started, attempt, attempts))
+                    continue
+                self._succeeded(operation, time.perf_counter() - started, attempt)
+                return result
+        finally:
+            _call_timeout.reset(token)
+
+    def _record(self, operation, elapsed, error=False, retry=False):
+        instrumentation.record_stripe_call(elapsed) # per-request numbers for /metrics
+        with self._stats_lock:
+            stats = self.stats.setdefault(operation, OperationStats())
+            stats.count += 1
+            stats.errors += int(error)
+            stats.retries += int(retry)
+            stats.total_seconds += elapsed
+            stats.max_seconds = max(stats.max_seconds, elapsed)
+
+    def snapshot(self):
+        with self._stats_lock:
+            return {operation: stats.as_dict() for operation, stats in self.stats.items()}
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = StripeGateway.from_settings().install()
+    return _gateway
+
+
+def set_gateway(gateway):
+    """ Swaps the process-wide gateway, e.g. for one pointed at a fake Stripe server """
+    global _gateway
+    with _gateway_lock:
+        _gateway = gateway.install() if gateway is not None else None
+
+
+def call(operation, *args, **kwargs):
+    return get_gateway().call(operation, *args, **kwargs)
+
+
+async def acall(operation, *args, **kwargs):
+    return await get_gateway().acall(operation, *args, **kwargs)
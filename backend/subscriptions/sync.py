@@ -0,0 +1,117 @@
+"""
+Keeps the local Subscription rows in step with Stripe.
+
+Everything that learns about a Stripe subscription (webhooks, the upgrade endpoint, the reconcile command)
+funnels the object through apply_subscription(), so read endpoints can serve purely from the database.
+"""
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone as django_timezone
+
+from subscriptions import catalog
+from subscriptions.models import Subscription
+
+User = get_user_model()
+
+ACTIVE_STATUSES = {"active", "trialing"}
+
+# Every field mirror_fields() can set, for bulk_update()
+MIRROR_FIELDS = (
+    "stripe_customer_id", "status", "is_active", "current_period_end", "price_id", "product_name", "amount",
+    "currency", "interval", "plan", "canceled_at",
+)
+
+
+def plan_for_price(price_id):
+    for plan, plan_price_id in settings.STRIPE_PRICE_IDS.items():
+        if plan_price_id == price_id:
+            return plan
+    return None
+
+
+def mirror_fields(stripe_sub):
+    """ Maps a Stripe subscription object onto Subscription field values """
+    price = stripe_sub["items"]["data"][0]["price"]
+    product = price["product"]
+    if isinstance(product, str):
+        product = catalog.get_product(product)
+
+    period_end = stripe_sub.get("current_period_end")
+    fields = {
+        "stripe_customer_id": stripe_sub["customer"],
+        "status": stripe_sub["status"],
+        "is_active": stripe_sub["status"] in ACTIVE_STATUSES,
+        "current_period_end": datetime.fromtimestamp(period_end, tz=timezone.utc) if period_end else None,
+        "price_id": price["id"],
+        "product_name": product.get("name") or "",
+        "amount": price.get("unit_amount"),
+        "currency": price.get("currency") or "",
+        "interval": (price.get("recurring") or {}).get("interval") or "",
+    }
+    plan = plan_for_price(price["id"])
+    if plan:
+        fields["plan"] = plan
+    return fields
+
+
+def canceled_at(subscription, stripe_sub, is_active):
+    """ When the subscription stopped being active: kept once set, None again if it's reactivated """
+    if is_active:
+        return None
+    if subscription.canceled_at is not None:
+        return subscription.canceled_at
+    ended = stripe_sub.get("ended_at") or stripe_sub.get("canceled_at")
+    return datetime.fromtimestamp(ended, tz=timezone.utc) if ended else django_timezone.now()
+
+
+def update_from_stripe(subscription, stripe_sub, save=True):
+    """ Copies the Stripe state onto `subscription`; returns True if anything changed """
+    changed = False
+    fields = mirror_fields(stripe_sub)
+    fields["canceled_at"] = canceled_at(subscription, stripe_sub, fields["is_active"])
+    for field, value in fields.items():
+        if getattr(subscription, field) != value:
+            setattr(subscription, field, value)
+            changed = True
+    if changed and save:
+        subscription.save()
+    return changed
+
+
+def find_user_for_customer(customer_id):
+    user = User.objects.filter(stripe_customer_id=customer_id).first()
+    if user is not None:
+        return user
+    existing = Subscription.objects.filter(stripe_customer_id=customer_id).select_related("user").first()
+    return existing.user if existing else None
+
+
+def apply_subscription(stripe_sub):
+    """ Creates or updates the local mirror row for a Stripe subscription object """
+    subscription = Subscription.objects.filter(stripe_subscription_id=stripe_sub["id"]).first()
+    if subscription is None:
+        user = find_user_for_customer(stripe_sub["customer"])
+        if user is None:
+            return None # a customer we don't know about (e.g. created outside this app)
+        subscription = Subscription(user=user, stripe_subscription_id=stripe_sub["id"])
+        update_from_stripe(subscription, stripe_sub, save=False)
+        subscription.save()
+        return subscription
+
+    update_from_stripe(subscription, stripe_sub)
+    return subscription
+
+
+def set_active(stripe_subscription_id, is_active, status):
+    """ Used by the invoice.* events, which only tell us whether the latest payment went through """
+    now = django_timezone.now()
+    return Subscription.objects.filter(stripe_subscription_id=stripe_subscription_id).update(
+        is_active=is_active,
+        status=status,
+        canceled_at=None if is_active else Coalesce("canceled_at", Value(now)),
+        updated_at=now,
+    )
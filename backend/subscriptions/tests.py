@@ -1,3 +1,348 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
 
-# Create your tests here.
+import stripe
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from subscriptions import async_views, catalog, customers, reconcile, stripe_gateway, sync, webhooks
+from subscriptions.fake_stripe import FakeStripeServer
+from subscriptions.models import Subscription, WebhookEvent
+
+
+class FakeStripeMixin:
+    """ Points the Stripe gateway at an in-memory FakeStripeServer (self.stripe) for each test """
+    gateway_options = {}
+
+    def setUp(self):
+        super().setUp()
+        self.stripe = FakeStripeServer(price_ids=settings.STRIPE_PRICE_IDS).start()
+        self.addCleanup(self.stripe.stop)
+        api_base = stripe.api_base
+        self.addCleanup(setattr, stripe, "api_base", api_base)
+        self.gateway = stripe_gateway.StripeGateway("sk_test_fake", api_base=self.stripe.url, backoff=0, **self.gateway_options)
+        stripe_gateway.set_gateway(self.gateway)
+        self.addCleanup(stripe_gateway.set_gateway, None)
+        catalog._local.clear()
+        cache.clear()
+
+
+def invoice_event(event_id, event_type, created, subscription_id="sub_1"):
+    return {"id": event_id, "type": event_type, "created": created, "data": {"object": {"id": f"in_{event_id}", "subscription": subscription_id}}}
+
+
+class WebhookQueueTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username="hooks", email="hooks@example.com", password="pw-12345678")
+        self.subscription = Subscription.objects.create(user=user, stripe_customer_id="cus_1", stripe_subscription_id="sub_1",
+                                                        plan="pro", is_active=True, status="active")
+
+    def test_redelivery_is_ignored(self):
+        webhooks.enqueue(invoice_event("evt_1", "invoice.payment_failed", 1000))
+        webhooks.enqueue(invoice_event("evt_1", "invoice.payment_failed", 1000))
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+
+    def test_events_apply_in_created_order(self):
+        # delivered out of order: the failure happened after the payment went through
+        webhooks.enqueue(invoice_event("evt_2", "invoice.payment_failed", 2000))
+        webhooks.enqueue(invoice_event("evt_1", "invoice.payment_succeeded", 1000))
+        self.assertEqual(webhooks.process_batch(), 2)
+        self.subscription.refresh_from_db()
+        self.assertEqual((self.subscription.is_active, self.subscription.status), (False, "past_due"))
+
+    def test_stale_event_is_skipped(self):
+        webhooks.enqueue(invoice_event("evt_2", "invoice.payment_failed", 2000))
+        webhooks.process_batch()
+        # an older event redelivered late must not undo the newer one
+        webhooks.enqueue(invoice_event("evt_1", "invoice.payment_succeeded", 1000))
+        webhooks.process_batch()
+        self.subscription.refresh_from_db()
+        self.assertEqual((self.subscription.is_active, self.subscription.status), (False, "past_due"))
+        self.assertEqual(WebhookEvent.objects.get(stripe_event_id="evt_1").status, WebhookEvent.PROCESSED)
+
+    def test_held_back_behind_an_older_pending_event(self):
+        webhooks.enqueue(invoice_event("evt_1", "invoice.payment_succeeded", 1000))
+        webhooks.enqueue(invoice_event("evt_2", "invoice.payment_failed", 2000))
+        # the older event is waiting out a retry backoff, so it isn't claimed, and the newer one has to wait for it
+        WebhookEvent.objects.filter(stripe_event_id="evt_1").update(available_at=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(webhooks.process_batch(), 0)
+        self.assertEqual(WebhookEvent.objects.get(stripe_event_id="evt_2").status, WebhookEvent.PENDING)
+
+        WebhookEvent.objects.filter(stripe_event_id="evt_1").update(available_at=timezone.now())
+        self.assertEqual(webhooks.process_batch(), 2)
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.status, "past_due")
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+class WebhookEndpointTests(TestCase):
+    def post(self, event, secret="whsec_test"):
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+        return self.client.post("/api/auth/webhooks/stripe/", payload, content_type="application/json",
+                                headers={"Stripe-Signature": f"t={timestamp},v1={signature}"})
+
+    def test_verified_event_is_queued_not_applied(self):
+        response = self.post(invoice_event("evt_1", "invoice.payment_failed", 1000))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.PENDING)
+
+    def test_bad_signature_is_rejected(self):
+        self.assertEqual(self.post(invoice_event("evt_1", "invoice.payment_failed", 1000), secret="whsec_other").status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_failures_back_off_then_give_up(self):
+        webhooks.enqueue({"id": "evt_1", "type": "invoice.payment_failed", "created": 1000, "data": {"object": {"id": "in_1"}}})
+        webhook_event = WebhookEvent.objects.get()
+        for attempt in range(1, webhooks.MAX_ATTEMPTS + 1):
+            WebhookEvent.objects.filter(pk=webhook_event.pk).update(available_at=timezone.now()) # skip the wait
+            self.assertEqual(webhooks.process_batch(), 1)
+            webhook_event.refresh_from_db()
+            self.assertEqual(webhook_event.attempts, attempt)
+            self.assertIn("KeyError", webhook_event.last_error) # no "subscription" in the invoice
+        self.assertEqual(webhook_event.status, WebhookEvent.FAILED)
+        self.assertGreater(webhook_event.available_at, timezone.now())
+
+class CatalogCacheTests(FakeStripeMixin, TestCase):
+    def test_price_is_fetched_once(self):
+        price_id = settings.STRIPE_PRICE_IDS["pro"]
+        first = catalog.get_price(price_id)
+        self.assertEqual(catalog.get_price(price_id), first)
+        self.assertEqual((first["unit_amount"], first["interval"]), (1900, "month"))
+        self.assertEqual(self.stripe.state.request_count, 1)
+
+        catalog._local.clear() # another process: served from the shared cache
+        catalog.get_price(price_id)
+        self.assertEqual(self.stripe.state.request_count, 1)
+
+    def test_webhook_event_drops_the_entry(self):
+        product_id = f"prod_{settings.STRIPE_PRICE_IDS['pro']}"
+        self.assertEqual(catalog.get_product(product_id)["name"], "Pro")
+        self.stripe.state.products[product_id]["name"] = "Pro (2025)"
+        self.assertTrue(catalog.handle_event({"type": "product.updated", "data": {"object": {"id": product_id}}}))
+        self.assertEqual(catalog.get_product(product_id)["name"], "Pro (2025)")
+        self.assertEqual(self.stripe.state.request_count, 2)
+
+
+class SubscriptionMirrorTests(FakeStripeMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user(username="mirror", email="mirror@example.com", password="pw-12345678",
+                                                         stripe_customer_id="cus_mirror")
+        state = self.stripe.state
+        self.stripe_sub = state.render_subscription(state.create_subscription("cus_mirror", settings.STRIPE_PRICE_IDS["pro"]))
+
+    def test_apply_subscription_mirrors_stripe(self):
+        subscription = sync.apply_subscription(self.stripe_sub)
+        self.assertEqual(subscription.user, self.user)
+        self.assertEqual((subscription.plan, subscription.status, subscription.is_active), ("pro", "active", True))
+        self.assertEqual((subscription.amount, subscription.currency, subscription.product_name), (1900, "usd", "Pro"))
+
+        self.stripe_sub["status"] = "canceled"
+        sync.apply_subscription(self.stripe_sub)
+        subscription.refresh_from_db()
+        self.assertFalse(subscription.is_active)
+        self.assertIsNotNone(subscription.canceled_at)
+        self.assertEqual(Subscription.objects.count(), 1)
+
+    def test_unknown_customer_is_skipped(self):
+        self.stripe_sub["customer"] = "cus_somebody_else"
+        self.assertIsNone(sync.apply_subscription(self.stripe_sub))
+
+    def test_reads_do_not_call_stripe(self):
+        sync.apply_subscription(self.stripe_sub)
+        requests = self.stripe.state.request_count
+        token = AccessToken.for_user(self.user)
+        for path in ("/api/auth/subscriptions/", "/api/auth/subscription/"):
+            response = self.client.get(path, headers={"Authorization": f"Bearer {token}"})
+            self.assertEqual(response.status_code, 200, path)
+        self.assertEqual(self.stripe.state.request_count, requests)
+        self.assertEqual(response.json()["plan"], "Pro")
+
+
+class CustomerResolutionTests(FakeStripeMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user(username="payer", email="payer@example.com", password="pw-12345678")
+
+    def test_customer_is_created_once_and_stored(self):
+        customer_id = customers.ensure_stripe_customer(self.user)
+        self.assertEqual(list(self.stripe.state.customers), [customer_id])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.stripe_customer_id, customer_id)
+
+        requests = self.stripe.state.request_count
+        self.assertEqual(customers.ensure_stripe_customer(self.user), customer_id)
+        self.assertEqual(self.stripe.state.request_count, requests)
+
+    def test_checkout_reuses_the_stored_customer(self):
+        token = AccessToken.for_user(self.user)
+        for _ in range(2):
+            response = self.client.post("/api/auth/subscribe/", {"plan": "pro"}, content_type="application/json",
+                                        headers={"Authorization": f"Bearer {token}"})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.json()["checkout_url"])
+        # one Customer.create + two checkout sessions, never a Customer.list by email
+        self.assertEqual(len(self.stripe.state.customers), 1)
+        self.assertEqual(self.stripe.state.request_count, 3)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_half_opens_and_closes(self):
+        breaker = stripe_gateway.CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+
+        breaker._opened_at -= 30 # reset_timeout has passed
+        self.assertEqual(breaker.state, "half-open")
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow()) # only one trial call at a time
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+
+    def test_failed_trial_reopens(self):
+        breaker = stripe_gateway.CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        breaker._opened_at -= 30
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+
+
+class StripeGatewayTests(FakeStripeMixin, SimpleTestCase):
+    gateway_options = {"max_retries": 2, "failure_threshold": 3}
+
+    def test_reads_are_retried(self):
+        self.stripe.failure_rate = 1.0
+        with self.assertRaises(stripe.error.APIError):
+            stripe_gateway.call("Price.retrieve", settings.STRIPE_PRICE_IDS["pro"])
+        self.assertEqual(self.gateway.snapshot()["Price.retrieve"]["count"], 3)
+        self.assertEqual(self.gateway.snapshot()["Price.retrieve"]["retries"], 2)
+
+    def test_writes_without_idempotency_key_are_not_retried(self):
+        self.stripe.failure_rate = 1.0
+        with self.assertRaises(stripe.error.APIError):
+            stripe_gateway.call("Customer.create", email="once@example.com")
+        self.assertEqual(self.gateway.snapshot()["Customer.create"]["count"], 1)
+
+    def test_breaker_fails_fast_then_recovers(self):
+        self.stripe.failure_rate = 1.0
+        with self.assertRaises(stripe.error.APIError):
+            stripe_gateway.call("Price.retrieve", settings.STRIPE_PRICE_IDS["pro"]) # three failed attempts
+        self.assertEqual(self.gateway.breaker.state, "open")
+
+        self.stripe.failure_rate = 0.0
+        with self.assertRaises(stripe_gateway.CircuitOpenError):
+            stripe_gateway.call("Price.retrieve", settings.STRIPE_PRICE_IDS["pro"])
+
+        self.gateway.breaker._opened_at -= self.gateway.breaker.reset_timeout
+        price = stripe_gateway.call("Price.retrieve", settings.STRIPE_PRICE_IDS["pro"])
+        self.assertEqual(price.unit_amount, 1900)
+        self.assertEqual(self.gateway.breaker.state, "closed")
+
+    def test_client_errors_do_not_trip_the_breaker(self):
+        for _ in range(5):
+            with self.assertRaises(stripe.error.InvalidRequestError):
+                stripe_gateway.call("Price.retrieve", "price_missing")
+        self.assertEqual(self.gateway.breaker.state, "closed")
+
+
+class AsyncSubscriptionViewTests(FakeStripeMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user(username="async", email="async@example.com", password="pw-12345678",
+                                                         stripe_customer_id="cus_async")
+        self.factory = AsyncRequestFactory()
+        self.headers = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def post(self, view, data):
+        return view(self.factory.post("/", json.dumps(data), content_type="application/json", headers=self.headers))
+
+    async def test_requires_authentication(self):
+        response = await async_views.list_subscriptions(self.factory.get("/"))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_checkout_uses_the_stored_customer(self):
+        response = await self.post(async_views.create_subscription, {"plan": "pro"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(json.loads(response.content)["checkout_url"])
+        self.assertEqual(self.stripe.state.customers, {}) # cus_async was reused
+
+    async def test_upgrade_updates_the_mirror(self):
+        stripe_sub = self.stripe.state.create_subscription("cus_async", settings.STRIPE_PRICE_IDS["pro"])
+        subscription = await Subscription.objects.acreate(user=self.user, stripe_customer_id="cus_async", stripe_subscription_id=stripe_sub["id"],
+                                                          plan="pro", is_active=True, status="active")
+        response = await self.post(async_views.upgrade_subscription, {"price_id": settings.STRIPE_PRICE_IDS["enterprise"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["plan"], "Enterprise")
+        await subscription.arefresh_from_db()
+        self.assertEqual((subscription.plan, subscription.product_name), ("enterprise", "Enterprise"))
+
+        response = await async_views.list_subscriptions(self.factory.get("/", headers=self.headers))
+        self.assertEqual([sub["plan"] for sub in json.loads(response.content)["subscriptions"]], ["Enterprise"])
+
+
+class ReconcileTests(FakeStripeMixin, TestCase):
+    gateway_options = {"max_retries": 0}
+
+    def setUp(self):
+        super().setUp()
+        state = self.stripe.state
+        self.user = get_user_model().objects.create_user(username="drift", email="drift@example.com", password="pw-12345678",
+                                                         stripe_customer_id="cus_drift")
+        canceled = state.create_subscription("cus_drift", settings.STRIPE_PRICE_IDS["pro"], status="canceled")
+        self.mirror = Subscription.objects.create(user=self.user, stripe_customer_id="cus_drift", stripe_subscription_id=canceled["id"],
+                                                  plan="pro", is_active=True, status="active") # missed the cancellation
+        self.missing = state.create_subscription("cus_drift", settings.STRIPE_PRICE_IDS["enterprise"])
+        state.create_subscription("cus_stranger", settings.STRIPE_PRICE_IDS["pro"])
+        now = int(time.time())
+        self.since, self.until = now - 60, now + 60
+
+    def reconciler(self, **options):
+        return reconcile.Reconciler(reconcile.new_state(self.since, self.until, 2), rate=1000, page_size=1, **options)
+
+    def test_mirror_is_brought_in_line(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, "reconcile.json")
+            reconciler = self.reconciler(checkpoint_path=checkpoint)
+            stats = reconciler.run()
+            self.assertTrue(reconciler.complete)
+            self.assertTrue(all(time_slice["done"] for time_slice in reconcile.load_checkpoint(checkpoint)["slices"]))
+        self.assertEqual((stats["seen"], stats["updated"], stats["created"], stats["unknown_customer"]), (3, 1, 1, 1))
+
+        self.mirror.refresh_from_db()
+        self.assertEqual((self.mirror.is_active, self.mirror.status), (False, "canceled"))
+        created = Subscription.objects.get(stripe_subscription_id=self.missing["id"])
+        self.assertEqual((created.user, created.plan, created.is_active), (self.user, "enterprise", True))
+
+        self.assertEqual(self.reconciler().run()["unchanged"], 2) # nothing left to do on a second pass
+
+    def test_dry_run_writes_nothing(self):
+        stats = self.reconciler(dry_run=True).run()
+        self.assertEqual((stats["updated"], stats["created"]), (1, 1))
+        self.mirror.refresh_from_db()
+        self.assertTrue(self.mirror.is_active)
+        self.assertFalse(Subscription.objects.filter(stripe_subscription_id=self.missing["id"]).exists())
+
+    def test_fetch_errors_leave_the_slices_resumable(self):
+        self.stripe.failure_rate = 1.0
+        reconciler = self.reconciler()
+        reconciler.run()
+        self.assertEqual(len(reconciler.errors), 2)
+        self.assertFalse(reconciler.complete)
+        self.assertTrue(all(time_slice["starting_after"] is None for time_slice in reconciler.state["slices"]))
@@ -1,9 +1,24 @@
+from django.conf import settings
 from django.urls import path
-from .views import CreateSubscriptionView, ListUserSubscriptionsView, CancelSubscriptionView, UpgradeSubscriptionView
+from .views import CreateSubscriptionView, GetSubscriptionView, ListUserSubscriptionsView, CancelSubscriptionView, UpgradeSubscriptionView, stripe_webhook
+from . import async_views
+
+if settings.ASYNC_SUBSCRIPTION_VIEWS:  # ASGI deployments: don't tie up a thread while waiting on Stripe
+    subscribe_view = async_views.create_subscription
+    list_view = async_views.list_subscriptions
+    cancel_view = async_views.cancel_subscription
+    upgrade_view = async_views.upgrade_subscription
+else:
+    subscribe_view = CreateSubscriptionView.as_view()
+    list_view = ListUserSubscriptionsView.as_view()
+    cancel_view = CancelSubscriptionView.as_view()
+    upgrade_view = UpgradeSubscriptionView.as_view()
 
 urlpatterns = [
-    path("subscribe/", CreateSubscriptionView.as_view(), name="subscribe"),
-    path("subscriptions/", ListUserSubscriptionsView.as_view(), name="list-subscriptions"),
-    path("cancel/", CancelSubscriptionView.as_view(), name="cancel-subscription"),
-    path("upgrade/", UpgradeSubscriptionView.as_view(), name="upgrade-subscription"),
+    path("subscribe/", subscribe_view, name="subscribe"),
+    path("subscription/", GetSubscriptionView.as_view(), name="get-subscription"),
+    path("subscriptions/", list_view, name="list-subscriptions"),
+    path("cancel/", cancel_view, name="cancel-subscription"),
+    path("upgrade/", upgrade_view, name="upgrade-subscription"),
+    path("webhooks/stripe/", stripe_webhook, name="stripe-webhook"),
 ]
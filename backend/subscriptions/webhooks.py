@@ -0,0 +1,119 @@
+"""
+Durable Stripe webhook queue.
+
+The webhook endpoint only verifies the signature and stores the event (enqueue()); the process_webhooks
+command drains the queue with process_batch(). Several workers can run at once: rows are claimed with
+SELECT ... FOR UPDATE SKIP LOCKED, and an event is held back while an older event for the same object
+is still pending, so each subscription sees its events in order.
+"""
+import logging
+import traceback
+from datetime import datetime, timedelta, timezone
+
+from django.db import transaction
+from django.utils import timezone as django_timezone
+
+from dashboard import live
+from subscriptions import catalog, sync
+from subscriptions.models import WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 30 # seconds, doubled after every failed attempt
+
+
+def ordering_key(event):
+    """ The object whose state the event changes; events sharing a key are applied in `created` order """
+    obj = event["data"]["object"]
+    if event["type"].startswith("invoice."):
+        return obj.get("subscription") or obj.get("id") or ""
+    return obj.get("id") or ""
+
+
+def enqueue(event):
+    """ Stores a verified event. Redelivered events are ignored thanks to the unique stripe_event_id. """
+    WebhookEvent.objects.bulk_create([
+        WebhookEvent(
+            stripe_event_id=event["id"],
+            type=event["type"],
+            object_id=ordering_key(event),
+            payload=event,
+            stripe_created=datetime.fromtimestamp(event["created"], tz=timezone.utc),
+        )
+    ], ignore_conflicts=True)
+
+
+def is_stale(webhook_event):
+    """ True if a newer event for the same object has already been applied (late redelivery) """
+    return WebhookEvent.objects.filter(
+        object_id=webhook_event.object_id,
+        status=WebhookEvent.PROCESSED,
+        stripe_created__gt=webhook_event.stripe_created,
+    ).exists()
+
+
+def apply_event(event):
+    event_type = event["type"]
+    obj = event["data"]["object"]
+
+    if event_type.startswith(("price.", "product.")):
+        catalog.handle_event(event)  # Drop cached plan metadata so the next lookup refetches it
+
+    elif event_type == "invoice.payment_succeeded":
+        sync.set_active(obj["subscription"], True, "active")
+        live.stripe_subscription_changed(obj["subscription"])
+
+    elif event_type == "invoice.payment_failed":
+        sync.set_active(obj["subscription"], False, "past_due")
+        live.stripe_subscription_changed(obj["subscription"])
+
+    elif event_type in ("customer.subscription.created", "customer.subscription.updated", "customer.subscription.deleted"):
+        # Mirror status, price, period end etc. locally (deleted events arrive with status "canceled")
+        subscription = sync.apply_subscription(obj)
+        if subscription is not None:
+            live.subscription_changed(subscription.user_id) # open dashboards get it once the event commits
+
+
+def process_batch(batch_size=100):
+    """ Claims and applies up to `batch_size` pending events. Returns the number of events handled. """
+    with transaction.atomic():
+        claimed = list(
+            WebhookEvent.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=WebhookEvent.PENDING, available_at__lte=django_timezone.now())
+            .order_by("stripe_created", "id")[:batch_size]
+        )
+        claimed_ids = {webhook_event.id for webhook_event in claimed}
+
+        handled = 0
+        for webhook_event in claimed:
+            blocked = webhook_event.object_id and (
+                WebhookEvent.objects
+                .filter(object_id=webhook_event.object_id, status=WebhookEvent.PENDING)
+                .filter(stripe_created__lt=webhook_event.stripe_created)
+                .exclude(id__in=claimed_ids)
+                .exists()
+            )
+            if blocked:
+                continue # an older event for this object is held by another worker; retry next round
+
+            try:
+                with transaction.atomic():
+                    if not is_stale(webhook_event):
+                        apply_event(webhook_event.payload)
+                webhook_event.status = WebhookEvent.PROCESSED
+                webhook_event.processed_at = django_timezone.now()
+            except Exception:
+                logger.exception("Failed to apply Stripe event %s", webhook_event.stripe_event_id)
+                webhook_event.last_error = traceback.format_exc()
+                webhook_event.available_at = django_timezone.now() + timedelta(
+                    seconds=RETRY_BACKOFF * 2 ** webhook_event.attempts
+                )
+                if webhook_event.attempts + 1 >= MAX_ATTEMPTS:
+                    webhook_event.status = WebhookEvent.FAILED
+            webhook_event.attempts += 1
+            webhook_event.save(update_fields=["status", "processed_at", "attempts", "last_error", "available_at"])
+            handled += 1
+
+    return handled